@@ -2,14 +2,13 @@ import streamlit as st
 import re
 import time
 import logging
-import requests
-import os
+import pandas as pd
+from typing import Dict, Any, List, Optional
 
-from src.config import AVALAI_API_KEY
-from src.crawler import DigikalaCrawler
-from src.analyzer import CommentAnalyzer
-from src.db_manager import DatabaseManager
+from src.config import APP_JOB_WORKERS
 from src.analytics import ProductAnalytics
+from src.jobs import JobManager, Job
+from src.metrics import breakdown
 
 # UI Configuration & Styling
 st.set_page_config(page_title="Digikala AI Sentiment Analyzer", layout="wide", page_icon="🛍️")
@@ -70,15 +69,86 @@ def extract_product_id(url: str) -> int:
     match = re.search(r'dkp-(\d+)', url)
     return int(match.group(1)) if match else None
 
-def fetch_product_title(product_id: int) -> str:
-    try:
-        url = f"https://api.digikala.com/v1/product/{product_id}/"
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            return response.json().get("data", {}).get("product", {}).get("title_fa", "Unknown Product")
-    except:
-        pass
-    return f"Product #{product_id}"
+# Shared resources: one job queue, LLM budget and DB connection for every session of this server
+@st.cache_resource
+def get_job_manager() -> JobManager:
+    return JobManager(workers=APP_JOB_WORKERS, metrics_path="outputs/metrics.prom")
+
+@st.cache_resource
+def get_analytics() -> ProductAnalytics:
+    return ProductAnalytics()
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def get_product_title(product_id: int) -> str:
+    return get_job_manager().runner.crawler.fetch_product_title(product_id)
+
+def render_terminal(placeholder, lines: List[str]):
+    # Keep only the last 20 lines to prevent extreme scrolling
+    html_content = f"<div class='terminal-box'>{'<br>'.join(f'> {line}' for line in lines[-20:])}</div>"
+    placeholder.markdown(html_content, unsafe_allow_html=True)
+
+def render_results(product_id: int, product_title: str, summary: Dict[str, Any],
+                   run_metrics: Optional[Dict[str, Any]] = None):
+    analytics = get_analytics()
+    # Metrics and chart come from the aggregated stats; an unchanged chart is served from its cache
+    chart_bytes = analytics.generate_report_and_charts(product_id, summary)
+
+    st.success(f"**Product:** {product_title}")
+
+    # Metrics
+    m1, m2, m3 = st.columns(3)
+    m1.metric("📊 NPS Score", f"{summary['nps']}",
+              help=f"95% confidence interval: {summary['nps_low']} to {summary['nps_high']}")
+    m2.metric("📝 Analyzed Reviews", summary["total"])
+    m3.metric("😊 Satisfied Users", summary["satisfied"])
+
+    # Chart (served from memory, no disk round trip)
+    if chart_bytes:
+        st.image(chart_bytes, use_container_width=True)
+
+        st.download_button(
+            label="📥 Download Analytics Chart",
+            data=chart_bytes,
+            file_name=f"Analytics_Report_{product_id}.{analytics.image_format}",
+            mime=ProductAnalytics.SUPPORTED_FORMATS[analytics.image_format],
+            use_container_width=True
+        )
+
+    render_trend(product_id)
+
+    # Where the time went (spans and counters recorded during the job)
+    if run_metrics:
+        with st.expander("⏱️ Performance Breakdown"):
+            counters = run_metrics["counters"]
+            c1, c2, c3, c4 = st.columns(4)
+            c1.metric("API Calls", f"{counters.get('llm_api_calls', 0):g}")
+            c2.metric("Tokens", f"{counters.get('llm_prompt_tokens', 0) + counters.get('llm_completion_tokens', 0):g}")
+            c3.metric("Retries", f"{counters.get('llm_retries', 0):g}")
+            c4.metric("Cache Hits", f"{counters.get('llm_cache_hits{tier=memory}', 0) + counters.get('llm_cache_hits{tier=disk}', 0):g}")
+            st.table([
+                {"Stage": row["span"], "Calls": row["count"], "Total (ms)": row["total_ms"],
+                 "p50 (ms)": row["p50_ms"], "p95 (ms)": row["p95_ms"]}
+                for row in breakdown(run_metrics)
+            ])
+
+TREND_WINDOWS = {"Weekly": "weekly", "Daily": "daily", "30-day rolling": "rolling"}
+
+def render_trend(product_id: int):
+    """NPS and promoter/passive/detractor counts over time, read from the daily rollup."""
+    st.markdown("#### 📈 NPS Trend")
+    label = st.radio("Window", list(TREND_WINDOWS), horizontal=True, key=f"trend_window_{product_id}",
+                     label_visibility="collapsed")
+    trend = get_job_manager().db.get_nps_trend(product_id, TREND_WINDOWS[label])
+    if len(trend) < 2:
+        st.caption("Not enough history yet: the trend appears once reviews span more than one period.")
+        return
+
+    frame = pd.DataFrame(trend).set_index(pd.to_datetime([point["period_end"] for point in trend]))
+    st.line_chart(frame[["nps"]].rename(columns={"nps": "NPS"}), height=220)
+    st.bar_chart(
+        frame[["promoters", "passives", "detractors"]].rename(columns=str.title),
+        color=["#2e7d32", "#fbc02d", "#e53935"], height=180,
+    )
 
 # Main Application
 def main():
@@ -86,6 +156,11 @@ def main():
     st.markdown("Automated pipeline for extracting reviews, AI sentiment analysis, and NPS calculation.")
     st.divider()
 
+    manager = get_job_manager()
+    db = manager.db
+    # The pipeline runs on the manager's workers; this session only remembers which job it follows
+    job: Optional[Job] = manager.get(st.session_state.get("job_id"))
+
     # Create Two Columns: Left (40% width) and Right (60% width)
     col_left, col_right = st.columns([4, 6], gap="large")
 
@@ -93,120 +168,77 @@ def main():
     with col_left:
         st.subheader("⚙️ Control Panel")
         product_url = st.text_input("🔗 Digikala Product Link:", placeholder="https://www.digikala.com/product/dkp-123456/...")
+
+        # A run interrupted earlier (crash, refresh) can be finished with its checkpointed sample
+        resume_run_id = None
+        url_product_id = extract_product_id(product_url) if product_url else None
+        if url_product_id and not (job and job.product_id == url_product_id and not job.finished):
+            unfinished_run_id = db.find_resumable_run(url_product_id)
+            if unfinished_run_id:
+                run = db.get_run(unfinished_run_id)
+                remaining = run["items"]["pending"] + run["items"]["failed"]
+                if st.checkbox(f"⏯️ Resume unfinished run ({remaining} of {run['sampled']} comments left)", value=True):
+                    resume_run_id = unfinished_run_id
+
         start_btn = st.button("🚀 Start Processing & Analysis")
-        
+
         # Placeholders for progress bar and terminal
         progress_bar_placeholder = st.empty()
         terminal_placeholder = st.empty()
-        
-        # Render empty terminal initially
-        terminal_placeholder.markdown("<div class='terminal-box'>Waiting for system initiation...</div>", unsafe_allow_html=True)
 
     # ---------------- RIGHT COLUMN: OUTPUTS ----------------
     with col_right:
         st.subheader("📊 Analytics Dashboard")
         output_placeholder = st.empty()
-        output_placeholder.info("👈 Enter a URL and click Start to view results here.")
 
     # ---------------- EXECUTION LOGIC ----------------
     if start_btn:
         if not product_url:
             with col_left:
                 st.warning("⚠️ Please enter a product link.")
-            return
-
-        product_id = extract_product_id(product_url)
-        if not product_id:
+        elif not url_product_id:
             with col_left:
                 st.error("❌ Invalid URL. Missing 'dkp-' identifier.")
-            return
-
-        # Initialize tracking variables
-        terminal_logs = []
-        def update_terminal(msg):
-            logging.info(msg)
-            terminal_logs.append(f"> {msg}")
-            # Keep only the last 20 lines to prevent extreme scrolling
-            display_logs = terminal_logs[-20:]
-            html_content = f"<div class='terminal-box'>{'<br>'.join(display_logs)}</div>"
-            terminal_placeholder.markdown(html_content, unsafe_allow_html=True)
-
-        # Clear right column placeholder
-        output_placeholder.empty()
-
-        try:
-            crawler = DigikalaCrawler()
-            analyzer = CommentAnalyzer()
-            db = DatabaseManager()
-            analytics = ProductAnalytics()
-
-            # Step 1: Info
-            update_terminal(f"Extracting metadata for Product ID: {product_id}")
-            product_title = fetch_product_title(product_id)
-            update_terminal(f"Product Name: {product_title}")
-            
-            # Step 2: Crawling
-            update_terminal("Connecting to Digikala API...")
-            sampled_comments = crawler.fetch_comments(product_id)
-            total_comments = len(sampled_comments)
-            
-            if total_comments == 0:
-                update_terminal("⚠️ ERROR: No reviews found.")
-                return
-
-            update_terminal(f"Sampled {total_comments} reviews. Starting AI pipeline...")
-            
-            # Step 3: AI Processing Loop
-            progress_bar = progress_bar_placeholder.progress(0)
-            
-            for index, comment in enumerate(sampled_comments):
-                progress_percent = int(((index + 1) / total_comments) * 100)
-                progress_bar.progress(progress_percent)
-                update_terminal(f"Analyzing review [{index + 1}/{total_comments}] via LLM...")
-                
-                try:
-                    ai_extracted_data = analyzer.analyze_comment(comment)
-                    db.insert_review(product_id, comment, ai_extracted_data)
-                    time.sleep(0.3)
-                except Exception as e:
-                    update_terminal(f"❌ Error on review {index+1}: {str(e)[:50]}")
-                    continue
-
-            # Step 4: Analytics
-            update_terminal("AI Processing complete. Generating charts...")
-            saved_reviews = db.get_product_reviews(product_id)
-            analytics.generate_report_and_charts(product_id, saved_reviews)
-            nps_score = analytics.calculate_nps(saved_reviews)
-            satisfaction_ratio = sum(1 for r in saved_reviews if r['is_satisfied'])
-            
-            update_terminal("✅ Pipeline execution finished successfully!")
-
-            # ---------------- DISPLAY RESULTS IN RIGHT COLUMN ----------------
-            with col_right:
-                st.success(f"**Product:** {product_title}")
-                
-                # Metrics
-                m1, m2, m3 = st.columns(3)
-                m1.metric("📊 NPS Score", f"{nps_score}")
-                m2.metric("📝 Analyzed Reviews", total_comments)
-                m3.metric("😊 Satisfied Users", satisfaction_ratio)
-
-                # Chart
-                chart_path = f"outputs/analytics_product_{product_id}.png"
-                if os.path.exists(chart_path):
-                    st.image(chart_path, use_container_width=True)
-                    
-                    with open(chart_path, "rb") as file:
-                        st.download_button(
-                            label="📥 Download Analytics Chart",
-                            data=file,
-                            file_name=f"Analytics_Report_{product_id}.png",
-                            mime="image/png",
-                            use_container_width=True
-                        )
-
-        except Exception as e:
-            update_terminal(f"❌ SYSTEM CRASH: {e}")
+        else:
+            # Returns at once; a product already being analyzed for another user is joined, not re-run
+            job = manager.submit(url_product_id, resume_run_id=resume_run_id)
+            st.session_state["job_id"] = job.job_id
+
+    if job:
+        render_terminal(terminal_placeholder, job.tail())
+        if job.status == "running":
+            progress_bar_placeholder.progress(int(job.progress * 100))
+    else:
+        terminal_placeholder.markdown("<div class='terminal-box'>Waiting for system initiation...</div>", unsafe_allow_html=True)
+
+    # ---------------- DISPLAY RESULTS IN RIGHT COLUMN ----------------
+    shown_product_id = url_product_id or (job.product_id if job else None)
+    with output_placeholder.container():
+        if job and job.product_id == shown_product_id and not job.finished:
+            active = len(manager.active_jobs())
+            st.info(f"⏳ Job {job.status} ({job.done}/{job.total or '?'} reviews analyzed, {active} active job(s) on the server).")
+        elif job and job.product_id == shown_product_id and job.status == "failed":
+            st.error(f"❌ Job failed: {job.error}")
+        elif shown_product_id:
+            # Finished job or a product analyzed earlier: served straight from the database
+            summary = db.get_product_summary(shown_product_id)
+            if summary["total"]:
+                fresh = job is not None and job.product_id == shown_product_id
+                if not fresh:
+                    st.caption("Stored analysis from the database. Click Start to analyze new reviews.")
+                title = job.title if fresh and job.title else get_product_title(shown_product_id)
+                render_results(shown_product_id, title, summary, job.metrics if fresh else None)
+            elif job and job.product_id == shown_product_id:
+                st.warning("⚠️ ERROR: No reviews found.")
+            else:
+                st.info("👈 Click Start to analyze this product.")
+        else:
+            st.info("👈 Enter a URL and click Start to view results here.")
+
+    # Poll the background job: rerun the script until it has finished
+    if job and not job.finished:
+        time.sleep(1)
+        st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1 @@
+"""Offline benchmarks against local stand-ins for the Digikala API and the LLM endpoint (see run.py)."""
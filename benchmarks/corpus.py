@@ -0,0 +1,67 @@
+import random
+from typing import List, Dict, Any
+
+# Building blocks of synthetic Digikala reviews (positive, negative and mixed opinions)
+SUBJECTS = ["گوشی", "این محصول", "کالا", "هدفون", "لپ‌تاپ", "یخچال", "کفش", "ساعت هوشمند", "جاروبرقی", "کتاب"]
+ASPECTS = ["کیفیت ساخت", "باتری", "قیمت", "ارسال", "بسته‌بندی", "صدا", "دوربین", "جنس", "سرعت", "طراحی"]
+POSITIVE = ["عالیه", "خیلی خوبه", "فوق‌العاده است", "ارزش خرید داره", "بی‌نظیره", "راضی هستم", "محشره"]
+NEGATIVE = ["افتضاحه", "خیلی ضعیفه", "اصلا ارزش نداره", "خراب شد", "بی‌کیفیته", "پشیمونم", "داغون بود"]
+CLOSINGS = ["پیشنهاد می‌کنم", "نخرید", "ممنون از دیجیکالا", "دیگه نمی‌خرم", "به دوستام هم معرفی کردم", ""]
+CONNECTORS = ["ولی", "اما", "و", "همچنین"]
+EMOJIS = ["👍", "👎", "❤️", "😡", "😍", ""]
+
+# Variations that near-duplicate detection and normalization must see through
+_ARABIC_VARIANTS = str.maketrans({"ی": "ي", "ک": "ك"})
+
+
+def _sentence(rng: random.Random) -> str:
+    polarity = rng.random()
+    subject, aspect = rng.choice(SUBJECTS), rng.choice(ASPECTS)
+    if polarity < 0.55:
+        text = f"{aspect} {subject} {rng.choice(POSITIVE)}"
+    elif polarity < 0.85:
+        text = f"{aspect} {subject} {rng.choice(NEGATIVE)}"
+    else:
+        text = f"{aspect} {rng.choice(POSITIVE)} {rng.choice(CONNECTORS)} {rng.choice(ASPECTS)} {rng.choice(NEGATIVE)}"
+    return text
+
+
+def generate_comment(rng: random.Random) -> str:
+    """One synthetic Persian review of 1-6 sentences (short verdicts are the most common)."""
+    length = min(6, 1 + int(rng.expovariate(0.8)))
+    parts = [_sentence(rng) for _ in range(length)]
+    closing = rng.choice(CLOSINGS)
+    if closing:
+        parts.append(closing)
+    return "، ".join(parts) + rng.choice([".", "!", "", "!!"]) + " " + rng.choice(EMOJIS)
+
+
+def _variant(text: str, rng: random.Random) -> str:
+    """A near-duplicate: same words with Arabic letters, no ZWNJ, other punctuation or stretched letters."""
+    choice = rng.randrange(4)
+    if choice == 0:
+        return text.translate(_ARABIC_VARIANTS)
+    if choice == 1:
+        return text.replace("\u200c", "")
+    if choice == 2:
+        return text.rstrip(" .!👍👎❤️😡😍") + "..."
+    return text.replace("عالیه", "عاااالیه").replace("خیلی", "خیییلی")
+
+
+def generate_comments(count: int, seed: int = 0, duplicate_rate: float = 0.15) -> List[str]:
+    """`count` reviews; about `duplicate_rate` of them are near-duplicates of earlier ones."""
+    rng = random.Random(seed)
+    comments: List[str] = []
+    for _ in range(count):
+        if comments and rng.random() < duplicate_rate:
+            comments.append(_variant(rng.choice(comments), rng))
+        else:
+            comments.append(generate_comment(rng))
+    return comments
+
+
+def generate_reviews(product_id: int, count: int, duplicate_rate: float = 0.15) -> List[Dict[str, Any]]:
+    """Digikala-shaped comment objects for a product, newest (highest id) first, reproducible per product."""
+    bodies = generate_comments(count, seed=product_id, duplicate_rate=duplicate_rate)
+    first_id = product_id * 1_000_000 + count
+    return [{"id": first_id - offset, "body": body, "rate": None} for offset, body in enumerate(bodies)]
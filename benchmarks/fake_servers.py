@@ -0,0 +1,224 @@
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Dict, Any, List, Optional, Tuple
+
+from benchmarks.corpus import generate_reviews
+
+
+class FaultProfile:
+    """
+    Latency and failure injection shared by the fake servers. `retry_after` is sent in whole
+    seconds (rounded up): urllib3 rejects fractional Retry-After values.
+    """
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 5.0, error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def delay(self):
+        with self._lock:
+            jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(0.0, self.latency_ms + jitter) / 1000)
+
+    def fault(self) -> Optional[int]:
+        """HTTP status to fail this request with (429 or 500), or None to serve it."""
+        with self._lock:
+            roll = self._rng.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+
+class _FakeServer:
+    """A ThreadingHTTPServer on 127.0.0.1 (random port) running in a daemon thread; use as a context manager."""
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, faults: FaultProfile = None):
+        self.faults = faults or FaultProfile()
+        self.requests = 0
+        self.failures = 0
+        self._counter_lock = threading.Lock()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "_FakeServer":
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class)
+        self._httpd.daemon_threads = True
+        self._httpd.fake = self
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, failed: bool):
+        with self._counter_lock:
+            self.requests += 1
+            self.failures += failed
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def send_json(self, status: int, payload: Dict[str, Any], headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def injected_fault(self) -> bool:
+        """Sleeps for the configured latency, then answers with an injected failure if one is drawn."""
+        faults = self.fake.faults
+        faults.delay()
+        status = faults.fault()
+        self.fake.count(failed=status is not None)
+        if status == 429:
+            self.send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                           {"Retry-After": str(max(0, math.ceil(faults.retry_after)))})
+        elif status is not None:
+            self.send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+        return status is not None
+
+
+class FakeDigikalaServer(_FakeServer):
+    """
+    Serves the two Digikala endpoints the project uses, backed by the synthetic corpus:
+    GET /v1/product/{id}/comments/?page=N and GET /v1/product/{id}/.
+    """
+    def __init__(self, comments_per_product: int = 1000, page_size: int = 10, faults: FaultProfile = None):
+        super().__init__(faults)
+        self.comments_per_product = comments_per_product
+        self.page_size = page_size
+        self._corpora: Dict[int, List[Dict[str, Any]]] = {}
+        self._corpus_lock = threading.Lock()
+
+    def comments(self, product_id: int) -> List[Dict[str, Any]]:
+        with self._corpus_lock:
+            if product_id not in self._corpora:
+                self._corpora[product_id] = generate_reviews(product_id, self.comments_per_product)
+            return self._corpora[product_id]
+
+    class handler_class(_JSONHandler):
+        _COMMENTS_PATH = re.compile(r"^/v1/product/(\d+)/comments/?$")
+        _PRODUCT_PATH = re.compile(r"^/v1/product/(\d+)/?$")
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            comments_match = self._COMMENTS_PATH.match(url.path)
+            product_match = self._PRODUCT_PATH.match(url.path)
+            if not (comments_match or product_match):
+                self.send_json(404, {"status": 404})
+                return
+            if self.injected_fault():
+                return
+
+            if product_match:
+                product_id = int(product_match.group(1))
+                self.send_json(200, {"status": 200, "data": {"product": {"id": product_id, "title_fa": f"محصول آزمایشی {product_id}"}}})
+                return
+
+            fake = self.fake
+            comments = fake.comments(int(comments_match.group(1)))
+            page = max(1, int(parse_qs(url.query).get("page", ["1"])[0]))
+            total_pages = max(1, -(-len(comments) // fake.page_size))
+            start = (page - 1) * fake.page_size
+            self.send_json(200, {"status": 200, "data": {
+                "comments": comments[start:start + fake.page_size],
+                "pager": {"current_page": page, "total_pages": total_pages, "total_items": len(comments)},
+            }})
+
+
+class FakeLLMServer(_FakeServer):
+    """
+    OpenAI-compatible POST /v1/chat/completions that answers the analyzer's single and batched
+    prompts with valid JSON (deterministic per comment) and reports token usage.
+    """
+    @staticmethod
+    def analyze(text: str) -> Dict[str, Any]:
+        digest = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+        score = digest % 10 + 1
+        return {"is_satisfied": score >= 7, "reason": "نتیجه آزمایشی", "estimated_score": score}
+
+    @classmethod
+    def answer(cls, messages: List[Dict[str, str]]) -> Tuple[str, int]:
+        """Returns the JSON reply for a conversation and its prompt size in (rough) tokens."""
+        user = messages[-1]["content"] if messages else ""
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // 2
+        try:
+            payload = json.loads(user)
+        except ValueError:
+            payload = None
+
+        if isinstance(payload, dict) and isinstance(payload.get("comments"), list):
+            results = [dict(cls.analyze(item.get("text", "")), index=item.get("index")) for item in payload["comments"]]
+            return json.dumps({"results": results}, ensure_ascii=False), prompt_tokens
+        return json.dumps(cls.analyze(user), ensure_ascii=False), prompt_tokens
+
+    class handler_class(_JSONHandler):
+        def do_POST(self):
+            if urlparse(self.path).path.rstrip("/") != "/v1/chat/completions":
+                self.send_json(404, {"error": {"message": "Not found"}})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.injected_fault():
+                return
+
+            content, prompt_tokens = FakeLLMServer.answer(request.get("messages", []))
+            completion_tokens = len(content) // 2
+            self.send_json(200, {
+                "id": f"chatcmpl-bench-{time.time_ns()}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            })
@@ -0,0 +1,288 @@
+"""
+Offline benchmark suite: runs the crawler, the analysis engine, the DB writer and the chart
+renderer against local stand-ins (benchmarks/fake_servers.py) and synthetic Persian reviews,
+and prints/writes the results as JSON (p50/p95 latency, throughput, peak RSS per scenario).
+
+    python -m benchmarks.run                                  # all scenarios at 100 and 1k reviews
+    python -m benchmarks.run --sizes 100 1000 100000 --output bench.json
+    python -m benchmarks.run --scenarios analysis --llm-latency-ms 200 --rate-limit-rate 0.05
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Dict, Any, List, Callable
+
+# The suite never talks to the real API; the key only satisfies CommentAnalyzer's configuration check
+os.environ.setdefault("AVALAI_API_KEY", "benchmark")
+
+SCENARIOS = ["crawl", "analysis", "db_insert", "charting", "pipeline"]
+DEFAULT_SIZES = [100, 1000]
+BENCHMARK_PRODUCT_ID = 4242
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile (values in seconds, result in milliseconds)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = min(len(ordered), max(1, math.ceil(fraction * len(ordered))))
+    return round(ordered[rank - 1] * 1000, 3)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (None where the platform does not report it)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 2)
+
+
+def timed(latencies: List[float], function: Callable) -> Callable:
+    """Wraps `function` so that every call's duration is appended to `latencies`."""
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return wrapper
+
+
+def _result(scenario: str, size: int, items: int, elapsed: float, latencies: List[float],
+            extra: Dict[str, Any] = None) -> Dict[str, Any]:
+    result = {
+        "scenario": scenario,
+        "size": size,
+        "items": items,
+        "seconds": round(elapsed, 4),
+        "throughput_per_second": round(items / elapsed, 2) if elapsed else 0.0,
+        "operations": len(latencies),
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    result.update(extra or {})
+    return result
+
+
+def bench_crawl(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from src.crawler import DigikalaCrawler
+
+    crawler = DigikalaCrawler(max_comments=size, api_base_url=options["digikala_url"])
+    latencies: List[float] = []
+    crawler._fetch_page = timed(latencies, crawler._fetch_page)
+
+    started = time.perf_counter()
+    fetched = sum(len(page) for page in crawler.iter_pages(BENCHMARK_PRODUCT_ID))
+    return _result("crawl", size, fetched, time.perf_counter() - started, latencies)
+
+
+def _engine(options: Dict[str, Any], latencies: List[float]):
+    from src.analyzer import CommentAnalyzer
+    from src.engine import AnalysisEngine
+    from src.rate_limiter import TokenBucketRateLimiter
+
+    analyzer = CommentAnalyzer(base_url=options["llm_url"], api_key="benchmark",
+                               use_pre_classifier=options["lexicon"])
+    analyzer._request_json = timed(latencies, analyzer._request_json)
+    # The local server is the only limit: the budget is effectively unlimited
+    limiter = TokenBucketRateLimiter(requests_per_minute=10 ** 7, tokens_per_minute=10 ** 10)
+    engine = AnalysisEngine(analyzer, max_workers=options["workers"], rate_limiter=limiter,
+                            base_backoff=0.05, max_backoff=1.0, batch_mode=options["batch"])
+    return analyzer, engine
+
+
+def bench_analysis(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from benchmarks.corpus import generate_comments
+
+    comments = generate_comments(size, seed=size)
+    latencies: List[float] = []
+    analyzer, engine = _engine(options, latencies)
+
+    started = time.perf_counter()
+    outcomes = engine.analyze_all(comments)
+    elapsed = time.perf_counter() - started
+    return _result("analysis", size, len(outcomes), elapsed, latencies, {
+        "failed": sum(1 for outcome in outcomes if not outcome.ok),
+        "api_calls": analyzer.api_calls,
+        "retries": sum(max(0, outcome.attempts - 1) for outcome in outcomes),
+    })
+
+
+def bench_db_insert(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from benchmarks.corpus import generate_reviews
+    from benchmarks.fake_servers import FakeLLMServer
+    from src.db_manager import DatabaseManager, ReviewWriter
+
+    reviews = generate_reviews(BENCHMARK_PRODUCT_ID, size)
+    db = DatabaseManager(os.path.join(options["workdir"], f"db_insert_{size}.db"))
+    latencies: List[float] = []
+    db.insert_reviews_bulk = timed(latencies, db.insert_reviews_bulk)
+    writer = ReviewWriter(db)
+
+    started = time.perf_counter()
+    for review in reviews:
+        writer.submit(BENCHMARK_PRODUCT_ID, review["body"], FakeLLMServer.analyze(review["body"]), comment_id=review["id"])
+    writer.close()
+    elapsed = time.perf_counter() - started
+
+    summary_latencies: List[float] = []
+    timed(summary_latencies, db.get_product_summary)(BENCHMARK_PRODUCT_ID)
+    db.close()
+    return _result("db_insert", size, writer.written, elapsed, latencies, {
+        "summary_ms": percentile(summary_latencies, 0.5),
+    })
+
+
+def bench_charting(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from benchmarks.corpus import generate_comments
+    from benchmarks.fake_servers import FakeLLMServer
+    from src.analytics import ProductAnalytics
+
+    rows = [FakeLLMServer.analyze(comment) for comment in generate_comments(size, seed=size)]
+    analytics = ProductAnalytics(output_dir=os.path.join(options["workdir"], "charts"))
+    render_latencies: List[float] = []
+    analytics._render = timed(render_latencies, analytics._render)
+    latencies: List[float] = []
+    generate = timed(latencies, analytics.generate_report_and_charts)
+
+    started = time.perf_counter()
+    summary = analytics.summarize_reviews(BENCHMARK_PRODUCT_ID, rows)
+    generate(BENCHMARK_PRODUCT_ID, summary)      # cold: renders
+    for _ in range(options["chart_repeats"]):
+        generate(BENCHMARK_PRODUCT_ID, summary)  # warm: fingerprint cache
+    elapsed = time.perf_counter() - started
+    return _result("charting", size, size, elapsed, latencies, {
+        "render_ms": percentile(render_latencies, 0.5),
+        "renders": len(render_latencies),
+    })
+
+
+def bench_pipeline(size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    from src.crawler import DigikalaCrawler
+    from src.db_manager import DatabaseManager
+    from src.pipeline import StreamingPipeline
+
+    latencies: List[float] = []
+    analyzer, engine = _engine(options, latencies)
+    crawler = DigikalaCrawler(max_comments=size, api_base_url=options["digikala_url"])
+    db = DatabaseManager(os.path.join(options["workdir"], f"pipeline_{size}.db"))
+    # Every crawled comment is analyzed so that the size is comparable with the other scenarios
+    pipeline = StreamingPipeline(crawler, engine, db, sample_size=size, sample_threshold=size, log=lambda message: None)
+
+    started = time.perf_counter()
+    stats = pipeline.run(BENCHMARK_PRODUCT_ID)
+    elapsed = time.perf_counter() - started
+    db.close()
+    return _result("pipeline", size, stats["saved"], elapsed, latencies, {
+        "fetched": stats["fetched"],
+        "duplicates": stats["duplicates"],
+        "failed": stats["failed"],
+        "api_calls": analyzer.api_calls,
+    })
+
+
+BENCHMARKS = {
+    "crawl": bench_crawl,
+    "analysis": bench_analysis,
+    "db_insert": bench_db_insert,
+    "charting": bench_charting,
+    "pipeline": bench_pipeline,
+}
+
+
+def run_scenario(scenario: str, size: int, options: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        return BENCHMARKS[scenario](size, options)
+    except Exception as e:
+        return {"scenario": scenario, "size": size, "error": f"{type(e).__name__}: {e}"}
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline throughput benchmarks with local fake Digikala/LLM servers.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--sizes", nargs="+", type=int, default=DEFAULT_SIZES, help="Review counts (e.g. 100 1000 100000)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--digikala-latency-ms", type=float, default=30.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with HTTP 429")
+    parser.add_argument("--page-size", type=int, default=10, help="Comments per fake Digikala page")
+    parser.add_argument("--workers", type=int, default=8, help="LLM concurrency of the analysis engine")
+    parser.add_argument("--batch", action="store_true", help="Use batched LLM prompts")
+    parser.add_argument("--lexicon", action="store_true", help="Enable the local lexicon pre-classifier")
+    parser.add_argument("--chart-repeats", type=int, default=20, help="Warm (cached) chart requests after the cold render")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run scenarios in this process (peak RSS then accumulates across scenarios)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    from benchmarks.fake_servers import FakeDigikalaServer, FakeLLMServer, FaultProfile
+
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="digikala-bench-")
+    digikala = FakeDigikalaServer(
+        comments_per_product=max(args.sizes), page_size=args.page_size,
+        faults=FaultProfile(args.digikala_latency_ms, args.digikala_latency_ms / 4, args.error_rate, args.rate_limit_rate, seed=1),
+    )
+    llm = FakeLLMServer(
+        faults=FaultProfile(args.llm_latency_ms, args.llm_latency_ms / 4, args.error_rate, args.rate_limit_rate, seed=2),
+    )
+
+    results = []
+    try:
+        with digikala, llm:
+            options = {
+                "digikala_url": digikala.url, "llm_url": llm.url, "workdir": workdir,
+                "workers": args.workers, "batch": args.batch, "lexicon": args.lexicon,
+                "chart_repeats": args.chart_repeats,
+            }
+            for size in args.sizes:
+                for scenario in args.scenarios:
+                    if args.in_process:
+                        result = run_scenario(scenario, size, options)
+                    else:
+                        # A fresh process per scenario keeps peak RSS attributable to that scenario
+                        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                            result = pool.submit(run_scenario, scenario, size, options).result()
+                    print(f"{scenario:>10} @ {size:>7}: " + (
+                        result["error"] if "error" in result else
+                        f"{result['throughput_per_second']}/s, p50 {result['p50_ms']} ms, "
+                        f"p95 {result['p95_ms']} ms, peak RSS {result['peak_rss_mb']} MB"
+                    ), file=sys.stderr)
+                    results.append(result)
+            server_stats = {
+                "digikala": {"requests": digikala.requests, "injected_failures": digikala.failures},
+                "llm": {"requests": llm.requests, "injected_failures": llm.failures},
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "servers": server_stats,
+        "results": results,
+    }
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            file.write(output)
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
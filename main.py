@@ -1,69 +1,158 @@
+import os
 import sys
+import json
 import time
-from src.config import AVALAI_API_KEY
-from src.exceptions import DigikalaAnalyzerBaseException
-from src.crawler import DigikalaCrawler
-from src.analyzer import CommentAnalyzer
-from src.db_manager import DatabaseManager
-from src.analytics import ProductAnalytics
-
-def process_product_pipeline(product_id: int):
+import argparse
+from src.exceptions import DigikalaAnalyzerBaseException, MissingConfigurationError
+from src.batch import BatchRunner, read_product_ids, format_summary
+from src.metrics import METRICS, profiled, breakdown
+
+def process_product_pipeline(product_id: int, runner: BatchRunner = None, resume_run_id: str = None) -> dict:
     """
     Main orchestration pipeline:
-    1. Crawl & Sample
-    2. Analyze via LLM
-    3. Save to DB
+    1. Crawl & Sample (streamed)
+    2. Analyze via LLM (concurrently)
+    3. Save to DB (background writer)
     4. Generate Analytics
+    Returns the product's result; failures are reported, never exit the process.
+    With `resume_run_id` the checkpointed run is finished instead of crawling again.
     """
-    print(f"🚀 Starting Data Pipeline for Product ID: {product_id}\n")
-    
+    if resume_run_id:
+        print(f"🚀 Resuming Data Pipeline run {resume_run_id}\n")
+    else:
+        print(f"🚀 Starting Data Pipeline for Product ID: {product_id}\n")
+    owns_runner = runner is None
+
     try:
         # Initialize components
-        crawler = DigikalaCrawler()
-        analyzer = CommentAnalyzer()
-        db = DatabaseManager()
-        analytics = ProductAnalytics()
-
-        # Step 1: Crawl and Sample Comments
-        print("[1/4] Fetching and sampling comments from Digikala API...")
-        sampled_comments = crawler.fetch_comments(product_id)
-        
-        if not sampled_comments:
-            print("⚠️ No comments found for this product. Exiting.")
-            sys.exit(0)
-
-        # Step 2 & 3: AI Analysis and Database Insertion
-        print("\n[2/4] & [3/4] Processing via LLM and saving to SQLite Database...")
-        total_samples = len(sampled_comments)
-        
-        for index, comment in enumerate(sampled_comments, start=1):
-            print(f"   -> Processing comment {index}/{total_samples}...")
-            try:
-                # Ask AI to analyze
-                ai_extracted_data = analyzer.analyze_comment(comment)
-                
-                # Save to Database
-                db.insert_review(product_id, comment, ai_extracted_data)
-                
-                # Small delay to respect API rate limits
-                time.sleep(0.5) 
-            except Exception as e:
-                print(f"   ❌ Failed to process comment {index}: {e}")
-                continue 
-                
-        # Step 4: Analytics and Chart Generation
-        print("\n[4/4] Generating Analytics and NPS Report...")
-        saved_reviews = db.get_product_reviews(product_id)
-        analytics.generate_report_and_charts(product_id, saved_reviews)
+        runner = runner or BatchRunner(workers=1)
+
+        # Steps 1-3: Crawl, sample, analyze and save as one streaming pipeline
+        print("[1/4] - [3/4] Streaming comments from Digikala API through the LLM into SQLite...")
+
+        def report(done, total, outcome):
+            progress = f"{done}/{total}" if total else f"{done}"
+            if outcome.ok:
+                print(f"   -> [{progress}] Processed comment {outcome.index + 1}")
+            else:
+                print(f"   ❌ [{progress}] Failed to process comment {outcome.index + 1}: {outcome.error}")
+
+        # Step 4 (Analytics and Chart Generation) runs inside process_product once the writes are flushed
+        if resume_run_id:
+            result = runner.resume_run(resume_run_id, on_outcome=report)
+            product_id = result["product_id"]
+        else:
+            result = runner.process_product(product_id, on_outcome=report)
 
+        if result["status"] == "empty":
+            print("⚠️ No comments found for this product.")
+            return result
+        if result["stats"].get("resumed") is not None:
+            print(f"ℹ️ Run {result['stats']['run_id']}: {result['stats']['analyzed']} of {result['stats']['resumed']} remaining comments analyzed.")
+        elif result["stats"]["sampled"] == 0:
+            print("ℹ️ No new comments since the last run. Reported on stored reviews.")
+
+        print("\n[4/4] Generated Analytics and NPS Report...")
+        print(f"   -> NPS: {result['nps']} (95% CI {result['nps_interval'][0]} to {result['nps_interval'][1]}) over {result['total_reviews']} reviews ({runner.analytics.chart_path(product_id)})")
+        if result.get("stop_reason"):
+            print(f"   -> Adaptive sampling stopped on {result['stop_reason']}")
+
+        cache_stats = runner.analyzer.cache.stats()
+        print(f"\n💾 LLM Cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+        if runner.analyzer.pre_classifier is not None:
+            lexicon_stats = runner.analyzer.pre_classifier.stats()
+            print(f"⚡ Lexicon fast path: {lexicon_stats['classified']} scored locally / {lexicon_stats['escalated']} escalated")
         print("\n✅ Pipeline completed successfully!")
+        return result
 
+    except MissingConfigurationError:
+        # Not a product failure: main() reports it and exits non-zero
+        raise
     except DigikalaAnalyzerBaseException as e:
         print(f"\n❌ Pipeline Error: {e}")
     except Exception as e:
         print(f"\n❌ Unexpected System Error: {e}")
+    finally:
+        if owns_runner and runner is not None:
+            runner.close()
+    return {"product_id": product_id, "status": "failed"}
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Crawl, analyze and report on Digikala products.")
+    parser.add_argument("product_ids", nargs="*", type=int, help="Product IDs to process")
+    parser.add_argument("--file", help="Text file with product IDs (one per line or comma separated)")
+    parser.add_argument("--workers", type=int, default=4, help="Products processed in parallel (batch mode)")
+    parser.add_argument("--full", action="store_true", help="Re-crawl from page 1 instead of stopping at known comments")
+    parser.add_argument("--json", action="store_true", help="Print the batch results as JSON")
+    parser.add_argument("--resume", metavar="RUN_ID", help="Finish an interrupted run from its checkpoint")
+    parser.add_argument("--metrics-dir", default="outputs", help="Where metrics.prom and the per-run JSON summary are written")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics during the run")
+    parser.add_argument("--profile", metavar="PATH", help="Profile the run with cProfile and dump the stats to PATH")
+    return parser.parse_args(argv)
+
+def print_breakdown(summary: dict, limit: int = 8):
+    """Prints where the run's time went, slowest stages first."""
+    rows = breakdown(summary)[:limit]
+    if not rows:
+        return
+    print("\n⏱️ Stage timings:")
+    for row in rows:
+        print(f"   {row['span']:<28} {row['count']:>6}x  total {row['total_ms']:>10.1f} ms  p50 {row['p50_ms']:>8.1f} ms  p95 {row['p95_ms']:>8.1f} ms")
+    counters = summary["counters"]
+    tokens = counters.get("llm_prompt_tokens", 0) + counters.get("llm_completion_tokens", 0)
+    print(f"   API calls: {counters.get('llm_api_calls', 0):g}, tokens: {tokens:g}, retries: {counters.get('llm_retries', 0):g}")
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    metrics_server = METRICS.start_http_server(args.metrics_port) if args.metrics_port else None
+    before = METRICS.snapshot()
+    try:
+        with profiled(args.profile, enabled=bool(args.profile)):
+            return run(args)
+    except MissingConfigurationError as e:
+        print(f"❌ Configuration error: {e}")
+        return 2
+    finally:
+        summary = METRICS.summarize(METRICS.diff(before, METRICS.snapshot()))
+        print_breakdown(summary)
+        METRICS.write_prometheus(os.path.join(args.metrics_dir, "metrics.prom"))
+        METRICS.write_json(os.path.join(args.metrics_dir, f"metrics_run_{time.strftime('%Y%m%d_%H%M%S')}.json"), summary)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+
+def run(args: argparse.Namespace) -> int:
+    product_ids = list(args.product_ids)
+    if args.file:
+        product_ids.extend(read_product_ids(args.file))
+
+    if args.resume:
+        runner = BatchRunner(workers=1, incremental=not args.full)
+        try:
+            result = process_product_pipeline(None, runner, resume_run_id=args.resume)
+        finally:
+            runner.close()
+        return 1 if result["status"] == "failed" else 0
+
+    if not product_ids:
+        # You can change this ID to test different products
+        TARGET_PRODUCT_ID = 17588414
+        product_ids = [TARGET_PRODUCT_ID]
+
+    runner = BatchRunner(workers=args.workers, incremental=not args.full)
+    try:
+        if len(product_ids) == 1:
+            result = process_product_pipeline(product_ids[0], runner)
+            return 1 if result["status"] == "failed" else 0
+
+        print(f"🚀 Starting batch run for {len(product_ids)} products with {args.workers} workers\n")
+        report = runner.run(product_ids)
+    finally:
+        runner.close()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    print("\n" + format_summary(report["summary"]))
+    return 1 if report["summary"]["failed"] else 0
 
 if __name__ == "__main__":
-    # You can change this ID to test different products
-    TARGET_PRODUCT_ID = 17588414 
-    process_product_pipeline(TARGET_PRODUCT_ID)
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -1,22 +1,45 @@
-import pandas as pd
-import matplotlib.pyplot as plt
 import os
-from typing import List, Dict, Any
+import json
+import hashlib
+import threading
+from io import BytesIO
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Union
+from src.metrics import timed, inc
 
 class ProductAnalytics:
-    def __init__(self):
-        self.output_dir = "outputs"
+    """
+    Computes NPS and renders the analytics report chart.
+    Charts are rendered with the object-oriented Agg API (no pyplot global state, so it is
+    thread-safe) and cached by a fingerprint of the product's aggregated stats: unchanged data
+    reuses the cached image instead of re-rendering or rewriting it.
+    """
+    SUPPORTED_FORMATS = {"png": "image/png", "svg": "image/svg+xml", "webp": "image/webp"}
+    # Bump when the chart layout changes so that cached images are re-rendered
+    RENDER_VERSION = "v3"
+
+    def __init__(self, output_dir: str = "outputs", dpi: int = None, image_format: str = None,
+                 max_cached_charts: int = 64):
+        dpi = dpi or int(os.getenv("CHART_DPI", "150"))
+        image_format = (image_format or os.getenv("CHART_FORMAT", "png")).lower()
+        if image_format not in self.SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported chart format: {image_format}")
+        self.output_dir = output_dir
+        self.dpi = dpi
+        self.image_format = image_format
+        self.max_cached_charts = max_cached_charts
+        self._chart_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
         os.makedirs(self.output_dir, exist_ok=True)
 
     def calculate_nps(self, reviews: List[Dict[str, Any]]) -> float:
         if not reviews:
             return 0.0
 
-        df = pd.DataFrame(reviews)
-        total_responses = len(df)
-
-        promoters = len(df[df['estimated_score'] >= 9])
-        detractors = len(df[df['estimated_score'] <= 6])
+        # Single pass over the rows; for stored products prefer DatabaseManager.get_product_summary
+        total_responses = len(reviews)
+        promoters = sum(1 for r in reviews if r['estimated_score'] >= 9)
+        detractors = sum(1 for r in reviews if r['estimated_score'] <= 6)
 
         pct_promoters = (promoters / total_responses) * 100
         pct_detractors = (detractors / total_responses) * 100
@@ -24,43 +47,142 @@ class ProductAnalytics:
         nps_score = pct_promoters - pct_detractors
         return round(nps_score, 2)
 
-    def generate_report_and_charts(self, product_id: int, reviews: List[Dict[str, Any]]):
-        if not reviews:
+    def summarize_reviews(self, product_id: int, reviews: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Builds the same aggregate as DatabaseManager.get_product_summary from raw review rows."""
+        histogram = {score: 0 for score in range(1, 11)}
+        for review in reviews:
+            if review['estimated_score'] in histogram:
+                histogram[review['estimated_score']] += 1
+        satisfied = sum(1 for r in reviews if r['is_satisfied'])
+        return {
+            "product_id": product_id,
+            "total": len(reviews),
+            "satisfied": satisfied,
+            "dissatisfied": len(reviews) - satisfied,
+            "score_histogram": histogram,
+            "nps": self.calculate_nps(reviews),
+        }
+
+    def chart_path(self, product_id: int, image_format: str = None) -> str:
+        return os.path.join(self.output_dir, f"analytics_product_{product_id}.{image_format or self.image_format}")
+
+    @timed("charts.generate_report")
+    def generate_report_and_charts(self, product_id: int,
+                                   data: Union[Dict[str, Any], List[Dict[str, Any]]],
+                                   image_format: str = None, dpi: int = None) -> Optional[bytes]:
+        """
+        Renders the report for a product summary (or a list of review rows), writes it to
+        `outputs/analytics_product_{id}.{format}` when it changed, and returns the image bytes.
+        """
+        summary = self.summarize_reviews(product_id, data) if isinstance(data, list) else data
+        if not summary or not summary["total"]:
             print("❌ No data available to generate charts.")
-            return
+            return None
+
+        image_format = image_format or self.image_format
+        dpi = dpi or self.dpi
+        if image_format not in self.SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported chart format: {image_format}")
+
+        fingerprint = self._fingerprint(product_id, summary, image_format, dpi)
+        output_file = self.chart_path(product_id, image_format)
+        fingerprint_file = output_file + ".sha256"
+
+        with self._lock:
+            image = self._chart_cache.get(fingerprint)
+            if image is not None:
+                self._chart_cache.move_to_end(fingerprint)
+                inc("chart_cache_hits", tier="memory")
+                return image
+
+        # The image on disk is reused across processes when its fingerprint still matches
+        image = self._read_if_current(output_file, fingerprint_file, fingerprint)
+        if image is not None:
+            inc("chart_cache_hits", tier="disk")
+        else:
+            image = self._render(product_id, summary, image_format, dpi)
+            with open(output_file, "wb") as file:
+                file.write(image)
+            with open(fingerprint_file, "w") as file:
+                file.write(fingerprint)
+
+        with self._lock:
+            self._chart_cache[fingerprint] = image
+            while len(self._chart_cache) > self.max_cached_charts:
+                self._chart_cache.popitem(last=False)
+        return image
+
+    def _fingerprint(self, product_id: int, summary: Dict[str, Any], image_format: str, dpi: int) -> str:
+        key = {
+            "product_id": product_id,
+            "total": summary["total"],
+            "satisfied": summary["satisfied"],
+            "histogram": [summary["score_histogram"].get(score, 0) for score in range(1, 11)],
+            "nps": summary["nps"],
+            "nps_interval": [summary.get("nps_low"), summary.get("nps_high"), summary.get("stop_reason")],
+            "format": image_format,
+            "dpi": dpi,
+            "version": self.RENDER_VERSION,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _read_if_current(output_file: str, fingerprint_file: str, fingerprint: str) -> Optional[bytes]:
+        try:
+            with open(fingerprint_file) as file:
+                if file.read().strip() != fingerprint:
+                    return None
+            with open(output_file, "rb") as file:
+                return file.read()
+        except OSError:
+            return None
+
+    @timed("charts.render")
+    def _render(self, product_id: int, summary: Dict[str, Any], image_format: str, dpi: int) -> bytes:
+        # matplotlib is only loaded once a chart actually has to be drawn (cached charts never need it)
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        fig = Figure(figsize=(14, 6))
+        FigureCanvasAgg(fig)
+        ax1, ax2 = fig.subplots(1, 2)
 
-        df = pd.DataFrame(reviews)
-        nps = self.calculate_nps(reviews)
-        
-        fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(14, 6))
-        
         # 1. Bold Title
+        nps_text = f'NPS: {summary["nps"]}'
+        if summary.get("nps_low") is not None:
+            nps_text += f' (95% CI {summary["nps_low"]} to {summary["nps_high"]}'
+            if summary.get("stop_reason"):
+                nps_text += f', adaptive stop: {summary["stop_reason"]}'
+            nps_text += ')'
         fig.suptitle(
-            f'Data Analytics Report for Product #{product_id}\nTotal Sampled Reviews: {len(df)} | NPS: {nps}', 
-            fontsize=18, 
+            f'Data Analytics Report for Product #{product_id}\nTotal Sampled Reviews: {summary["total"]} | {nps_text}',
+            fontsize=18,
             fontweight='bold',
             color='#2c3e50'
         )
 
         # Chart 1: Estimated Score Distribution
-        ax1.hist(df['estimated_score'], bins=range(1, 12), align='left', color='#3498db', edgecolor='black')
+        scores = list(range(1, 11))
+        ax1.bar(scores, [summary["score_histogram"].get(score, 0) for score in scores],
+                width=1.0, color='#3498db', edgecolor='black')
         ax1.set_title('Distribution of Estimated Scores (1-10)', fontweight='bold')
         ax1.set_xlabel('Score')
         ax1.set_ylabel('Number of Reviews')
-        ax1.set_xticks(range(1, 11))
+        ax1.set_xticks(scores)
 
         # Chart 2: Satisfaction Ratio
-        satisfaction_counts = df['is_satisfied'].value_counts()
-        labels = ['Satisfied', 'Dissatisfied'] if True in satisfaction_counts.index else ['Dissatisfied', 'Satisfied']
-        colors = ['#2ecc71', '#e74c3c'] 
-        ax2.pie(satisfaction_counts, labels=[labels[i] for i in range(len(satisfaction_counts))], 
-                autopct='%1.1f%%', startangle=90, colors=colors)
+        slices = [(label, count, color) for label, count, color in (
+            ('Satisfied', summary["satisfied"], '#2ecc71'),
+            ('Dissatisfied', summary["dissatisfied"], '#e74c3c'),
+        ) if count]
+        ax2.pie([count for _, count, _ in slices], labels=[label for label, _, _ in slices],
+                autopct='%1.1f%%', startangle=90, colors=[color for _, _, color in slices])
         ax2.set_title('Overall Customer Satisfaction', fontweight='bold')
 
         # 2. Add Spacing between title and charts
-        plt.tight_layout()
-        plt.subplots_adjust(top=0.80)
-        
-        output_file = os.path.join(self.output_dir, f"analytics_product_{product_id}.png")
-        plt.savefig(output_file, dpi=300)
-        plt.close()
\ No newline at end of file
+        fig.tight_layout()
+        fig.subplots_adjust(top=0.80)
+
+        buffer = BytesIO()
+        fig.savefig(buffer, format=image_format, dpi=dpi)
+        return buffer.getvalue()
\ No newline at end of file
@@ -1,15 +1,47 @@
 import json
-from openai import OpenAI
-from src.config import AVALAI_API_KEY, API_BASE_URL
-from src.exceptions import LLMAnalysisError
+import threading
+from typing import Dict, Any, Optional, List, Iterable, Iterator, Tuple, Callable
+from src.config import get_api_key, API_BASE_URL, LEXICON_PRECLASSIFIER, LEXICON_CONFIDENCE_THRESHOLD
+from src.cache import AnalysisCache
+from src.lexicon import LexiconClassifier
+from src.metrics import span, timed, inc
+from src.validation import REVIEW_FIELDS, parse_json_response, repair_result
+from src.exceptions import LLMAnalysisError, LLMTransientError, LLMRateLimitError, DatabaseError
+
+def _openai():
+    """The openai package, imported on first use (it is one of the slowest imports of the project)."""
+    import openai
+    return openai
 
 class CommentAnalyzer:
     """
     Handles LLM communication to extract structured analytical data 
     (Sentiment, Reason, Score) from raw comment text.
+    Answers are validated before they are used or cached: malformed JSON and loosely typed
+    fields are repaired locally, and fields that are still missing are asked for in a small
+    follow-up request instead of re-analyzing the whole comment. `llm_outputs{status=...}`
+    counts valid, repaired, completed and failed answers.
     """
-    def __init__(self):
-        self.client = OpenAI(api_key=AVALAI_API_KEY, base_url=API_BASE_URL)
+    # Bump whenever the system prompt changes so that cached answers are not reused
+    PROMPT_VERSION = "v1"
+
+    def __init__(self, cache: AnalysisCache = None, pre_classifier: LexiconClassifier = None,
+                 use_pre_classifier: bool = None, base_url: str = None, api_key: str = None):
+        # Retries are owned by the AnalysisEngine so that they respect the shared rate limiter
+        self.client = _openai().OpenAI(api_key=api_key or get_api_key(), base_url=base_url or API_BASE_URL,
+                                       max_retries=0)
+        self.model = "gpt-4o"
+        self.temperature = 0.1
+        self.max_tokens = 150
+        self.cache = cache
+        # Optional local fast path: comments it is confident about never reach the LLM
+        use_pre_classifier = LEXICON_PRECLASSIFIER if use_pre_classifier is None else use_pre_classifier
+        if pre_classifier is None and use_pre_classifier:
+            pre_classifier = LexiconClassifier(confidence_threshold=LEXICON_CONFIDENCE_THRESHOLD)
+        self.pre_classifier = pre_classifier
+        # Number of chat completion requests actually sent (shared by all threads)
+        self.api_calls = 0
+        self._counter_lock = threading.Lock()
         
         self.system_prompt = """
         You are an expert Data Scientist and Sentiment Analyst.
@@ -29,25 +61,347 @@ class CommentAnalyzer:
         }
         """
 
+        # Batched mode: several comments share one request (and one copy of the instructions)
+        self.batch_token_budget = 3000
+        self.max_batch_size = 25
+        self.batch_item_completion_tokens = 60
+
+        self.batch_system_prompt = """
+        You are an expert Data Scientist and Sentiment Analyst.
+        You will receive a JSON object with a "comments" array. Each element has an "index" and the "text" of one user comment about a product.
+        Analyze EVERY comment independently and extract metadata.
+        You MUST respond ONLY with a valid JSON object containing a "results" array with exactly one element per input comment.
+
+        Rules for Extraction (per comment):
+        1. "index": Integer, copied unchanged from the input comment.
+        2. "is_satisfied": Boolean (true if the user is generally happy/recommends it, false if angry/dissatisfied).
+        3. "reason": A brief 3-5 word summary in Persian explaining the main reason for their feeling.
+        4. "estimated_score": Integer from 1 to 10 (1=terrible, 10=excellent). Estimate based on tone.
+
+        JSON Format:
+        {
+            "results": [
+                {"index": 0, "is_satisfied": true, "reason": "کیفیت ساخت بالا", "estimated_score": 9},
+                {"index": 1, "is_satisfied": false, "reason": "ارسال بسیار کند", "estimated_score": 3}
+            ]
+        }
+        """
+
+        # Follow-up for answers that came back incomplete: only the missing fields are requested
+        self.follow_up_item_completion_tokens = 30
+        # Sends a follow-up as request_gate(call, estimated_tokens); the AnalysisEngine replaces
+        # it so that follow-ups share its rate limiter, 429 feedback and retries
+        self.request_gate: Callable[[Callable[[], Any], int], Any] = lambda call, tokens: call()
+
+        self.follow_up_system_prompt = """
+        You are an expert Data Scientist and Sentiment Analyst.
+        You will receive a JSON object with a "comments" array. Each element has an "index", the "text" of one user comment about a product and the "fields" that are still missing from its analysis.
+        You MUST respond ONLY with a valid JSON object containing a "results" array with one element per input comment, holding its "index" and ONLY the requested fields.
+
+        Field definitions:
+        - "is_satisfied": Boolean (true if the user is generally happy/recommends it, false if angry/dissatisfied).
+        - "reason": A brief 3-5 word summary in Persian explaining the main reason for their feeling.
+        - "estimated_score": Integer from 1 to 10 (1=terrible, 10=excellent). Estimate based on tone.
+
+        JSON Format:
+        {
+            "results": [
+                {"index": 0, "estimated_score": 9},
+                {"index": 1, "is_satisfied": false, "reason": "ارسال بسیار کند"}
+            ]
+        }
+        """
+
+    def estimate_tokens(self, comment_text: str) -> int:
+        """
+        Rough upper bound of the tokens a single request consumes (prompt + completion).
+        Persian text averages well under one token per 2 characters, so this errs on the safe side.
+        """
+        prompt_chars = len(self.system_prompt) + len(comment_text)
+        return prompt_chars // 2 + self.max_tokens
+
+    def estimate_item_tokens(self, comment_text: str) -> int:
+        """Prompt tokens one comment adds to a batched request (text plus JSON wrapping)."""
+        return len(comment_text) // 2 + 10
+
+    def estimate_batch_tokens(self, comments: List[str]) -> int:
+        """Rough upper bound of the tokens a batched request consumes (prompt + completion)."""
+        prompt_tokens = len(self.batch_system_prompt) // 2 + sum(self.estimate_item_tokens(c) for c in comments)
+        return prompt_tokens + self._batch_max_tokens(len(comments))
+
+    def _batch_max_tokens(self, batch_size: int) -> int:
+        return self.batch_item_completion_tokens * batch_size + 50
+
+    def iter_batches(self, items: Iterable[Tuple[int, str]]) -> Iterator[List[Tuple[int, str]]]:
+        """
+        Groups (index, comment) pairs into batches whose estimated prompt size stays within
+        `batch_token_budget` and whose length stays within `max_batch_size`.
+        """
+        base_tokens = len(self.batch_system_prompt) // 2
+        batch, used_tokens = [], base_tokens
+
+        for index, comment in items:
+            cost = self.estimate_item_tokens(comment)
+            if batch and (used_tokens + cost > self.batch_token_budget or len(batch) >= self.max_batch_size):
+                yield batch
+                batch, used_tokens = [], base_tokens
+            batch.append((index, comment))
+            used_tokens += cost
+
+        if batch:
+            yield batch
+
+    def cache_key(self, comment_text: str) -> str:
+        return AnalysisCache.make_key(comment_text, self.model, self.PROMPT_VERSION, self.temperature)
+
+    def get_cached(self, comment_text: str) -> Optional[Dict[str, Any]]:
+        """Returns a previously stored analysis for this comment without calling the API."""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(self.cache_key(comment_text))
+        if cached is None:
+            return None
+        fields, missing, _ = repair_result(cached)
+        # Entries cached before answers were validated may be incomplete: treat them as a miss
+        return None if missing else dict(cached, **fields)
+
+    def pre_classify(self, comment_text: str) -> Optional[Dict[str, Any]]:
+        """Scores the comment locally (no network) if the pre-classifier is confident, otherwise None."""
+        if self.pre_classifier is None:
+            return None
+        result = self.pre_classifier.classify(comment_text)
+        if result is not None:
+            inc("lexicon_classified")
+        return result
+
+    @timed("llm.analyze_comment")
     def analyze_comment(self, comment_text: str) -> dict:
+        local = self.pre_classify(comment_text)
+        if local is not None:
+            return local
+        cached = self.get_cached(comment_text)
+        if cached is not None:
+            return cached
+        return self.fetch_analysis(comment_text)
+
+    def fetch_analysis(self, comment_text: str) -> dict:
+        """Always calls the LLM (no cache lookup) and stores the answer in the cache."""
         messages = [
             {"role": "system", "content": self.system_prompt},
             {"role": "user", "content": comment_text}
         ]
+        data = self._request_json(messages, self.max_tokens)
+        results, follow_up_error = self._validate_answers([comment_text], [data])
+        if results[0] is None:
+            if isinstance(follow_up_error, LLMTransientError):
+                raise follow_up_error
+            raise LLMAnalysisError(f"LLM answer is incomplete or invalid even after repair. Raw: {data}")
+        self._store_in_cache(comment_text, results[0])
+        return results[0]
+
+    def analyze_batch(self, comments: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Analyzes many comments with as few requests as possible.
+        Returns one result per input comment (same order). Items missing or invalid in a batched
+        answer fall back to single-comment calls; None marks a comment that could not be analyzed at all.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(comments)
+        pending = []
+        for index, comment in enumerate(comments):
+            cached = self.pre_classify(comment) or self.get_cached(comment)
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, comment))
+
+        for batch in self.iter_batches(pending):
+            try:
+                answers = self.fetch_batch_analysis([comment for _, comment in batch])
+            except LLMAnalysisError as e:
+                print(f"⚠️ Batched request failed, falling back to single calls: {e}")
+                answers = {}
+
+            for position, (index, comment) in enumerate(batch):
+                if position in answers:
+                    results[index] = answers[position]
+                    continue
+                try:
+                    results[index] = self.fetch_analysis(comment)
+                except LLMAnalysisError as e:
+                    print(f"⚠️ Comment {index} could not be analyzed: {e}")
+
+        return results
+
+    def fetch_batch_analysis(self, comments: List[str]) -> Dict[int, Dict[str, Any]]:
+        """
+        Sends one batched request (no cache lookup) and returns the valid answers keyed by the
+        comment's position in `comments`. Positions that are missing, duplicated or malformed
+        in the response are left out so the caller can retry them individually.
+        """
+        payload = {"comments": [{"index": i, "text": comment} for i, comment in enumerate(comments)]}
+        messages = [
+            {"role": "system", "content": self.batch_system_prompt},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ]
+        data = self._request_json(messages, self._batch_max_tokens(len(comments)))
+
+        items = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            raise LLMAnalysisError(f"Batched LLM response has no 'results' array. Raw: {data}")
+
+        raw_answers: List[Optional[Dict[str, Any]]] = [None] * len(comments)
+        duplicated = set()
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index")
+            if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(comments):
+                continue
+            if raw_answers[index] is not None or index in duplicated:
+                # The model answered the same index twice: we cannot tell which one is right
+                raw_answers[index] = None
+                duplicated.add(index)
+                continue
+            raw_answers[index] = item
+
+        results, _ = self._validate_answers(comments, raw_answers)
+        answers = {index: result for index, result in enumerate(results) if result is not None}
+        for index, result in answers.items():
+            self._store_in_cache(comments[index], result)
+        return answers
+
+    def _follow_up_max_tokens(self, requests: List[Tuple[str, List[str]]]) -> int:
+        return self.follow_up_item_completion_tokens * sum(len(fields) for _, fields in requests) + 50
+
+    def estimate_follow_up_tokens(self, requests: List[Tuple[str, List[str]]]) -> int:
+        """Rough upper bound of the tokens a follow-up request consumes (prompt + completion)."""
+        prompt_tokens = len(self.follow_up_system_prompt) // 2 + sum(
+            self.estimate_item_tokens(comment) + 5 * len(fields) for comment, fields in requests
+        )
+        return prompt_tokens + self._follow_up_max_tokens(requests)
 
+    def fetch_missing_fields(self, requests: List[Tuple[str, List[str]]]) -> Dict[int, Dict[str, Any]]:
+        """
+        One follow-up request for (comment, missing field names) pairs. Returns the raw fields
+        the model supplied, keyed by the pair's position (validation is left to the caller).
+        """
+        inc("llm_follow_up_requests")
+        payload = {"comments": [{"index": i, "text": comment, "fields": fields}
+                                for i, (comment, fields) in enumerate(requests)]}
+        messages = [
+            {"role": "system", "content": self.follow_up_system_prompt},
+            {"role": "user", "content": json.dumps(payload, ensure_ascii=False)}
+        ]
+        data = self._request_json(messages, self._follow_up_max_tokens(requests))
+
+        items = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(items, list):
+            # A lone comment is sometimes answered with a bare object
+            items = [dict(data, index=0)] if isinstance(data, dict) and len(requests) == 1 else []
+        completions: Dict[int, Dict[str, Any]] = {}
+        for item in items:
+            index = item.get("index") if isinstance(item, dict) else None
+            if isinstance(index, int) and not isinstance(index, bool) and 0 <= index < len(requests):
+                completions[index] = {key: value for key, value in item.items() if key != "index"}
+        return completions
+
+    def _validate_answers(self, comments: List[str],
+                          answers: List[Any]) -> Tuple[List[Optional[Dict[str, Any]]], Optional[Exception]]:
+        """
+        Repairs each raw answer locally and completes partial ones with a single follow-up
+        request for just their missing fields. Returns the valid results (None where an answer
+        is absent or could not be completed) and the follow-up request's error, if it failed.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(comments)
+        statuses = ["failed"] * len(comments)
+        incomplete = []
+        for position, answer in enumerate(answers):
+            fields, missing, repaired = repair_result(answer)
+            if not missing:
+                results[position] = fields
+                statuses[position] = "repaired" if repaired else "valid"
+            elif len(missing) < len(REVIEW_FIELDS):
+                # Nothing usable at all is not worth a follow-up: that would be a full request
+                incomplete.append((position, fields, missing))
+
+        error = None
+        if incomplete:
+            requests = [(comments[position], missing) for position, _, missing in incomplete]
+            try:
+                completions = self.request_gate(lambda: self.fetch_missing_fields(requests),
+                                                self.estimate_follow_up_tokens(requests))
+            except LLMAnalysisError as e:
+                print(f"⚠️ Follow-up request for missing fields failed: {e}")
+                completions, error = {}, e
+            for request_position, (position, fields, _) in enumerate(incomplete):
+                completed, missing, _ = repair_result(dict(completions.get(request_position, {}), **fields))
+                if not missing:
+                    results[position] = completed
+                    statuses[position] = "completed"
+
+        for status in statuses:
+            inc("llm_outputs", status=status)
+        return results, error
+
+    def _request_json(self, messages: List[Dict[str, str]], max_tokens: int) -> dict:
+        """Performs one chat completion in JSON mode and maps failures onto the project's exceptions."""
+        openai = _openai()
+        raw_response = None
+        with self._counter_lock:
+            self.api_calls += 1
+        inc("llm_api_calls")
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=messages,
-                temperature=0.1, 
-                max_tokens=150,
-                response_format={"type": "json_object"}
-            )
+            with span("llm.request"):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature, 
+                    max_tokens=max_tokens,
+                    response_format={"type": "json_object"}
+                )
+            self._record_usage(response)
             
             raw_response = response.choices[0].message.content.strip()
-            return json.loads(raw_response)
+            data, repaired = parse_json_response(raw_response)
+            if repaired:
+                inc("llm_repairs", kind="json")
+            return data
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:
+            inc("llm_errors", kind="invalid_json")
             raise LLMAnalysisError(f"LLM did not return a valid JSON. Raw: {raw_response}") from e
+        except openai.RateLimitError as e:
+            inc("llm_errors", kind="rate_limit")
+            raise LLMRateLimitError(f"API Rate Limit Exceeded: {str(e)}", retry_after=self._retry_after(e)) from e
+        except (openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError) as e:
+            inc("llm_errors", kind="transient")
+            raise LLMTransientError(f"Temporary API Error: {str(e)}") from e
         except Exception as e:
-            raise LLMAnalysisError(f"API Communication Error: {str(e)}") from e
\ No newline at end of file
+            inc("llm_errors", kind="api")
+            raise LLMAnalysisError(f"API Communication Error: {str(e)}") from e
+
+    @staticmethod
+    def _record_usage(response: Any):
+        """Adds the provider-reported token usage (`response.usage`) to the token counters."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        inc("llm_prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+        inc("llm_completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+    def _store_in_cache(self, comment_text: str, result: Dict[str, Any]):
+        if self.cache is None:
+            return
+        try:
+            self.cache.set(self.cache_key(comment_text), result)
+        except DatabaseError as e:
+            # A cache write failure must not throw away an answer we already paid for
+            print(f"⚠️ Could not cache LLM result: {e}")
+
+    @staticmethod
+    def _retry_after(error: Exception) -> float:
+        """Reads the provider's Retry-After hint (in seconds) from a 429 response, if present."""
+        try:
+            return float(error.response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
\ No newline at end of file
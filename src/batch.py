@@ -0,0 +1,172 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, Iterable, Callable
+
+from src.crawler import DigikalaCrawler
+from src.analyzer import CommentAnalyzer
+from src.cache import AnalysisCache
+from src.engine import AnalysisEngine, AnalysisOutcome
+from src.db_manager import DatabaseManager, ReviewWriter
+from src.analytics import ProductAnalytics
+from src.pipeline import StreamingPipeline
+from src.metrics import METRICS
+
+def read_product_ids(path: str) -> List[int]:
+    """Reads product IDs from a text file (one per line or comma separated; '#' starts a comment)."""
+    product_ids = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.split("#", 1)[0]
+            for token in line.replace(",", " ").split():
+                product_ids.append(int(token))
+    return product_ids
+
+class BatchRunner:
+    """
+    Refreshes many products with one set of shared components: a worker pool runs
+    crawl -> analysis -> storage -> report per product, while every worker shares
+    the same LLM client, cache and rate limiter (one global API budget), the same
+    DB connection and a single background ReviewWriter.
+    Threads are used rather than processes because every stage is I/O-bound and
+    the shared budget/writer then need no inter-process coordination.
+    """
+    def __init__(self, workers: int = 4, incremental: bool = True, db_path: str = "database/reviews.db",
+                 log: Callable[[str], None] = print, resume_interrupted: bool = True):
+        self.workers = workers
+        self.incremental = incremental
+        # Finish a product's interrupted run (same sample, no re-crawl) instead of starting a new one
+        self.resume_interrupted = resume_interrupted
+        self.log = log
+
+        self.db = DatabaseManager(db_path)
+        self.writer = ReviewWriter(self.db)
+        self.crawler = DigikalaCrawler()
+        self.analyzer = CommentAnalyzer(cache=AnalysisCache(db_path=db_path))
+        self.engine = AnalysisEngine(self.analyzer)
+        self.analytics = ProductAnalytics()
+        self._print_lock = threading.Lock()
+
+    def _product_log(self, product_id: int) -> Callable[[str], None]:
+        def log(message: str):
+            with self._print_lock:
+                self.log(f"[{product_id}] {message}")
+        return log
+
+    def process_product(self, product_id: int,
+                        on_outcome: Callable[[int, int, AnalysisOutcome], None] = None,
+                        log: Callable[[str], None] = None) -> Dict[str, Any]:
+        """
+        Runs the full pipeline for one product and returns its result.
+        Errors are raised to the caller; `run` isolates them per product.
+        `log` replaces the runner's product-prefixed log for this product (e.g. a job's own log).
+        """
+        if self.resume_interrupted:
+            run_id = self.db.find_resumable_run(product_id, statuses=("running",))
+            if run_id is not None:
+                return self.resume_run(run_id, on_outcome=on_outcome, log=log)
+
+        log = log or self._product_log(product_id)
+        started = time.perf_counter()
+        pipeline = StreamingPipeline(self.crawler, self.engine, self.db, log=log, writer=self.writer)
+        stats = pipeline.run(product_id, incremental=self.incremental, on_outcome=on_outcome)
+        return self._report(product_id, stats, started)
+
+    def _report(self, product_id: int, stats: Dict[str, Any], started: float) -> Dict[str, Any]:
+        summary = self.db.get_product_summary(product_id)
+        if summary["total"]:
+            self.analytics.generate_report_and_charts(product_id, summary)
+            status = "ok"
+        else:
+            status = "empty"
+
+        return {
+            "product_id": product_id,
+            "status": status,
+            "stats": stats,
+            "nps": summary["nps"],
+            "nps_interval": [summary["nps_low"], summary["nps_high"]],
+            "stop_reason": summary.get("stop_reason"),
+            "total_reviews": summary["total"],
+            "seconds": round(time.perf_counter() - started, 2),
+        }
+
+    def resume_run(self, run_id: str,
+                   on_outcome: Callable[[int, int, AnalysisOutcome], None] = None,
+                   log: Callable[[str], None] = None) -> Dict[str, Any]:
+        """Finishes an interrupted pipeline run (see StreamingPipeline.resume) and reports on its product."""
+        run = self.db.get_run(run_id)
+        if run is None:
+            raise ValueError(f"Unknown pipeline run: {run_id}")
+        product_id = run["product_id"]
+        started = time.perf_counter()
+        pipeline = StreamingPipeline(self.crawler, self.engine, self.db, log=log or self._product_log(product_id),
+                                     writer=self.writer)
+        stats = pipeline.resume(run_id, on_outcome=on_outcome)
+        return self._report(product_id, stats, started)
+
+    def run(self, product_ids: Iterable[int]) -> Dict[str, Any]:
+        """Processes all products on the worker pool and returns per-product results plus a throughput summary."""
+        product_ids = list(dict.fromkeys(product_ids))
+        api_calls_before = self.analyzer.api_calls
+        metrics_before = METRICS.snapshot()
+        pre_classifier = self.analyzer.pre_classifier
+        pre_classified_before = pre_classifier.classified if pre_classifier else 0
+        started = time.perf_counter()
+        results = []
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.process_product, product_id): product_id for product_id in product_ids}
+            for future in as_completed(futures):
+                product_id = futures[future]
+                try:
+                    result = future.result()
+                    self._product_log(product_id)(
+                        f"✅ {result['stats']['analyzed']} analyzed, NPS {result['nps']} ({result['seconds']}s)"
+                    )
+                except Exception as e:
+                    # One broken product must not stop the nightly batch
+                    result = {"product_id": product_id, "status": "failed", "error": str(e)}
+                    self._product_log(product_id)(f"❌ Failed: {e}")
+                results.append(result)
+
+        self.writer.flush()
+        elapsed = time.perf_counter() - started
+        analyzed = sum(r["stats"]["analyzed"] for r in results if "stats" in r)
+        api_calls = self.analyzer.api_calls - api_calls_before
+        pre_classified = (pre_classifier.classified if pre_classifier else 0) - pre_classified_before
+
+        return {
+            "results": sorted(results, key=lambda r: product_ids.index(r["product_id"])),
+            # Stage timings and counters recorded during this run (see src.metrics)
+            "metrics": METRICS.summarize(METRICS.diff(metrics_before, METRICS.snapshot())),
+            "summary": {
+                "products": len(product_ids),
+                "succeeded": sum(1 for r in results if r["status"] == "ok"),
+                "empty": sum(1 for r in results if r["status"] == "empty"),
+                "failed": sum(1 for r in results if r["status"] == "failed"),
+                "elapsed_seconds": round(elapsed, 2),
+                "products_per_minute": round(len(product_ids) / elapsed * 60, 2) if elapsed else 0.0,
+                "comments_analyzed": analyzed,
+                "comments_per_second": round(analyzed / elapsed, 2) if elapsed else 0.0,
+                "api_calls": api_calls,
+                "pre_classified": pre_classified,
+                # Comments answered without a dedicated request (lexicon, cache hits, batched prompts)
+                "api_calls_saved": max(0, analyzed - api_calls),
+            },
+        }
+
+    def close(self):
+        self.writer.close()
+        self.analyzer.cache.close()
+        self.db.close()
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    return (
+        f"📦 Products: {summary['products']} ({summary['succeeded']} ok, {summary['empty']} empty, "
+        f"{summary['failed']} failed) in {summary['elapsed_seconds']}s\n"
+        f"⚡ Throughput: {summary['products_per_minute']} products/min, "
+        f"{summary['comments_per_second']} comments/s\n"
+        f"💰 API calls: {summary['api_calls']} sent, {summary['api_calls_saved']} saved "
+        f"({summary['pre_classified']} comments scored by the local lexicon)"
+    )
\ No newline at end of file
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+from src.exceptions import DatabaseError
+from src.text_utils import normalize_comment
+from src.metrics import inc
+
+class AnalysisCache:
+    """
+    Content-addressed cache for LLM analysis results.
+    A small in-memory LRU sits in front of a persistent SQLite table (`llm_cache`) that
+    lives in the same database file as `product_reviews`. Entries expire after `ttl_seconds`
+    and the table is trimmed to `max_entries` (least recently used first).
+    Every thread reuses its own connection, and lookups never write: the access times of disk
+    hits are collected in memory and written in one batch with the next `set`, `evict` or
+    `close`, so analysis threads do not compete with the review writer for the write lock.
+    """
+    def __init__(self, db_path: str = "database/reviews.db", max_memory_entries: int = 2048,
+                 max_entries: int = 100_000, ttl_seconds: float = 30 * 24 * 3600):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db_path = db_path
+        self.max_memory_entries = max_memory_entries
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes_since_trim = 0
+        # cache_key -> last access time of disk hits not written yet
+        self._pending_access: Dict[str, float] = {}
+        self._local = threading.local()
+        self._connections = []
+        self._initialize_table()
+
+    @staticmethod
+    def make_key(comment_text: str, model: str, prompt_version: str, temperature: float) -> str:
+        """SHA-256 over the normalized comment and everything that influences the LLM answer."""
+        payload = "\x1f".join([normalize_comment(comment_text), model, prompt_version, f"{temperature:.3f}"])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for reporting."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def _get_connection(self) -> sqlite3.Connection:
+        """The calling thread's connection (opened on first use, closed by `close`)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            try:
+                # Only ever used by the thread that opened it; close() may run on another one
+                conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            except Exception as e:
+                raise DatabaseError(f"Failed to connect to cache database at {self.db_path}: {e}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _initialize_table(self):
+        query = """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            cache_key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute(query)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_last_access ON llm_cache (last_access)")
+        except Exception as e:
+            raise DatabaseError(f"Failed to initialize cache table: {e}")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a copy of the cached result, or None on a miss / expired entry."""
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, result = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    inc("llm_cache_hits", tier="memory")
+                    return dict(result)
+                del self._memory[key]
+
+        try:
+            row = self._get_connection().execute(
+                "SELECT result, created_at FROM llm_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            raise DatabaseError(f"Failed to read from LLM cache: {e}")
+        if row is not None and now - row[1] > self.ttl_seconds:
+            row = None  # expired rows are deleted by evict()
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                inc("llm_cache_misses")
+                return None
+            result = json.loads(row[0])
+            self._remember(key, row[1], result)
+            self._pending_access[key] = now
+            self.disk_hits += 1
+            inc("llm_cache_hits", tier="disk")
+            return dict(result)
+
+    def set(self, key: str, result: Dict[str, Any]):
+        """Stores a result in both tiers."""
+        now = time.time()
+        accesses = self._take_pending_access()
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (cache_key, result, created_at, last_access) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False), now, now)
+                )
+                self._write_access(conn, accesses)
+        except Exception as e:
+            raise DatabaseError(f"Failed to write to LLM cache: {e}")
+
+        with self._lock:
+            self._remember(key, now, dict(result))
+            self._writes_since_trim += 1
+            should_trim = self._writes_since_trim >= 500
+            if should_trim:
+                self._writes_since_trim = 0
+
+        if should_trim:
+            self.evict()
+
+    def _remember(self, key: str, created_at: float, result: Dict[str, Any]):
+        """Inserts into the in-memory LRU. Caller must hold the lock."""
+        self._memory[key] = (created_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def _take_pending_access(self) -> Dict[str, float]:
+        with self._lock:
+            accesses, self._pending_access = self._pending_access, {}
+        return accesses
+
+    @staticmethod
+    def _write_access(conn: sqlite3.Connection, accesses: Dict[str, float]):
+        if accesses:
+            conn.executemany("UPDATE llm_cache SET last_access = ? WHERE cache_key = ?",
+                             [(last_access, key) for key, last_access in accesses.items()])
+
+    def evict(self) -> int:
+        """Removes expired entries and trims the table to `max_entries`. Returns the number of rows deleted."""
+        accesses = self._take_pending_access()
+        try:
+            with self._get_connection() as conn:
+                # Recent hits must count before the least recently used rows are picked
+                self._write_access(conn, accesses)
+                expired = conn.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+                overflow = conn.execute(
+                    """
+                    DELETE FROM llm_cache WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                    """, (self.max_entries,)
+                ).rowcount
+                return expired + overflow
+        except Exception as e:
+            raise DatabaseError(f"Failed to evict LLM cache entries: {e}")
+
+    def clear(self):
+        """Drops every cached result."""
+        with self._lock:
+            self._memory.clear()
+            self._pending_access.clear()
+        try:
+            with self._get_connection() as conn:
+                conn.execute("DELETE FROM llm_cache")
+        except Exception as e:
+            raise DatabaseError(f"Failed to clear LLM cache: {e}")
+
+    def close(self):
+        """Writes the pending access times and closes every thread's connection."""
+        accesses = self._take_pending_access()
+        if accesses:
+            try:
+                with self._get_connection() as conn:
+                    self._write_access(conn, accesses)
+            except Exception as e:
+                print(f"⚠️ Could not save LLM cache access times: {e}")
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
@@ -0,0 +1,260 @@
+import os
+import glob
+import json
+import shutil
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+from src.db_manager import DatabaseManager
+from src.metrics import timed
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+except ImportError:  # optional dependency: pip install pyarrow
+    pa = pc = ds = pafs = None
+
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+# Sync bookkeeping lives next to the data; dataset discovery ignores files starting with "_"
+_STATE_FILE = "_sync_state.json"
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("Columnar export needs pyarrow (pip install pyarrow).")
+
+def review_schema() -> "pa.Schema":
+    """Columns of the exported reviews (product_id and month are the partition keys)."""
+    _require_pyarrow()
+    return pa.schema([
+        ("review_id", pa.int64()),
+        ("comment_id", pa.int64()),
+        ("product_id", pa.int64()),
+        ("month", pa.string()),
+        ("created_at", pa.timestamp("ms")),
+        ("is_satisfied", pa.bool_()),
+        ("estimated_score", pa.int8()),
+        # Reasons and scorers repeat a lot: dictionary encoding stores each distinct value once
+        ("reason", pa.dictionary(pa.int32(), pa.string())),
+        ("scored_by", pa.dictionary(pa.int8(), pa.string())),
+        ("cluster_id", pa.string()),
+    ])
+
+def _partitioning() -> "ds.Partitioning":
+    return ds.partitioning(pa.schema([("product_id", pa.int64()), ("month", pa.string())]), flavor="hive")
+
+class ColumnarStore:
+    """
+    Partitioned Parquet (or Arrow IPC) copy of `product_reviews` for analytics over large
+    histories: `product_id=<id>/month=<YYYY-MM>/part-*.parquet`, with int8 scores and
+    dictionary-encoded reasons. `sync` appends only the reviews added since the previous sync
+    (the autoincrement id is the watermark for new rows) and rebuilds the export when reviews
+    it already holds were deleted (e.g. by `dedupe`), detected by the exported row count. The
+    aggregate methods scan just the needed columns of the memory-mapped files, pruning
+    partitions by product and month, and aggregate in Arrow without building Python rows.
+    """
+    def __init__(self, root: str = "database/columnar", file_format: str = "parquet"):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unsupported columnar format: {file_format}")
+        _require_pyarrow()
+        self.root = root
+        self.file_format = file_format
+
+    def _load_state(self) -> Dict[str, Any]:
+        path = os.path.join(self.root, _STATE_FILE)
+        if not os.path.exists(path):
+            return {"last_review_id": 0, "rows": 0, "format": self.file_format}
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    def _save_state(self, state: Dict[str, Any]):
+        path = os.path.join(self.root, _STATE_FILE)
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+        os.replace(temporary, path)
+
+    @timed("columnar.sync")
+    def sync(self, db: DatabaseManager, rebuild: bool = False, chunk_size: int = 100_000) -> Dict[str, Any]:
+        """
+        Exports the reviews stored since the last sync (everything with `rebuild=True` or when
+        the database no longer matches the export: it was recreated, or exported reviews were
+        deleted). Rows are read and written in chunks of `chunk_size`, so memory stays flat
+        whatever the table size.
+        """
+        state = self._load_state()
+        max_id = db.get_max_review_id()
+        if (rebuild or state.get("format") != self.file_format or max_id < state["last_review_id"]
+                or db.count_reviews_through(state["last_review_id"]) != state.get("rows")):
+            self._clear()
+            state = {"last_review_id": 0, "rows": 0, "format": self.file_format}
+        os.makedirs(self.root, exist_ok=True)
+
+        exported = 0
+        for table in self._read_chunks(db, state["last_review_id"], chunk_size):
+            last_id = table["review_id"][-1].as_py()
+            ds.write_dataset(
+                table, self.root, format=FORMATS[self.file_format], partitioning=_partitioning(),
+                # Unique per chunk, so a sync only ever adds files to a partition
+                basename_template=f"part-{last_id}-{{i}}.{self.file_format}",
+                existing_data_behavior="overwrite_or_ignore",
+            )
+            exported += table.num_rows
+            # Saved after every chunk: an interrupted sync continues where it stopped
+            state["last_review_id"] = last_id
+            state["rows"] += table.num_rows
+            self._save_state(state)
+        self._save_state(state)
+        return {"exported": exported, "last_review_id": state["last_review_id"], "root": self.root}
+
+    def _clear(self):
+        """
+        Removes a previous export: only the partition directories and the state file, and only
+        when the state file proves the root is an export (`--root` may point anywhere).
+        """
+        state_path = os.path.join(self.root, _STATE_FILE)
+        if not os.path.isfile(state_path):
+            return
+        for partition in glob.glob(os.path.join(glob.escape(self.root), "product_id=*")):
+            if os.path.isdir(partition) and not os.path.islink(partition):
+                shutil.rmtree(partition)
+        os.remove(state_path)
+
+    @staticmethod
+    def _read_chunks(db: DatabaseManager, after_id: int, chunk_size: int) -> Iterable["pa.Table"]:
+        schema = review_schema()
+        while True:
+            # One short read per chunk, so the shared connection is not held during the write
+            rows = db.get_review_rows_after(after_id, chunk_size)
+            if not rows:
+                return
+            (review_ids, comment_ids, product_ids, created_at, satisfied,
+             scores, reasons, scored_by, cluster_ids) = zip(*rows)
+            created = pc.strptime(pa.array(created_at, pa.string()), format="%Y-%m-%d %H:%M:%S", unit="ms")
+            yield pa.Table.from_arrays([
+                pa.array(review_ids, pa.int64()),
+                pa.array(comment_ids, pa.int64()),
+                pa.array(product_ids, pa.int64()),
+                pc.utf8_slice_codeunits(pa.array(created_at, pa.string()), 0, 7),
+                created,
+                pa.array([bool(value) for value in satisfied], pa.bool_()),
+                pa.array(scores, pa.int8()),
+                pa.array(reasons, pa.string()).dictionary_encode(),
+                pa.array(scored_by, pa.string()).dictionary_encode().cast(schema.field("scored_by").type),
+                pa.array(cluster_ids, pa.string()),
+            ], schema=schema)
+            after_id = review_ids[-1]
+
+    def dataset(self) -> "ds.Dataset":
+        """The exported reviews as a pyarrow dataset (files are memory-mapped, not read eagerly)."""
+        # Only the export's own partition files: the root may also hold unrelated files
+        files = sorted(glob.glob(os.path.join(glob.escape(self.root), "product_id=*", "month=*",
+                                              f"part-*.{self.file_format}")))
+        return ds.dataset(
+            files, schema=review_schema(), format=FORMATS[self.file_format], partitioning=_partitioning(),
+            partition_base_dir=self.root, filesystem=pafs.LocalFileSystem(use_mmap=True),
+        )
+
+    @staticmethod
+    def _filter(product_ids: Iterable[int] = None, since: str = None, until: str = None) -> Optional["ds.Expression"]:
+        """Partition filter: products and an inclusive "YYYY-MM" month range."""
+        expression = None
+        conditions = []
+        if product_ids is not None:
+            conditions.append(ds.field("product_id").isin(list(product_ids)))
+        if since:
+            conditions.append(ds.field("month") >= since)
+        if until:
+            conditions.append(ds.field("month") <= until)
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+        return expression
+
+    def _grouped(self, keys: List[str], aggregations: List[Tuple[str, str]], product_ids: Iterable[int] = None,
+                 since: str = None, until: str = None) -> Dict[tuple, List[float]]:
+        """
+        Streams record batches of only the needed columns and reduces each with a hash
+        aggregation; the running totals are one entry per group, never per row.
+        """
+        columns = list(dict.fromkeys(keys + [column for column, _ in aggregations]))
+        totals: Dict[tuple, List[float]] = {}
+        if not os.path.isdir(self.root):
+            return totals  # nothing exported yet
+        scanner = self.dataset().scanner(columns=columns, filter=self._filter(product_ids, since, until))
+        for batch in scanner.to_batches():
+            if not batch.num_rows:
+                continue
+            grouped = pa.Table.from_batches([batch]).group_by(keys).aggregate(aggregations).to_pydict()
+            names = [f"{column}_{function}" for column, function in aggregations]
+            for position, key in enumerate(zip(*(grouped[name] for name in keys))):
+                values = [grouped[name][position] for name in names]
+                current = totals.get(key)
+                totals[key] = values if current is None else [a + b for a, b in zip(current, values)]
+        return totals
+
+    @timed("columnar.summaries")
+    def summaries(self, product_ids: Iterable[int] = None, since: str = None,
+                  until: str = None) -> Dict[int, Dict[str, Any]]:
+        """
+        NPS, score histogram and satisfaction counts of many products in one pass (same shape as
+        DatabaseManager.get_product_summary), optionally limited to a "YYYY-MM" month range.
+        """
+        totals = self._grouped(
+            ["product_id", "estimated_score"], [("is_satisfied", "sum"), ("is_satisfied", "count")],
+            product_ids, since, until,
+        )
+        per_product: Dict[int, Dict[str, Any]] = {}
+        for (product_id, score), (satisfied, count) in totals.items():
+            entry = per_product.setdefault(product_id, {"histogram": {s: 0 for s in range(1, 11)},
+                                                        "satisfied": 0, "total": 0})
+            # Out-of-range scores count towards the total but have no histogram bucket
+            if score in entry["histogram"]:
+                entry["histogram"][score] += count
+            entry["satisfied"] += satisfied
+            entry["total"] += count
+        return {
+            product_id: DatabaseManager._build_summary(product_id, entry["histogram"], entry["satisfied"], entry["total"])
+            for product_id, entry in sorted(per_product.items())
+        }
+
+    @timed("columnar.top_reasons")
+    def top_reasons(self, product_ids: Iterable[int] = None, limit: int = 5, since: str = None,
+                    until: str = None) -> Dict[int, List[Dict[str, Any]]]:
+        """Most frequent satisfied/dissatisfied reasons per product."""
+        totals = self._grouped(
+            ["product_id", "reason", "is_satisfied"], [("estimated_score", "count")], product_ids, since, until,
+        )
+        ranked: Dict[int, List[Dict[str, Any]]] = {}
+        for (product_id, reason, satisfied), (count,) in totals.items():
+            if reason:
+                ranked.setdefault(product_id, []).append({"reason": reason, "is_satisfied": satisfied, "count": count})
+        return {
+            product_id: sorted(rows, key=lambda row: row["count"], reverse=True)[:limit]
+            for product_id, rows in sorted(ranked.items())
+        }
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Columnar (Parquet/Arrow) export and analytics of the reviews database.")
+    parser.add_argument("command", choices=["sync", "report"],
+                        help="sync: export reviews added since the last sync; report: NPS per product from the export")
+    parser.add_argument("--db", default="database/reviews.db", help="Path to the SQLite database")
+    parser.add_argument("--root", default="database/columnar", help="Directory of the partitioned dataset")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet", help="File format of the export")
+    parser.add_argument("--rebuild", action="store_true", help="Re-export everything instead of appending")
+    parser.add_argument("--products", type=int, nargs="*", help="Limit the report to these product IDs")
+    parser.add_argument("--since", help="First month of the report (YYYY-MM)")
+    parser.add_argument("--until", help="Last month of the report (YYYY-MM)")
+    args = parser.parse_args()
+
+    store = ColumnarStore(args.root, args.format)
+    if args.command == "sync":
+        manager = DatabaseManager(args.db)
+        result = store.sync(manager, rebuild=args.rebuild)
+        manager.close()
+        print(f"✅ Exported {result['exported']} reviews to {result['root']} (up to review #{result['last_review_id']}).")
+    else:
+        for product_id, summary in store.summaries(args.products, args.since, args.until).items():
+            print(f"{product_id}: NPS {summary['nps']} over {summary['total']} reviews "
+                  f"({summary['satisfied']} satisfied)")
@@ -4,8 +4,48 @@ from src.exceptions import MissingConfigurationError
 
 load_dotenv()
 
-AVALAI_API_KEY = os.getenv("AVALAI_API_KEY")
-if not AVALAI_API_KEY:
-    raise MissingConfigurationError("AVALAI_API_KEY is not set in the .env file.")
+def get_api_key() -> str:
+    """
+    The LLM API key, checked when it is first needed (CommentAnalyzer construction) rather than
+    at import, so DB-only and crawl-only tools run without one.
+    """
+    api_key = os.getenv("AVALAI_API_KEY")
+    if not api_key:
+        raise MissingConfigurationError("AVALAI_API_KEY is not set in the .env file.")
+    return api_key
 
-API_BASE_URL = "https://api.avalai.ir/v1"
\ No newline at end of file
+# Endpoints (overridable so that benchmarks can point them at local stand-ins)
+API_BASE_URL = os.getenv("LLM_API_BASE_URL", "https://api.avalai.ir/v1")
+DIGIKALA_API_BASE_URL = os.getenv("DIGIKALA_API_BASE_URL", "https://api.digikala.com/v1")
+
+# LLM throughput settings (concurrent analysis engine)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "120"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "90000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BATCH_MODE = os.getenv("LLM_BATCH_MODE", "false").lower() in ("1", "true", "yes")
+
+# Local lexicon fast path: obvious comments are scored on CPU and never reach the LLM
+LEXICON_PRECLASSIFIER = os.getenv("LEXICON_PRECLASSIFIER", "false").lower() in ("1", "true", "yes")
+LEXICON_CONFIDENCE_THRESHOLD = float(os.getenv("LEXICON_CONFIDENCE_THRESHOLD", "0.85"))
+
+# Near-duplicate clustering: one LLM call per group of (almost) identical comments
+NEAR_DUPLICATE_CLUSTERING = os.getenv("NEAR_DUPLICATE_CLUSTERING", "false").lower() in ("1", "true", "yes")
+NEAR_DUPLICATE_MIN_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_MIN_SIMILARITY", "0.9"))
+
+# Sampling of the pipeline: reservoir (fixed 100 of >= 200), stratified or adaptive
+PIPELINE_SAMPLING = os.getenv("PIPELINE_SAMPLING", "reservoir").lower()
+# Adaptive sampling stops once the NPS confidence interval is at most this many points wide
+ADAPTIVE_TARGET_WIDTH = float(os.getenv("ADAPTIVE_TARGET_WIDTH", "25"))
+ADAPTIVE_MIN_SAMPLE = int(os.getenv("ADAPTIVE_MIN_SAMPLE", "30"))
+ADAPTIVE_BATCH_SIZE = int(os.getenv("ADAPTIVE_BATCH_SIZE", "10"))
+NPS_CONFIDENCE = float(os.getenv("NPS_CONFIDENCE", "0.95"))
+
+# Streamlit app: pipeline jobs run in the background on this many worker threads
+APP_JOB_WORKERS = int(os.getenv("APP_JOB_WORKERS", "2"))
+
+# Crawler settings
+CRAWLER_MAX_CONCURRENCY = int(os.getenv("CRAWLER_MAX_CONCURRENCY", "6"))
+CRAWLER_MAX_RETRIES = int(os.getenv("CRAWLER_MAX_RETRIES", "3"))
+# Upper bound of comments read per product (sampling keeps memory flat regardless)
+CRAWLER_MAX_COMMENTS = int(os.getenv("CRAWLER_MAX_COMMENTS", "200"))
\ No newline at end of file
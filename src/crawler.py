@@ -1,74 +1,173 @@
-import requests
-import random
-from typing import List, Dict, Any
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator
+from src.config import CRAWLER_MAX_CONCURRENCY, CRAWLER_MAX_RETRIES, CRAWLER_MAX_COMMENTS, DIGIKALA_API_BASE_URL
+from src.sampling import ReservoirSampler
 from src.exceptions import CrawlerError
+from src.metrics import timed, inc
 
 class DigikalaCrawler:
     """
-    Crawler designed to interact with Digikala's public API to fetch 
+    Crawler designed to interact with Digikala's public API to fetch
     product comments and perform random sampling for unbiased analysis.
     """
-    def __init__(self):
+    def __init__(self, max_concurrency: int = None, max_retries: int = None, max_comments: int = None,
+                 api_base_url: str = None):
         # Base URL for Digikala's product comments API
-        self.base_url = "https://api.digikala.com/v1/product/{}/comments/"
+        self.api_base_url = (api_base_url or DIGIKALA_API_BASE_URL).rstrip("/")
+        self.base_url = self.api_base_url + "/product/{}/comments/"
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
         }
+        self.max_concurrency = max_concurrency or CRAWLER_MAX_CONCURRENCY
+        self.max_retries = CRAWLER_MAX_RETRIES if max_retries is None else max_retries
+        self.max_comments = max_comments or CRAWLER_MAX_COMMENTS
+        self.timeout = 10
+        self.session = self._build_session()
 
+    def _build_session(self) -> "requests.Session":
+        """
+        Keep-alive session shared by all page requests. The adapter's pool size (with blocking)
+        caps the number of simultaneous connections per host; 429/5xx responses and timeouts are
+        retried with exponential backoff (honouring Retry-After).
+        """
+        # Imported here so that importing the module (e.g. through src.batch) stays cheap
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        retry = Retry(
+            total=self.max_retries,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.max_concurrency, pool_block=True, max_retries=retry)
+
+        session = requests.Session()
+        session.headers.update(self.headers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @timed("crawl.fetch_comments")
     def fetch_comments(self, product_id: int) -> List[str]:
         """
-        Fetches up to 200 comments for a given product ID, then applies the sampling logic.
+        Fetches up to `max_comments` (200 by default) comments for a given product ID,
+        then applies the sampling logic (see ReservoirSampler).
         """
-        all_comments = []
-        page = 1
-        
+        sampler = ReservoirSampler()
+        for comment in self.iter_comments(product_id):
+            sampler.add(comment["body"])
+
+        sampled = sampler.sample()
+        if sampled:
+            print(f"📊 Crawler Stats: Fetched {sampler.seen} valid comments. Randomly sampled {len(sampled)} for analysis.")
+        return sampled
+
+    def iter_comments(self, product_id: int, stop_at_id: int = None) -> Iterator[Dict[str, Any]]:
+        """Yields valid comments ({"id", "body"}) one by one, in page order, as pages arrive."""
+        for page_comments in self.iter_pages(product_id, stop_at_id):
+            yield from page_comments
+
+    def iter_pages(self, product_id: int, stop_at_id: int = None) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yields the valid comments of each page, in page order, as soon as that page is available.
+        Page 1 is fetched first to learn the page count; the remaining pages are then fetched
+        concurrently in waves sized to reach `max_comments`.
+
+        Incremental mode: with `stop_at_id` (a product's watermark), comments with an id at or
+        below it are dropped, and paging stops at the first page that contains any of them,
+        since the API lists newest comments first and everything after that point is already known.
+        """
+        yielded = 0
+
+        def is_new(comment: Dict[str, Any]) -> bool:
+            return stop_at_id is None or comment["id"] is None or comment["id"] > stop_at_id
+
+        def reached_known(data: Dict[str, Any]) -> bool:
+            if stop_at_id is None:
+                return False
+            return any(isinstance(c.get("id"), int) and c["id"] <= stop_at_id for c in data.get("comments") or [])
+
         try:
-            while len(all_comments) < 200:
-                url = self.base_url.format(product_id) + f"?page={page}"
-                response = requests.get(url, headers=self.headers, timeout=10)
-                
-                if response.status_code != 200:
-                    break
-                    
-                data = response.json()
-                comments_data = data.get("data", {}).get("comments", [])
-                
-                # If no more comments are available on this page
-                if not comments_data:
-                    break
-                    
-                for comment in comments_data:
-                    body = comment.get("body")
-                    if body and len(body.strip()) > 5: # Ignore very short/empty comments
-                        all_comments.append(body.strip())
-                        
-                    if len(all_comments) == 200:
+            first_page = self._fetch_page(product_id, 1)
+            if first_page is None:
+                return
+
+            page_comments = [c for c in self._extract_comments(first_page) if is_new(c)][:self.max_comments]
+            yielded += len(page_comments)
+            yield page_comments
+            exhausted = not first_page.get("comments") or reached_known(first_page)
+
+            pager = first_page.get("pager", {}) or {}
+            total_pages = int(pager.get("total_pages") or 0)
+            page_size = max(1, len(first_page.get("comments") or []))
+            next_page = 2
+
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+                while yielded < self.max_comments and not exhausted:
+                    # Without a pager we cannot know how far to go: fall back to one page at a time
+                    remaining_pages = total_pages - next_page + 1 if total_pages else 1
+                    if remaining_pages <= 0:
                         break
-                        
-                page += 1
 
-            return self._sample_comments(all_comments)
+                    pages_needed = math.ceil((self.max_comments - yielded) / page_size)
+                    wave = range(next_page, next_page + min(pages_needed, remaining_pages))
+
+                    # map() returns results in page order regardless of completion order
+                    for data in pool.map(lambda page: self._fetch_page(product_id, page), wave):
+                        # If no more comments are available on this page
+                        if not data or not data.get("comments"):
+                            exhausted = True
+                            break
+
+                        page_comments = [c for c in self._extract_comments(data) if is_new(c)]
+                        page_comments = page_comments[:self.max_comments - yielded]
+                        yielded += len(page_comments)
+                        yield page_comments
+                        if yielded >= self.max_comments:
+                            break
+                        if reached_known(data):
+                            # Everything beyond this page was collected by an earlier run
+                            exhausted = True
+                            break
+
+                    next_page = wave.stop
 
+        except CrawlerError:
+            raise
         except Exception as e:
             raise CrawlerError(f"Failed to crawl Digikala API: {str(e)}") from e
 
-    def _sample_comments(self, comments: List[str]) -> List[str]:
-        """
-        Applies the specific sampling business logic:
-        - If >= 200 comments: Randomly select 100.
-        - If < 200 comments: Randomly select all.
-        """
-        total_fetched = len(comments)
-        if total_fetched == 0:
-            return []
-            
-        if total_fetched >= 200:
-            sample_size = 100
-        else:
-            sample_size = total_fetched
-            # Ensure at least 1 comment is selected if there are any
-            sample_size = max(1, sample_size)
-            
-        sampled = random.sample(comments, sample_size)
-        print(f"📊 Crawler Stats: Fetched {total_fetched} valid comments. Randomly sampled {sample_size} for analysis.")
-        return sampled
\ No newline at end of file
+    def fetch_product_title(self, product_id: int) -> str:
+        """Persian title of a product, or a placeholder when it cannot be fetched."""
+        try:
+            response = self.session.get(f"{self.api_base_url}/product/{product_id}/", timeout=5)
+            if response.status_code == 200:
+                return response.json().get("data", {}).get("product", {}).get("title_fa", "Unknown Product")
+        except Exception:
+            pass
+        return f"Product #{product_id}"
+
+    @timed("crawl.page")
+    def _fetch_page(self, product_id: int, page: int) -> Optional[Dict[str, Any]]:
+        """Fetches one page of comments; returns the response's `data` object or None on a non-200 status."""
+        url = self.base_url.format(product_id)
+        response = self.session.get(url, params={"page": page}, timeout=self.timeout)
+
+        inc("crawl_pages")
+        if response.status_code != 200:
+            inc("crawl_http_errors", status=response.status_code)
+            return None
+        return response.json().get("data", {})
+
+    @staticmethod
+    def _extract_comments(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        comments = []
+        for comment in data.get("comments", []) or []:
+            body = comment.get("body")
+            if body and len(body.strip()) > 5: # Ignore very short/empty comments
+                comments.append({"id": comment.get("id"), "body": body.strip()})
+        return comments
\ No newline at end of file
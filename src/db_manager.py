@@ -1,26 +1,72 @@
 import sqlite3
 import os
-from typing import List, Dict, Any
+import queue
+import threading
+import uuid
+from datetime import date, timedelta
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Iterable, Set, Tuple, Callable
 from src.exceptions import DatabaseError
+from src.text_utils import content_hash
+from src.metrics import timed
+from src.sampling import nps_confidence_interval
+from src.validation import validate_review
 
 class DatabaseManager:
     """
     Handles SQLite database connections, table creation, and CRUD operations.
     Ensures data persistence without needing an external database server.
+
+    A single long-lived connection (WAL journal, relaxed fsync) is shared by all threads;
+    access is serialized by a lock, so one manager can safely serve a whole pipeline.
+    """
+    _INSERT_REVIEW_QUERY = """
+    INSERT OR IGNORE INTO product_reviews
+        (product_id, raw_comment, is_satisfied, reason, estimated_score, comment_id, content_hash, scored_by, cluster_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
     """
+
     def __init__(self, db_path: str = "database/reviews.db"):
         # Ensure the database directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.db_path = db_path
+        self._lock = threading.RLock()
+        self._connection = self._connect()
         self._initialize_database()
 
-    def _get_connection(self):
-        """Creates and returns a connection to the SQLite database."""
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the shared connection and applies the performance pragmas."""
         try:
-            return sqlite3.connect(self.db_path)
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            # WAL lets readers run alongside the writer; NORMAL only fsyncs at checkpoints,
+            # which is still crash-safe in WAL mode
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA cache_size=-20000")  # ~20 MB page cache
+            conn.execute("PRAGMA temp_store=MEMORY")
+            return conn
         except Exception as e:
             raise DatabaseError(f"Failed to connect to database at {self.db_path}: {e}")
 
+    @contextmanager
+    def _get_connection(self):
+        """
+        Yields the shared connection inside a transaction (committed on success,
+        rolled back on error) while holding the lock.
+        """
+        with self._lock:
+            if self._connection is None:
+                raise DatabaseError(f"Database connection to {self.db_path} is closed.")
+            with self._connection as conn:
+                yield conn
+
+    def close(self):
+        """Closes the shared connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
     def _initialize_database(self):
         """Creates the necessary tables if they don't already exist."""
         query = """
@@ -31,46 +77,1007 @@ class DatabaseManager:
             is_satisfied BOOLEAN NOT NULL,
             reason TEXT,
             estimated_score INTEGER NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            comment_id INTEGER,
+            content_hash TEXT,
+            scored_by TEXT NOT NULL DEFAULT 'llm',
+            cluster_id TEXT
+        );
+        """
+        watermark_query = """
+        CREATE TABLE IF NOT EXISTS crawl_watermarks (
+            product_id INTEGER PRIMARY KEY,
+            last_comment_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(query)
-                conn.commit()
+                cursor.execute(watermark_query)
+                self._migrate_review_identity(cursor)
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(product_reviews)")}
+                if "scored_by" not in columns:
+                    # Rows stored before the lexicon fast path existed were all scored by the LLM
+                    cursor.execute("ALTER TABLE product_reviews ADD COLUMN scored_by TEXT NOT NULL DEFAULT 'llm'")
+                if "cluster_id" not in columns:
+                    cursor.execute("ALTER TABLE product_reviews ADD COLUMN cluster_id TEXT")
+                # Covering index: per-product counts and histograms never touch the table itself
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_reviews_product_score
+                    ON product_reviews (product_id, estimated_score, is_satisfied)
+                """)
+                self._initialize_product_stats(cursor)
+                self._initialize_daily_stats(cursor)
+                self._initialize_pipeline_runs(cursor)
         except Exception as e:
             raise DatabaseError(f"Failed to initialize database tables: {e}")
 
-    def insert_review(self, product_id: int, raw_comment: str, ai_data: Dict[str, Any]):
-        """Inserts a single AI-analyzed review into the database."""
-        query = """
-        INSERT INTO product_reviews (product_id, raw_comment, is_satisfied, reason, estimated_score)
-        VALUES (?, ?, ?, ?, ?)
+    def _initialize_pipeline_runs(self, cursor: sqlite3.Cursor):
+        """
+        Creates the checkpoint tables of StreamingPipeline: one `pipeline_runs` row per run and
+        its sampled comments in `pipeline_run_items` with a pending/analyzed/failed status,
+        so an interrupted run can be resumed without re-crawling or re-sampling. Adaptive runs
+        also keep their not yet drawn candidates there, as 'candidate' items.
+        """
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_runs (
+                run_id TEXT PRIMARY KEY,
+                product_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                sampling TEXT,
+                fetched INTEGER NOT NULL DEFAULT 0,
+                sampled INTEGER NOT NULL DEFAULT 0,
+                newest_comment_id INTEGER,
+                error TEXT,
+                nps_low REAL,
+                nps_high REAL,
+                stop_reason TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(pipeline_runs)")}
+        for column, column_type in (("nps_low", "REAL"), ("nps_high", "REAL"), ("stop_reason", "TEXT")):
+            if column not in columns:
+                cursor.execute(f"ALTER TABLE pipeline_runs ADD COLUMN {column} {column_type}")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS pipeline_run_items (
+                run_id TEXT NOT NULL REFERENCES pipeline_runs(run_id),
+                item_index INTEGER NOT NULL,
+                comment_id INTEGER,
+                raw_comment TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                error TEXT,
+                PRIMARY KEY (run_id, item_index)
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_pipeline_runs_product
+            ON pipeline_runs (product_id, status)
+        """)
+
+    def _initialize_product_stats(self, cursor: sqlite3.Cursor):
+        """
+        Creates the `product_stats` rollup (one row per product) and the triggers that keep it
+        in sync. Triggers run inside the statement that changes `product_reviews`, so the rollup
+        is always updated in the same transaction as insert_review / insert_reviews_bulk.
+        """
+        score_columns = ",\n".join(f"score_{score} INTEGER NOT NULL DEFAULT 0" for score in range(1, 11))
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS product_stats (
+                product_id INTEGER PRIMARY KEY,
+                {score_columns},
+                satisfied INTEGER NOT NULL DEFAULT 0,
+                dissatisfied INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        apply = self._stats_delta
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_product_stats_insert AFTER INSERT ON product_reviews
+            BEGIN
+                INSERT OR IGNORE INTO product_stats (product_id) VALUES (NEW.product_id);
+                UPDATE product_stats SET {apply("NEW", "+")} WHERE product_id = NEW.product_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_product_stats_delete AFTER DELETE ON product_reviews
+            BEGIN
+                UPDATE product_stats SET {apply("OLD", "-")} WHERE product_id = OLD.product_id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_product_stats_update
+            AFTER UPDATE OF product_id, estimated_score, is_satisfied ON product_reviews
+            BEGIN
+                UPDATE product_stats SET {apply("OLD", "-")} WHERE product_id = OLD.product_id;
+                INSERT OR IGNORE INTO product_stats (product_id) VALUES (NEW.product_id);
+                UPDATE product_stats SET {apply("NEW", "+")} WHERE product_id = NEW.product_id;
+            END
+        """)
+
+        # Databases created before the rollup existed are backfilled once
+        has_stats = cursor.execute("SELECT 1 FROM product_stats LIMIT 1").fetchone()
+        has_reviews = cursor.execute("SELECT 1 FROM product_reviews LIMIT 1").fetchone()
+        if has_reviews and not has_stats:
+            self._rebuild_product_stats(cursor)
+
+    @staticmethod
+    def _stats_delta(row: str, sign: str) -> str:
+        """SET clause adding (sign='+') or removing (sign='-') one review row (NEW/OLD) from a rollup."""
+        scores = ", ".join(f"score_{score} = score_{score} {sign} ({row}.estimated_score = {score})" for score in range(1, 11))
+        return (
+            f"{scores}, satisfied = satisfied {sign} ({row}.is_satisfied != 0), "
+            f"dissatisfied = dissatisfied {sign} ({row}.is_satisfied = 0), "
+            f"total = total {sign} 1, last_updated = CURRENT_TIMESTAMP"
+        )
+
+    def _initialize_daily_stats(self, cursor: sqlite3.Cursor):
+        """
+        Creates `product_daily_stats`, the same counters as `product_stats` per product and day
+        of `created_at`, kept in sync by triggers. Trends over any window are summed from these
+        rows (a few hundred per product-year) instead of scanning the reviews.
+        """
+        score_columns = ",\n".join(f"score_{score} INTEGER NOT NULL DEFAULT 0" for score in range(1, 11))
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS product_daily_stats (
+                product_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                {score_columns},
+                satisfied INTEGER NOT NULL DEFAULT 0,
+                dissatisfied INTEGER NOT NULL DEFAULT 0,
+                total INTEGER NOT NULL DEFAULT 0,
+                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (product_id, day)
+            ) WITHOUT ROWID
+        """)
+
+        apply = self._stats_delta
+        day = "COALESCE(date({row}.created_at), date('now'))"
+        new_day, old_day = day.format(row="NEW"), day.format(row="OLD")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_insert AFTER INSERT ON product_reviews
+            BEGIN
+                INSERT OR IGNORE INTO product_daily_stats (product_id, day) VALUES (NEW.product_id, {new_day});
+                UPDATE product_daily_stats SET {apply("NEW", "+")} WHERE product_id = NEW.product_id AND day = {new_day};
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_delete AFTER DELETE ON product_reviews
+            BEGIN
+                UPDATE product_daily_stats SET {apply("OLD", "-")} WHERE product_id = OLD.product_id AND day = {old_day};
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_daily_stats_update
+            AFTER UPDATE OF product_id, estimated_score, is_satisfied, created_at ON product_reviews
+            BEGIN
+                UPDATE product_daily_stats SET {apply("OLD", "-")} WHERE product_id = OLD.product_id AND day = {old_day};
+                INSERT OR IGNORE INTO product_daily_stats (product_id, day) VALUES (NEW.product_id, {new_day});
+                UPDATE product_daily_stats SET {apply("NEW", "+")} WHERE product_id = NEW.product_id AND day = {new_day};
+            END
+        """)
+
+        # Databases created before the daily rollup existed are backfilled once
+        has_daily = cursor.execute("SELECT 1 FROM product_daily_stats LIMIT 1").fetchone()
+        has_reviews = cursor.execute("SELECT 1 FROM product_reviews LIMIT 1").fetchone()
+        if has_reviews and not has_daily:
+            self._rebuild_daily_stats(cursor)
+
+    def _rebuild_product_stats(self, cursor: sqlite3.Cursor):
+        score_sums = ", ".join(f"SUM(estimated_score = {score})" for score in range(1, 11))
+        score_columns = ", ".join(f"score_{score}" for score in range(1, 11))
+        cursor.execute("DELETE FROM product_stats")
+        cursor.execute(f"""
+            INSERT INTO product_stats (product_id, {score_columns}, satisfied, dissatisfied, total, last_updated)
+            SELECT product_id, {score_sums}, SUM(is_satisfied != 0), SUM(is_satisfied = 0), COUNT(*), CURRENT_TIMESTAMP
+            FROM product_reviews
+            GROUP BY product_id
+        """)
+
+    def _rebuild_daily_stats(self, cursor: sqlite3.Cursor):
+        score_sums = ", ".join(f"SUM(estimated_score = {score})" for score in range(1, 11))
+        score_columns = ", ".join(f"score_{score}" for score in range(1, 11))
+        cursor.execute("DELETE FROM product_daily_stats")
+        cursor.execute(f"""
+            INSERT INTO product_daily_stats (product_id, day, {score_columns}, satisfied, dissatisfied, total, last_updated)
+            SELECT product_id, COALESCE(date(created_at), date('now')) AS review_day, {score_sums},
+                   SUM(is_satisfied != 0), SUM(is_satisfied = 0), COUNT(*), CURRENT_TIMESTAMP
+            FROM product_reviews
+            GROUP BY product_id, review_day
+        """)
+
+    def rebuild_product_stats(self) -> int:
+        """
+        Recomputes the `product_stats` and `product_daily_stats` rollups from `product_reviews`.
+        Returns the number of products.
         """
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute(query, (
-                    product_id, 
-                    raw_comment, 
-                    ai_data.get("is_satisfied", False), 
-                    ai_data.get("reason", "نامشخص"), 
-                    ai_data.get("estimated_score", 5)
-                ))
-                conn.commit()
+                self._rebuild_product_stats(cursor)
+                self._rebuild_daily_stats(cursor)
+                return cursor.execute("SELECT COUNT(*) FROM product_stats").fetchone()[0]
+        except Exception as e:
+            raise DatabaseError(f"Failed to rebuild product stats: {e}")
+
+    def verify_product_stats(self) -> List[Dict[str, Any]]:
+        """
+        Consistency check: compares every rollup row (`product_stats` and `product_daily_stats`)
+        against a full scan of `product_reviews`. Returns one entry per product (and day, for the
+        daily rollup) whose counters differ (empty list means consistent).
+        """
+        counters = [f"score_{score}" for score in range(1, 11)] + ["satisfied", "dissatisfied", "total"]
+        score_sums = ", ".join(f"SUM(estimated_score = {score})" for score in range(1, 11))
+        scan_query = f"""
+            SELECT product_id, {score_sums}, SUM(is_satisfied != 0), SUM(is_satisfied = 0), COUNT(*)
+            FROM product_reviews GROUP BY product_id
+        """
+        rollup_query = f"SELECT product_id, {', '.join(counters)} FROM product_stats WHERE total != 0"
+        daily_scan_query = f"""
+            SELECT product_id, COALESCE(date(created_at), date('now')) AS review_day, {score_sums},
+                   SUM(is_satisfied != 0), SUM(is_satisfied = 0), COUNT(*)
+            FROM product_reviews GROUP BY product_id, review_day
+        """
+        daily_rollup_query = f"SELECT product_id, day, {', '.join(counters)} FROM product_daily_stats WHERE total != 0"
+        try:
+            with self._get_connection() as conn:
+                scanned = {row[0]: row[1:] for row in conn.execute(scan_query)}
+                rolled_up = {row[0]: row[1:] for row in conn.execute(rollup_query)}
+                daily_scanned = {row[:2]: row[2:] for row in conn.execute(daily_scan_query)}
+                daily_rolled_up = {row[:2]: row[2:] for row in conn.execute(daily_rollup_query)}
+        except Exception as e:
+            raise DatabaseError(f"Failed to verify product stats: {e}")
+
+        mismatches = []
+        for product_id in sorted(set(scanned) | set(rolled_up)):
+            expected = dict(zip(counters, scanned.get(product_id, (0,) * len(counters))))
+            actual = dict(zip(counters, rolled_up.get(product_id, (0,) * len(counters))))
+            if expected != actual:
+                mismatches.append({"product_id": product_id, "expected": expected, "actual": actual})
+        for product_id, day in sorted(set(daily_scanned) | set(daily_rolled_up)):
+            expected = dict(zip(counters, daily_scanned.get((product_id, day), (0,) * len(counters))))
+            actual = dict(zip(counters, daily_rolled_up.get((product_id, day), (0,) * len(counters))))
+            if expected != actual:
+                mismatches.append({"product_id": product_id, "day": day, "expected": expected, "actual": actual})
+        return mismatches
+
+    def _migrate_review_identity(self, cursor: sqlite3.Cursor):
+        """
+        Upgrades databases created before comment de-duplication existed: adds the identity
+        columns, fingerprints legacy rows and enforces uniqueness. Nothing is deleted: of the
+        duplicates legacy rows accumulated, the oldest row gets the fingerprint and the others
+        keep content_hash NULL (NULLs never collide in a unique index) until `dedupe_reviews`
+        removes them.
+        """
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(product_reviews)")}
+        if "comment_id" not in columns:
+            cursor.execute("ALTER TABLE product_reviews ADD COLUMN comment_id INTEGER")
+        if "content_hash" not in columns:
+            cursor.execute("ALTER TABLE product_reviews ADD COLUMN content_hash TEXT")
+
+        migrated = cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'ux_reviews_product_hash'"
+        ).fetchone()
+        if not migrated:
+            legacy_rows = cursor.execute(
+                "SELECT id, product_id, raw_comment FROM product_reviews WHERE content_hash IS NULL ORDER BY id"
+            ).fetchall()
+            fingerprinted = set()
+            updates = []
+            for row_id, product_id, raw_comment in legacy_rows:
+                key = (product_id, content_hash(raw_comment))
+                if key not in fingerprinted:
+                    fingerprinted.add(key)
+                    updates.append((key[1], row_id))
+            cursor.executemany("UPDATE product_reviews SET content_hash = ? WHERE id = ?", updates)
+            duplicates = len(legacy_rows) - len(updates)
+            if duplicates:
+                print(f"ℹ️ Kept {duplicates} legacy duplicate reviews; "
+                      f"run `python -m src.db_manager dedupe` to review and remove them.")
+
+        # Rows with a Digikala id are unique per id (two customers may legitimately write the same text);
+        # rows without one fall back to their content fingerprint
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_reviews_product_comment
+            ON product_reviews (product_id, comment_id) WHERE comment_id IS NOT NULL
+        """)
+        cursor.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS ux_reviews_product_hash
+            ON product_reviews (product_id, content_hash) WHERE comment_id IS NULL
+        """)
+
+    def find_duplicate_reviews(self) -> List[Dict[str, Any]]:
+        """
+        Legacy rows left unfingerprinted by the identity migration whose text is already stored
+        for the same product (the oldest copy keeps the fingerprint).
+        """
+        try:
+            with self._get_connection() as conn:
+                kept = set(conn.execute(
+                    "SELECT product_id, content_hash FROM product_reviews "
+                    "WHERE comment_id IS NULL AND content_hash IS NOT NULL"
+                ).fetchall())
+                candidates = conn.execute(
+                    "SELECT id, product_id, raw_comment FROM product_reviews "
+                    "WHERE comment_id IS NULL AND content_hash IS NULL ORDER BY id"
+                ).fetchall()
+        except Exception as e:
+            raise DatabaseError(f"Failed to look for duplicate reviews: {e}")
+        return [
+            {"id": row_id, "product_id": product_id, "raw_comment": raw_comment}
+            for row_id, product_id, raw_comment in candidates
+            if (product_id, content_hash(raw_comment)) in kept
+        ]
+
+    def dedupe_reviews(self, dry_run: bool = False) -> List[Dict[str, Any]]:
+        """Deletes the rows found by `find_duplicate_reviews` (unless `dry_run`) and returns them."""
+        duplicates = self.find_duplicate_reviews()
+        if dry_run or not duplicates:
+            return duplicates
+        try:
+            with self._get_connection() as conn:
+                # The rollup triggers keep product_stats and product_daily_stats in sync
+                conn.executemany("DELETE FROM product_reviews WHERE id = ?",
+                                 [(duplicate["id"],) for duplicate in duplicates])
+        except Exception as e:
+            raise DatabaseError(f"Failed to delete duplicate reviews: {e}")
+        return duplicates
+
+    @timed("db.insert_review")
+    def insert_review(self, product_id: int, raw_comment: str, ai_data: Dict[str, Any], comment_id: int = None,
+                      cluster_id: str = None) -> bool:
+        """
+        Inserts a single AI-analyzed review into the database.
+        Returns False (and stores nothing) if this comment is already stored for the product.
+        Raises DatabaseError if `ai_data` lacks a valid sentiment, reason or score.
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(self._INSERT_REVIEW_QUERY, self._review_params(product_id, raw_comment, ai_data, comment_id, cluster_id))
+                return cursor.rowcount > 0
         except Exception as e:
             raise DatabaseError(f"Failed to insert review into database: {e}")
 
+    @timed("db.insert_reviews_bulk")
+    def insert_reviews_bulk(self, reviews: Iterable[tuple], run_items: Iterable[Tuple[str, int]] = ()) -> int:
+        """
+        Inserts many (product_id, raw_comment, ai_data, comment_id[, cluster_id]) reviews with executemany
+        in a single transaction. Returns the number of rows actually stored (duplicates are skipped).
+        `run_items` ((run_id, item_index) pairs) are marked analyzed in the same transaction,
+        so a checkpoint never claims a review that was not stored.
+        """
+        try:
+            params = [self._review_params(*review) for review in reviews]
+        except ValueError as e:
+            raise DatabaseError(f"Refusing to store an incomplete review: {e}")
+        run_items = list(run_items)
+        if not params:
+            return 0
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(self._INSERT_REVIEW_QUERY, params)
+                stored = cursor.rowcount
+                if run_items:
+                    cursor.executemany(
+                        "UPDATE pipeline_run_items SET status = 'analyzed', error = NULL "
+                        "WHERE run_id = ? AND item_index = ?",
+                        run_items
+                    )
+                return stored
+        except Exception as e:
+            raise DatabaseError(f"Failed to bulk insert {len(params)} reviews into database: {e}")
+
+    @staticmethod
+    def _review_params(product_id: int, raw_comment: str, ai_data: Dict[str, Any], comment_id: int = None,
+                       cluster_id: str = None) -> tuple:
+        # No defaults for missing fields: a made-up score would silently bias the NPS
+        fields = validate_review(ai_data)
+        return (
+            product_id, 
+            raw_comment, 
+            fields["is_satisfied"], 
+            fields["reason"], 
+            fields["estimated_score"],
+            comment_id,
+            content_hash(raw_comment),
+            ai_data.get("scored_by", "llm"),
+            cluster_id
+        )
+
+    def get_known_comment_ids(self, product_id: int, comment_ids: Iterable[int]) -> Set[int]:
+        """Returns the subset of `comment_ids` that is already stored for this product."""
+        ids = [comment_id for comment_id in comment_ids if comment_id is not None]
+        if not ids:
+            return set()
+
+        known = set()
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(ids), 500):
+                    chunk = ids[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor.execute(
+                        f"SELECT comment_id FROM product_reviews WHERE product_id = ? AND comment_id IN ({placeholders})",
+                        (product_id, *chunk)
+                    )
+                    known.update(row[0] for row in cursor.fetchall())
+            return known
+        except Exception as e:
+            raise DatabaseError(f"Failed to look up stored comments for product {product_id}: {e}")
+
+    def get_watermark(self, product_id: int) -> Optional[int]:
+        """Newest Digikala comment id seen for a product by a completed crawl, or None."""
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(
+                    "SELECT last_comment_id FROM crawl_watermarks WHERE product_id = ?", (product_id,)
+                ).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            raise DatabaseError(f"Failed to read crawl watermark for product {product_id}: {e}")
+
+    def update_watermark(self, product_id: int, last_comment_id: int):
+        """Moves the product's watermark forward (never backwards)."""
+        query = """
+        INSERT INTO crawl_watermarks (product_id, last_comment_id, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(product_id) DO UPDATE SET
+            last_comment_id = MAX(last_comment_id, excluded.last_comment_id),
+            updated_at = CURRENT_TIMESTAMP
+        """
+        try:
+            with self._get_connection() as conn:
+                conn.execute(query, (product_id, last_comment_id))
+        except Exception as e:
+            raise DatabaseError(f"Failed to update crawl watermark for product {product_id}: {e}")
+
+    def create_run(self, product_id: int, sampling: str) -> str:
+        """Registers a new pipeline run and returns its id."""
+        run_id = uuid.uuid4().hex
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "INSERT INTO pipeline_runs (run_id, product_id, sampling) VALUES (?, ?, ?)",
+                    (run_id, product_id, sampling)
+                )
+            return run_id
+        except Exception as e:
+            raise DatabaseError(f"Failed to create pipeline run for product {product_id}: {e}")
+
+    def update_run(self, run_id: str, **fields: Any):
+        """
+        Updates a run's status/counters (status, fetched, sampled, newest_comment_id, error) and,
+        for adaptive runs, the sample's NPS interval and stop reason (nps_low, nps_high, stop_reason).
+        """
+        allowed = {"status", "fetched", "sampled", "newest_comment_id", "error", "nps_low", "nps_high", "stop_reason"}
+        unknown = set(fields) - allowed
+        if unknown:
+            raise ValueError(f"Unknown pipeline run fields: {sorted(unknown)}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    f"UPDATE pipeline_runs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE run_id = ?",
+                    (*fields.values(), run_id)
+                )
+        except Exception as e:
+            raise DatabaseError(f"Failed to update pipeline run {run_id}: {e}")
+
+    def add_run_items(self, run_id: str, items: Iterable[Tuple[int, Optional[int], str]], status: str = "pending"):
+        """Checkpoints sampled (item_index, comment_id, raw_comment) items as pending (or as adaptive candidates)."""
+        params = [(run_id, index, comment_id, raw_comment, status) for index, comment_id, raw_comment in items]
+        if not params:
+            return
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pipeline_run_items (run_id, item_index, comment_id, raw_comment, status) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    params
+                )
+        except Exception as e:
+            raise DatabaseError(f"Failed to checkpoint {len(params)} items of pipeline run {run_id}: {e}")
+
+    def draw_run_items(self, run_id: str, item_indexes: Iterable[int]):
+        """Moves adaptive candidates into the sample (candidate -> pending)."""
+        params = [(run_id, index) for index in item_indexes]
+        if not params:
+            return
+        try:
+            with self._get_connection() as conn:
+                conn.executemany(
+                    "UPDATE pipeline_run_items SET status = 'pending' "
+                    "WHERE run_id = ? AND item_index = ? AND status = 'candidate'",
+                    params
+                )
+        except Exception as e:
+            raise DatabaseError(f"Failed to draw {len(params)} items of pipeline run {run_id}: {e}")
+
+    def mark_run_item_failed(self, run_id: str, item_index: int, error: str):
+        try:
+            with self._get_connection() as conn:
+                conn.execute(
+                    "UPDATE pipeline_run_items SET status = 'failed', error = ? WHERE run_id = ? AND item_index = ?",
+                    (error, run_id, item_index)
+                )
+        except Exception as e:
+            raise DatabaseError(f"Failed to update item {item_index} of pipeline run {run_id}: {e}")
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """A run with its per-status item counts, or None if it does not exist."""
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                row = cursor.execute("SELECT * FROM pipeline_runs WHERE run_id = ?", (run_id,)).fetchone()
+                if row is None:
+                    return None
+                counts = dict(conn.execute(
+                    "SELECT status, COUNT(*) FROM pipeline_run_items WHERE run_id = ? GROUP BY status", (run_id,)
+                ).fetchall())
+        except Exception as e:
+            raise DatabaseError(f"Failed to read pipeline run {run_id}: {e}")
+
+        run = dict(row)
+        run["items"] = {status: counts.get(status, 0) for status in ("candidate", "pending", "analyzed", "failed")}
+        return run
+
+    def get_unfinished_run_items(self, run_id: str,
+                                 statuses: Tuple[str, ...] = ("pending", "failed")) -> List[Dict[str, Any]]:
+        """Pending and failed items of a run (or those with `statuses`), in their original sample order."""
+        placeholders = ", ".join("?" for _ in statuses)
+        query = f"""
+        SELECT item_index, comment_id, raw_comment FROM pipeline_run_items
+        WHERE run_id = ? AND status IN ({placeholders})
+        ORDER BY item_index
+        """
+        try:
+            with self._get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row
+                return [dict(row) for row in cursor.execute(query, (run_id, *statuses)).fetchall()]
+        except Exception as e:
+            raise DatabaseError(f"Failed to read items of pipeline run {run_id}: {e}")
+
+    def get_run_scores(self, run_id: str) -> List[int]:
+        """
+        Stored scores of a run's analyzed items, one per item (a comment stored once under
+        another item's identical text still counts for both), e.g. to rebuild an AdaptiveSampler.
+        """
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute("SELECT product_id FROM pipeline_runs WHERE run_id = ?", (run_id,)).fetchone()
+                if row is None:
+                    return []
+                hashes = [content_hash(raw_comment) for (raw_comment,) in conn.execute(
+                    "SELECT raw_comment FROM pipeline_run_items WHERE run_id = ? AND status = 'analyzed'", (run_id,)
+                )]
+                scores = {}
+                unique = list(set(hashes))
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(unique), 500):
+                    chunk = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    scores.update(conn.execute(
+                        f"SELECT content_hash, estimated_score FROM product_reviews "
+                        f"WHERE product_id = ? AND content_hash IN ({placeholders})",
+                        (row[0], *chunk)
+                    ).fetchall())
+        except Exception as e:
+            raise DatabaseError(f"Failed to read the scores of pipeline run {run_id}: {e}")
+        return [scores[text_hash] for text_hash in hashes if text_hash in scores]
+
+    def find_resumable_run(self, product_id: int, statuses: Tuple[str, ...] = ("running", "partial")) -> Optional[str]:
+        """
+        Latest run of a product that sampled comments but did not analyze all of them
+        (interrupted: 'running', or with failed items: 'partial'), or None. An interrupted
+        adaptive run with candidates left counts too.
+        """
+        placeholders = ", ".join("?" for _ in statuses)
+        query = f"""
+        SELECT r.run_id FROM pipeline_runs r
+        WHERE r.product_id = ? AND r.status IN ({placeholders})
+          AND EXISTS (
+              SELECT 1 FROM pipeline_run_items i WHERE i.run_id = r.run_id AND i.status != 'analyzed'
+          )
+        ORDER BY r.created_at DESC, r.rowid DESC
+        LIMIT 1
+        """
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(query, (product_id, *statuses)).fetchone()
+                return row[0] if row else None
+        except Exception as e:
+            raise DatabaseError(f"Failed to look up resumable runs for product {product_id}: {e}")
+
+    @timed("db.get_product_reviews")
     def get_product_reviews(self, product_id: int) -> List[Dict[str, Any]]:
         """Retrieves all stored reviews for a specific product."""
-        query = "SELECT is_satisfied, reason, estimated_score FROM product_reviews WHERE product_id = ?"
+        query = "SELECT is_satisfied, reason, estimated_score, scored_by, cluster_id FROM product_reviews WHERE product_id = ?"
         try:
             with self._get_connection() as conn:
-                conn.row_factory = sqlite3.Row  # Returns rows as dictionaries
                 cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row  # Returns rows as dictionaries
                 cursor.execute(query, (product_id,))
                 rows = cursor.fetchall()
                 return [dict(row) for row in rows]
         except Exception as e:
-            raise DatabaseError(f"Failed to fetch reviews for product {product_id}: {e}")
\ No newline at end of file
+            raise DatabaseError(f"Failed to fetch reviews for product {product_id}: {e}")
+
+    def get_max_review_id(self) -> int:
+        """
+        Highest review id. Ids only grow (AUTOINCREMENT), so it is an export watermark for new
+        reviews; deletions (`dedupe`) are detected with count_reviews_through.
+        """
+        try:
+            with self._get_connection() as conn:
+                return conn.execute("SELECT COALESCE(MAX(id), 0) FROM product_reviews").fetchone()[0]
+        except Exception as e:
+            raise DatabaseError(f"Failed to read the latest review id: {e}")
+
+    def count_reviews_through(self, review_id: int) -> int:
+        """Number of reviews with an id up to `review_id` (a range count over the primary key)."""
+        try:
+            with self._get_connection() as conn:
+                return conn.execute("SELECT COUNT(*) FROM product_reviews WHERE id <= ?", (review_id,)).fetchone()[0]
+        except Exception as e:
+            raise DatabaseError(f"Failed to count reviews up to id {review_id}: {e}")
+
+    def get_review_rows_after(self, after_id: int, limit: int) -> List[tuple]:
+        """
+        Up to `limit` reviews with an id above `after_id`, in id order, as plain tuples
+        (id, comment_id, product_id, created_at, is_satisfied, estimated_score, reason, scored_by, cluster_id).
+        Used for chunked exports (see src.columnar).
+        """
+        query = """
+        SELECT id, comment_id, product_id, created_at, is_satisfied, estimated_score, reason, scored_by, cluster_id
+        FROM product_reviews WHERE id > ? ORDER BY id LIMIT ?
+        """
+        try:
+            with self._get_connection() as conn:
+                return conn.execute(query, (after_id, limit)).fetchall()
+        except Exception as e:
+            raise DatabaseError(f"Failed to read reviews after id {after_id}: {e}")
+
+    @timed("db.get_product_summary")
+    def get_product_summary(self, product_id: int) -> Dict[str, Any]:
+        """
+        Aggregated view of a product's reviews read from the `product_stats` rollup (one row,
+        O(1) whatever the review volume): totals, satisfied/dissatisfied counts, the 1-10 score
+        histogram, NPS buckets and the NPS itself, with its 95% interval (see _sample_run).
+        """
+        score_columns = ", ".join(f"score_{score}" for score in range(1, 11))
+        query = f"SELECT {score_columns}, satisfied, total FROM product_stats WHERE product_id = ?"
+        try:
+            with self._get_connection() as conn:
+                row = conn.execute(query, (product_id,)).fetchone()
+                run = self._sample_run(conn, product_id)
+        except Exception as e:
+            raise DatabaseError(f"Failed to summarize reviews for product {product_id}: {e}")
+
+        if row is None:
+            return self._build_summary(product_id, {score: 0 for score in range(1, 11)}, 0, 0)
+        histogram = {score: row[score - 1] for score in range(1, 11)}
+        return self._with_run_interval(self._build_summary(product_id, histogram, row[10], row[11]), run)
+
+    @staticmethod
+    def _sample_run(conn: sqlite3.Connection, product_id: int) -> Optional[Dict[str, Any]]:
+        """The product's latest finished run that analyzed anything, with its analyzed item count."""
+        row = conn.execute("""
+            SELECT r.fetched, r.nps_low, r.nps_high, r.stop_reason, COUNT(i.item_index)
+            FROM pipeline_runs r JOIN pipeline_run_items i ON i.run_id = r.run_id AND i.status = 'analyzed'
+            WHERE r.product_id = ? AND r.status IN ('completed', 'partial')
+            GROUP BY r.run_id
+            ORDER BY r.created_at DESC, r.rowid DESC
+            LIMIT 1
+        """, (product_id,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("fetched", "nps_low", "nps_high", "stop_reason", "analyzed"), row))
+
+    @staticmethod
+    def _with_run_interval(summary: Dict[str, Any], run: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        When the stored reviews are exactly one run's sample, the interval accounts for the
+        population it was drawn from: an adaptive run's stored interval (and stop reason) is
+        used as is, otherwise it is recomputed with the run's fetched count.
+        """
+        if run is None or run["analyzed"] != summary["total"]:
+            return summary
+        if run["nps_low"] is not None:
+            summary.update(nps_low=run["nps_low"], nps_high=run["nps_high"], stop_reason=run["stop_reason"])
+        elif run["fetched"]:
+            summary["nps_low"], summary["nps_high"] = nps_confidence_interval(
+                summary["promoters"], summary["detractors"], summary["total"], population=run["fetched"]
+            )
+        return summary
+
+    def scan_product_summary(self, product_id: int) -> Dict[str, Any]:
+        """
+        Same result as get_product_summary, computed from the reviews themselves in one GROUP BY
+        over the covering index (no rows are materialized in Python). Used to cross-check the rollup.
+        """
+        query = """
+        SELECT estimated_score, is_satisfied, COUNT(*)
+        FROM product_reviews
+        WHERE product_id = ?
+        GROUP BY estimated_score, is_satisfied
+        """
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(query, (product_id,)).fetchall()
+                run = self._sample_run(conn, product_id)
+        except Exception as e:
+            raise DatabaseError(f"Failed to summarize reviews for product {product_id}: {e}")
+
+        histogram = {score: 0 for score in range(1, 11)}
+        satisfied = total = 0
+        for score, is_satisfied, count in rows:
+            # Out-of-range scores count towards the total but have no histogram bucket
+            if score in histogram:
+                histogram[score] += count
+            total += count
+            if is_satisfied:
+                satisfied += count
+
+        return self._with_run_interval(self._build_summary(product_id, histogram, satisfied, total), run)
+
+    def get_daily_stats(self, product_id: int, since: str = None, until: str = None) -> List[Dict[str, Any]]:
+        """
+        Per-day counters of a product from the `product_daily_stats` rollup, oldest first:
+        {"day", "score_histogram", "satisfied", "total"}. `since`/`until` are inclusive ISO dates.
+        """
+        score_columns = ", ".join(f"score_{score}" for score in range(1, 11))
+        query = f"""
+        SELECT day, {score_columns}, satisfied, total
+        FROM product_daily_stats
+        WHERE product_id = ? AND total != 0 AND day >= ? AND day <= ?
+        ORDER BY day
+        """
+        try:
+            with self._get_connection() as conn:
+                rows = conn.execute(query, (product_id, since or "0000-00-00", until or "9999-99-99")).fetchall()
+        except Exception as e:
+            raise DatabaseError(f"Failed to read daily stats for product {product_id}: {e}")
+        return [
+            {"day": row[0], "score_histogram": {score: row[score] for score in range(1, 11)},
+             "satisfied": row[11], "total": row[12]}
+            for row in rows
+        ]
+
+    @timed("db.get_nps_trend")
+    def get_nps_trend(self, product_id: int, window: str = "weekly", since: str = None, until: str = None,
+                      rolling_days: int = 30) -> List[Dict[str, Any]]:
+        """
+        NPS and score distribution over time, summed from the daily rollup (no review scan):
+        - "daily": one point per day with reviews,
+        - "weekly": one point per ISO week (Monday start) with reviews,
+        - "rolling": one point per calendar day covering the trailing `rolling_days` days; the
+          window slides by adding the entering day and subtracting the leaving one.
+        Each point has the get_product_summary fields plus "period_start" and "period_end".
+        Days are those of `created_at`, i.e. when the review was stored.
+        """
+        if window not in ("daily", "weekly", "rolling"):
+            raise ValueError(f"Unknown trend window: {window}")
+        if window == "rolling" and since:
+            # Days before `since` still feed the first windows
+            first_day = date.fromisoformat(since) - timedelta(days=rolling_days - 1)
+            days = self.get_daily_stats(product_id, first_day.isoformat(), until)
+        else:
+            days = self.get_daily_stats(product_id, since, until)
+        if not days:
+            return []
+
+        def point(start: date, end: date, histogram: Dict[int, int], satisfied: int, total: int) -> Dict[str, Any]:
+            summary = self._build_summary(product_id, dict(histogram), satisfied, total)
+            summary.update(period_start=start.isoformat(), period_end=end.isoformat())
+            return summary
+
+        if window == "daily":
+            return [point(date.fromisoformat(d["day"]), date.fromisoformat(d["day"]),
+                          d["score_histogram"], d["satisfied"], d["total"]) for d in days]
+
+        if window == "weekly":
+            weeks: Dict[date, Dict[str, Any]] = {}
+            for d in days:
+                day = date.fromisoformat(d["day"])
+                week = weeks.setdefault(day - timedelta(days=day.weekday()),
+                                        {"histogram": {score: 0 for score in range(1, 11)}, "satisfied": 0, "total": 0})
+                for score, count in d["score_histogram"].items():
+                    week["histogram"][score] += count
+                week["satisfied"] += d["satisfied"]
+                week["total"] += d["total"]
+            # Weeks cut by since/until report the days they actually cover
+            lower = date.fromisoformat(since) if since else date.min
+            upper = date.fromisoformat(until) if until else date.max
+            return [point(max(start, lower), min(start + timedelta(days=6), upper),
+                          week["histogram"], week["satisfied"], week["total"])
+                    for start, week in sorted(weeks.items())]
+
+        by_day = {date.fromisoformat(d["day"]): d for d in days}
+        histogram = {score: 0 for score in range(1, 11)}
+        satisfied = total = 0
+        first = date.fromisoformat(since) if since else min(by_day)
+        last = date.fromisoformat(until) if until else max(by_day)
+        trend = []
+        day = min(min(by_day), first)
+        while day <= last:
+            entering = by_day.get(day)
+            leaving = by_day.get(day - timedelta(days=rolling_days))
+            for entry, sign in ((entering, 1), (leaving, -1)):
+                if entry is not None:
+                    for score, count in entry["score_histogram"].items():
+                        histogram[score] += sign * count
+                    satisfied += sign * entry["satisfied"]
+                    total += sign * entry["total"]
+            # Windows without any review are left out rather than reported as NPS 0
+            if day >= first and total:
+                trend.append(point(day - timedelta(days=rolling_days - 1), day, histogram, satisfied, total))
+            day += timedelta(days=1)
+        return trend
+
+    @staticmethod
+    def _build_summary(product_id: int, histogram: Dict[int, int], satisfied: int, total: int) -> Dict[str, Any]:
+        promoters = sum(count for score, count in histogram.items() if score >= 9)
+        detractors = sum(count for score, count in histogram.items() if score <= 6)
+        nps = round((promoters - detractors) / total * 100, 2) if total else 0.0
+        # The stored reviews are a sample of the product's comments: 95% interval of the NPS
+        # (population unknown here, so without the finite population correction; see _with_run_interval)
+        nps_low, nps_high = nps_confidence_interval(promoters, detractors, total)
+        return {
+            "product_id": product_id,
+            "total": total,
+            "satisfied": satisfied,
+            "dissatisfied": total - satisfied,
+            "score_histogram": histogram,
+            "promoters": promoters,
+            "passives": total - promoters - detractors,
+            "detractors": detractors,
+            "nps": nps,
+            "nps_low": nps_low,
+            "nps_high": nps_high,
+        }
+
+class ReviewWriter:
+    """
+    Background writer thread for concurrent producers: reviews are queued with `submit`
+    (which only blocks when the queue is full) and written with `insert_reviews_bulk`
+    in batches of up to `batch_size`, so pipeline threads never wait on disk.
+    """
+    def __init__(self, db: DatabaseManager, batch_size: int = 200, max_queue_size: int = 1000,
+                 flush_interval: float = 0.2):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.failed = 0
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, product_id: int, raw_comment: str, ai_data: Dict[str, Any], comment_id: int = None,
+               on_done: Callable[[bool, Optional[Exception]], None] = None,
+               run_item: Tuple[str, int] = None, cluster_id: str = None):
+        """
+        Queues one review. `on_done(committed, error)` is invoked from the writer thread
+        once the batch containing it has been committed (or has failed).
+        `run_item` ((run_id, item_index)) is checkpointed as analyzed together with the review.
+        """
+        if self._closed:
+            raise DatabaseError("ReviewWriter is closed.")
+        self._queue.put(((product_id, raw_comment, ai_data, comment_id, cluster_id), on_done, run_item))
+
+    def flush(self):
+        """Blocks until every review submitted so far has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Writes the remaining reviews and stops the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            batch = [item]
+            stop = False
+            # Gather whatever else is queued (up to batch_size) into the same transaction
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                self._queue.task_done()
+                return
+
+    def _write(self, batch: List[tuple]):
+        # Each review is validated on its own: an incomplete one fails alone, the rest are stored
+        errors: List[Optional[Exception]] = []
+        for review, _, _ in batch:
+            try:
+                self.db._review_params(*review)
+                errors.append(None)
+            except ValueError as e:
+                errors.append(DatabaseError(f"Refusing to store an incomplete review: {e}"))
+        valid = [item for item, error in zip(batch, errors) if error is None]
+        self.failed += len(batch) - len(valid)
+
+        try:
+            self.db.insert_reviews_bulk(
+                (review for review, _, _ in valid),
+                run_items=[run_item for _, _, run_item in valid if run_item is not None]
+            )
+            self.written += len(valid)
+        except Exception as e:
+            errors = [error or e for error in errors]
+            self.failed += len(valid)
+
+        for (_, on_done, _), error in zip(batch, errors):
+            if on_done is not None:
+                try:
+                    on_done(error is None, error)
+                except Exception as e:
+                    print(f"⚠️ ReviewWriter callback failed: {e}")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintenance commands for the reviews database.")
+    parser.add_argument("command", choices=["backfill-stats", "check-stats", "dedupe"],
+                        help="backfill-stats: rebuild the product_stats and daily rollups; check-stats: compare them "
+                             "with a full scan; dedupe: remove legacy reviews stored twice for the same product")
+    parser.add_argument("--db", default="database/reviews.db", help="Path to the SQLite database")
+    parser.add_argument("--dry-run", action="store_true", help="dedupe: only list the rows that would be removed")
+    args = parser.parse_args()
+
+    manager = DatabaseManager(args.db)
+    if args.command == "backfill-stats":
+        print(f"✅ Rebuilt product_stats for {manager.rebuild_product_stats()} products.")
+    elif args.command == "dedupe":
+        duplicates = manager.dedupe_reviews(dry_run=args.dry_run)
+        per_product: Dict[int, int] = {}
+        for duplicate in duplicates:
+            per_product[duplicate["product_id"]] = per_product.get(duplicate["product_id"], 0) + 1
+            print(f"  #{duplicate['id']} (product {duplicate['product_id']}): {duplicate['raw_comment'][:60]!r}")
+        for product_id, count in sorted(per_product.items()):
+            print(f"📦 Product {product_id}: {count} duplicates")
+        verb = "Would remove" if args.dry_run else "Removed"
+        print(f"✅ {verb} {len(duplicates)} duplicate reviews.")
+    else:
+        mismatches = manager.verify_product_stats()
+        for mismatch in mismatches:
+            where = f"Product {mismatch['product_id']}" + (f" on {mismatch['day']}" if "day" in mismatch else "")
+            print(f"❌ {where}: rollup {mismatch['actual']} != scan {mismatch['expected']}")
+        print("✅ product_stats is consistent." if not mismatches else f"⚠️ {len(mismatches)} inconsistent products.")
+        manager.close()
+        raise SystemExit(1 if mismatches else 0)
+    manager.close()
\ No newline at end of file
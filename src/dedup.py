@@ -0,0 +1,149 @@
+import re
+import hashlib
+import unicodedata
+from collections import Counter
+from typing import Dict, Any, List, Set, Tuple, Optional
+
+from src.text_utils import normalize_comment
+from src.lexicon import NEGATIONS
+
+# Letters only: repeated digits are part of a number ("1000"), not emphasis
+_STRETCH_PATTERN = re.compile(r"([^\W\d_])\1{2,}", re.UNICODE)
+
+
+def canonical_text(text: str) -> str:
+    """
+    normalize_comment plus the differences that never change a review's meaning:
+    punctuation, spacing, variation selectors and stretched letters ("عاااالی" -> "عالی").
+    Emoji are kept because they carry sentiment.
+    """
+    text = "".join(
+        " " if unicodedata.category(ch)[0] == "P" else ch
+        for ch in normalize_comment(text)
+        if unicodedata.category(ch) != "Mn"
+    )
+    text = _STRETCH_PATTERN.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+def _is_polarity_token(token: str) -> bool:
+    # نمی- marks a negated present verb (نمیکنم, نمیخرم); the listed words negate on their own
+    return token in NEGATIONS or token.startswith("نمی")
+
+
+def token_signature(text: str) -> Tuple[Counter, Counter]:
+    """
+    What two canonical texts must share to be the same review: their token multiset, and the
+    multiset of the bigrams around every negation, so that neither a negated verb ("میکنم" vs
+    "نمیکنم") nor a moved negation ("خوب نیست، بد است" vs "بد نیست، خوب است") can be merged.
+    """
+    tokens = text.split()
+    polarity = Counter()
+    for position, token in enumerate(tokens):
+        if _is_polarity_token(token):
+            polarity[tuple(tokens[max(0, position - 1):position + 2])] += 1
+    return Counter(tokens), polarity
+
+
+def shingles(text: str, size: int = 3) -> Set[str]:
+    """Character n-grams of the canonical text (the whole text if it is shorter than `size`)."""
+    if len(text) <= size:
+        return {text}
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def simhash(features: Set[str], bits: int = 64) -> int:
+    """Charikar SimHash: similar feature sets produce fingerprints with a small Hamming distance."""
+    weights = [0] * bits
+    for feature in features:
+        value = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+class NearDuplicateClusterer:
+    """
+    Online near-duplicate grouping of comments (one instance per pipeline run).
+    Comments with the same canonical text share a cluster directly; otherwise a 64-bit SimHash
+    over character 3-grams finds candidates within `max_distance` bits (banded index: with
+    4 bands of 16 bits and max_distance <= 3 a near duplicate always shares one band). A
+    candidate is only accepted when the Jaccard similarity of the shingle sets is at least
+    `min_similarity` and both texts have the same token signature (see token_signature): a
+    high similarity alone would merge "راضی هستم" with "راضی نیستم". Comments therefore only
+    share a cluster when they differ in punctuation, spacing, letter variants or word order
+    away from any negation.
+    """
+    BITS = 64
+    BANDS = 4
+
+    def __init__(self, min_similarity: float = 0.9, max_distance: int = 3):
+        if not 0 < min_similarity <= 1:
+            raise ValueError("min_similarity must be in (0, 1].")
+        if not 0 <= max_distance < self.BANDS:
+            raise ValueError(f"max_distance must be in [0, {self.BANDS - 1}].")
+        self.min_similarity = min_similarity
+        self.max_distance = max_distance
+
+        self.seen = 0
+        self._exact: Dict[str, str] = {}
+        self._bands: List[Dict[int, List[str]]] = [{} for _ in range(self.BANDS)]
+        # cluster id -> (fingerprint, shingles, token signature) of the cluster's representative
+        self._representatives: Dict[str, Tuple[int, Set[str], Tuple[Counter, Counter]]] = {}
+
+    @property
+    def clusters(self) -> int:
+        return len(self._representatives)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"comments": self.seen, "clusters": self.clusters, "duplicates": self.seen - self.clusters}
+
+    def assign(self, comment_text: str) -> Tuple[str, bool]:
+        """
+        Places a comment in a cluster and returns (cluster_id, is_new). The first comment of a
+        cluster is its representative; the ids are derived from its fingerprint.
+        """
+        self.seen += 1
+        canonical = canonical_text(comment_text)
+        cluster_id = self._exact.get(canonical)
+        if cluster_id is not None:
+            return cluster_id, False
+
+        features = shingles(canonical)
+        signature = token_signature(canonical)
+        fingerprint = simhash(features, self.BITS)
+        cluster_id = self._find_similar(fingerprint, features, signature)
+        if cluster_id is not None:
+            self._exact[canonical] = cluster_id
+            return cluster_id, False
+
+        cluster_id = f"{fingerprint:016x}"
+        while cluster_id in self._representatives:
+            # Same fingerprint but not similar enough: keep the clusters apart
+            cluster_id = f"{cluster_id}-{len(self._representatives)}"
+        self._representatives[cluster_id] = (fingerprint, features, signature)
+        self._exact[canonical] = cluster_id
+        for band, key in enumerate(self._band_keys(fingerprint)):
+            self._bands[band].setdefault(key, []).append(cluster_id)
+        return cluster_id, True
+
+    def _find_similar(self, fingerprint: int, features: Set[str], signature: Tuple[Counter, Counter]) -> Optional[str]:
+        checked = set()
+        for band, key in enumerate(self._band_keys(fingerprint)):
+            for cluster_id in self._bands[band].get(key, ()):
+                if cluster_id in checked:
+                    continue
+                checked.add(cluster_id)
+                other_fingerprint, other_features, other_signature = self._representatives[cluster_id]
+                if bin(fingerprint ^ other_fingerprint).count("1") > self.max_distance:
+                    continue
+                if signature != other_signature:
+                    continue
+                if len(features & other_features) / len(features | other_features) >= self.min_similarity:
+                    return cluster_id
+        return None
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        width = self.BITS // self.BANDS
+        mask = (1 << width) - 1
+        return [(fingerprint >> (band * width)) & mask for band in range(self.BANDS)]
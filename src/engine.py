@@ -0,0 +1,186 @@
+import time
+import random
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, List, Dict, Any, Optional, Callable, Tuple
+
+from src.config import LLM_MAX_CONCURRENCY, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE, LLM_MAX_RETRIES, LLM_BATCH_MODE
+from src.analyzer import CommentAnalyzer
+from src.rate_limiter import TokenBucketRateLimiter
+from src.exceptions import LLMAnalysisError, LLMTransientError, LLMRateLimitError, DatabaseError
+from src.metrics import span, inc
+
+@dataclass
+class AnalysisOutcome:
+    """
+    Result of analyzing a single comment. Exactly one of `data` / `error` is set
+    (attempts == 0 means it was answered locally: pre-classifier or cache hit).
+    """
+    index: int
+    comment: str
+    data: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+class AnalysisEngine:
+    """
+    Runs many CommentAnalyzer calls concurrently on a bounded thread pool.
+    Every call goes through a shared token-bucket rate limiter; throttled (429) and
+    transient failures are retried with exponential backoff and full jitter.
+    With `batch_mode=True` comments are packed into multi-comment requests
+    (see CommentAnalyzer.iter_batches) and only invalid items fall back to single calls.
+    """
+    def __init__(self, analyzer: CommentAnalyzer, max_workers: int = None,
+                 rate_limiter: TokenBucketRateLimiter = None, max_retries: int = None,
+                 base_backoff: float = 1.0, max_backoff: float = 30.0, batch_mode: bool = None):
+        self.analyzer = analyzer
+        self.batch_mode = LLM_BATCH_MODE if batch_mode is None else batch_mode
+        self.max_workers = max_workers or LLM_MAX_CONCURRENCY
+        self.rate_limiter = rate_limiter or TokenBucketRateLimiter(LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE)
+        self.max_retries = LLM_MAX_RETRIES if max_retries is None else max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # Follow-up requests for missing fields are metered and retried like every other call
+        analyzer.request_gate = self._gated_request
+
+    def analyze_stream(self, comments: Iterable[str]) -> Iterator[AnalysisOutcome]:
+        """
+        Analyzes comments concurrently and yields each outcome as soon as it completes
+        (completion order, not input order). The input is consumed lazily so that at most
+        2 x max_workers requests are in flight at any time.
+        """
+        if self.batch_mode:
+            tasks = ((self._analyze_batch, batch) for batch in self.analyzer.iter_batches(enumerate(comments)))
+        else:
+            tasks = ((self._analyze_single, item) for item in enumerate(comments))
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            in_flight = set()
+
+            def fill():
+                while len(in_flight) < self.max_workers * 2:
+                    task = next(tasks, None)
+                    if task is None:
+                        return
+                    function, argument = task
+                    in_flight.add(pool.submit(function, argument))
+
+            fill()
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    in_flight.discard(future)
+                    yield from future.result()
+                fill()
+
+    def analyze_all(self, comments: Iterable[str]) -> List[AnalysisOutcome]:
+        """Blocking variant of analyze_stream that returns outcomes in input order."""
+        return sorted(self.analyze_stream(comments), key=lambda outcome: outcome.index)
+
+    def _backoff_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** (attempt - 1))))
+
+    def _call_with_retry(self, function: Callable[[], Any], tokens: int) -> Tuple[Any, Optional[Exception], int]:
+        """
+        Runs `function` behind the rate limiter, retrying throttled and transient failures.
+        Returns (result, error, attempts); non-retryable LLMAnalysisErrors are returned immediately.
+        """
+        error = None
+        for attempt in range(1, self.max_retries + 2):
+            self.rate_limiter.acquire(tokens)
+            try:
+                result = function()
+                self.rate_limiter.reward()
+                return result, None, attempt
+            except LLMRateLimitError as e:
+                error = e
+                self.rate_limiter.penalize(e.retry_after)
+            except LLMTransientError as e:
+                error = e
+            except LLMAnalysisError as e:
+                # Malformed output or a non-retryable API error: report immediately
+                return None, e, attempt
+
+            if attempt <= self.max_retries:
+                inc("llm_retries")
+                time.sleep(self._backoff_delay(attempt))
+
+        return None, error, self.max_retries + 1
+
+    def _gated_request(self, function: Callable[[], Any], tokens: int) -> Any:
+        """Runs a nested request (see CommentAnalyzer.request_gate) behind the limiter with retries."""
+        result, error, _ = self._call_with_retry(function, tokens)
+        if isinstance(error, LLMTransientError):
+            # Already retried here: the enclosing call must not retry (and pay) its whole request again
+            raise LLMAnalysisError(f"Follow-up request failed after retries: {error}") from error
+        if error is not None:
+            raise error
+        return result
+
+    def _lookup_local(self, comment: str) -> Optional[Dict[str, Any]]:
+        # Pre-classified comments and cache hits never touch the API,
+        # so they must not consume rate-limit budget either
+        local = self.analyzer.pre_classify(comment)
+        if local is not None:
+            return local
+        try:
+            return self.analyzer.get_cached(comment)
+        except DatabaseError:
+            return None
+
+    def _analyze_single(self, item: Tuple[int, str]) -> List[AnalysisOutcome]:
+        index, comment = item
+        outcome = AnalysisOutcome(index=index, comment=comment)
+
+        local = self._lookup_local(comment)
+        if local is not None:
+            outcome.data = local
+            return [outcome]
+
+        # Includes limiter waits and backoff: the latency a comment actually experiences
+        with span("analysis.comment"):
+            outcome.data, outcome.error, outcome.attempts = self._call_with_retry(
+                lambda: self.analyzer.fetch_analysis(comment), self.analyzer.estimate_tokens(comment)
+            )
+        return [outcome]
+
+    def _analyze_batch(self, batch: List[Tuple[int, str]]) -> List[AnalysisOutcome]:
+        outcomes = []
+        pending = []
+        for index, comment in batch:
+            local = self._lookup_local(comment)
+            if local is not None:
+                outcomes.append(AnalysisOutcome(index=index, comment=comment, data=local))
+            else:
+                pending.append((index, comment))
+
+        if len(pending) == 1:
+            return outcomes + self._analyze_single(pending[0])
+        if not pending:
+            return outcomes
+
+        texts = [comment for _, comment in pending]
+        with span("analysis.batch"):
+            answers, error, attempts = self._call_with_retry(
+                lambda: self.analyzer.fetch_batch_analysis(texts), self.analyzer.estimate_batch_tokens(texts)
+            )
+
+        if isinstance(error, LLMTransientError):
+            # Retries are exhausted; single calls would only hit the same wall
+            return outcomes + [
+                AnalysisOutcome(index=index, comment=comment, error=error, attempts=attempts)
+                for index, comment in pending
+            ]
+
+        for position, (index, comment) in enumerate(pending):
+            if answers and position in answers:
+                outcomes.append(AnalysisOutcome(index=index, comment=comment, data=answers[position], attempts=attempts))
+            else:
+                # Missing or malformed in the batched answer: fall back to a dedicated request
+                outcomes.extend(self._analyze_single((index, comment)))
+        return outcomes
\ No newline at end of file
@@ -16,4 +16,14 @@ class LLMAnalysisError(DigikalaAnalyzerBaseException):
 
 class DatabaseError(DigikalaAnalyzerBaseException):
     """Raised when a SQLite database operation fails."""
-    pass
\ No newline at end of file
+    pass
+
+class LLMTransientError(LLMAnalysisError):
+    """Raised when the LLM request failed for a temporary reason (timeout, connection drop, 5xx) and may be retried."""
+    pass
+
+class LLMRateLimitError(LLMTransientError):
+    """Raised when the LLM provider throttles the request (HTTP 429)."""
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
\ No newline at end of file
@@ -0,0 +1,149 @@
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Deque
+
+from src.batch import BatchRunner
+from src.engine import AnalysisOutcome
+from src.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Job:
+    """State of one background pipeline run, written by its worker thread and polled by the UI."""
+    job_id: str
+    product_id: int
+    resume_run_id: Optional[str] = None
+    status: str = "queued"  # queued -> running -> done | failed
+    title: Optional[str] = None
+    done: int = 0
+    total: Optional[int] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    logs: Deque[str] = field(default_factory=lambda: deque(maxlen=200), repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("done", "failed")
+
+    @property
+    def progress(self) -> float:
+        """Share of the sample analyzed so far (0 while the sample size is unknown)."""
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    def log(self, message: str):
+        with self._lock:
+            self.logs.append(message)
+        logger.info(f"[job {self.job_id} / {self.product_id}] {message}")
+
+    def tail(self, lines: int = 20) -> List[str]:
+        """Last log lines (copied under the lock, the worker may be appending)."""
+        with self._lock:
+            return list(self.logs)[-lines:]
+
+class JobManager:
+    """
+    Runs product pipelines in the background so that the Streamlit script never blocks:
+    `submit` queues a job on a small worker pool and returns at once, and the UI polls the
+    Job's progress and log on each rerun. All jobs share one BatchRunner, i.e. one crawler
+    session, LLM client, cache, rate limiter (one API budget for every user), DB connection
+    and ReviewWriter. A product has at most one active job; asking for it again joins
+    the running job instead of analyzing the same comments twice.
+    Meant to be created once per server process (e.g. behind `st.cache_resource`).
+    """
+    def __init__(self, workers: int = 2, db_path: str = "database/reviews.db",
+                 max_finished_jobs: int = 100, runner: BatchRunner = None, metrics_path: str = None):
+        self.runner = runner or BatchRunner(workers=workers, db_path=db_path, log=logger.info)
+        self.max_finished_jobs = max_finished_jobs
+        # Prometheus text file refreshed after every job (None to skip)
+        self.metrics_path = metrics_path
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pipeline-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        return self.runner.db
+
+    def submit(self, product_id: int, resume_run_id: str = None) -> Job:
+        """Queues a pipeline run for a product (or joins the product's active job) and returns the Job."""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.product_id == product_id and not job.finished:
+                    return job
+            job = Job(job_id=uuid.uuid4().hex[:12], product_id=product_id, resume_run_id=resume_run_id)
+            self._jobs[job.job_id] = job
+            self._prune()
+        job.log("Queued, waiting for a free worker...")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def active_jobs(self) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if not job.finished]
+
+    def _run(self, job: Job):
+        job.status = "running"
+        job.started_at = time.time()
+        # Metrics are process-wide: with concurrent jobs this window also holds the other jobs' spans
+        metrics_before = METRICS.snapshot()
+
+        def on_outcome(done: int, total: Optional[int], outcome: AnalysisOutcome):
+            job.done, job.total = done, total
+            if outcome.ok:
+                job.log(f"Analyzed review [{done}/{total or '?'}]")
+            else:
+                job.log(f"❌ Error on review {outcome.index + 1}: {str(outcome.error)[:50]}")
+
+        try:
+            job.log(f"Extracting metadata for Product ID: {job.product_id}")
+            job.title = self.runner.crawler.fetch_product_title(job.product_id)
+            job.log(f"Product Name: {job.title}")
+            if job.resume_run_id:
+                job.log(f"Resuming run {job.resume_run_id} from its checkpoint...")
+                result = self.runner.resume_run(job.resume_run_id, on_outcome=on_outcome, log=job.log)
+            else:
+                job.log("Connecting to Digikala API and streaming reviews into the AI pipeline...")
+                result = self.runner.process_product(job.product_id, on_outcome=on_outcome, log=job.log)
+            job.result = result
+            stats = result["stats"]
+            job.log(f"Analyzed {stats['analyzed']} reviews, saved {stats['saved']} ({stats['failed']} failed).")
+            job.log("✅ Pipeline execution finished successfully!")
+            status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.log(f"❌ SYSTEM CRASH: {e}")
+            status = "failed"
+        job.metrics = METRICS.summarize(METRICS.diff(metrics_before, METRICS.snapshot()))
+        job.finished_at = time.time()
+        if self.metrics_path:
+            try:
+                METRICS.write_prometheus(self.metrics_path)
+            except OSError as e:
+                logger.warning(f"Could not write {self.metrics_path}: {e}")
+        # Set last: the UI treats a finished job's result and metrics as complete
+        job.status = status
+
+    def _prune(self):
+        # Caller holds the lock; the oldest finished jobs are forgotten first
+        finished = sorted((job for job in self._jobs.values() if job.finished), key=lambda job: job.created_at)
+        for job in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job.job_id]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.runner.close()
@@ -0,0 +1,163 @@
+import re
+import threading
+from typing import Dict, Any, Optional, List
+
+from src.text_utils import normalize_comment
+
+# Sentiment words with their weight (2 = unambiguous, 1 = mild). Entries are written in the
+# normalized form produced by normalize_comment (Persian letters, no ZWNJ).
+POSITIVE_WORDS = {
+    "عالی": 2, "عالیه": 2, "عالیی": 2, "فوقالعاده": 2, "فوقالعادس": 2, "بینظیر": 2, "بینظیره": 2,
+    "محشر": 2, "محشره": 2, "معرکه": 2, "معرکس": 2, "بهترین": 2, "شاهکار": 2, "شاهکاره": 2,
+    "خوب": 1, "خوبه": 1, "خوبیه": 1, "راضی": 1.5, "راضیم": 1.5, "قشنگ": 1, "قشنگه": 1,
+    "زیبا": 1, "زیباست": 1, "خوشگل": 1, "خوشگله": 1, "باکیفیت": 1.5, "باکیفیته": 1.5,
+    "ممنون": 0.5, "ممنونم": 0.5, "مرسی": 0.5, "سپاس": 0.5, "پیشنهاد": 1, "توصیه": 1,
+    "ارزشمند": 1,
+}
+NEGATIVE_WORDS = {
+    "افتضاح": 2, "افتضاحه": 2, "افتضاحی": 2, "داغون": 2, "داغونه": 2, "مزخرف": 2, "مزخرفه": 2,
+    "بدترین": 2, "آشغال": 2, "آشغاله": 2, "اشغال": 2, "کلاهبرداری": 2, "بیکیفیت": 2, "بیکیفیته": 2,
+    "نخرید": 2, "نخریدن": 2, "پشیمونم": 2, "پشیمانم": 2, "پشیمون": 1.5, "پشیمان": 1.5,
+    "ناراضی": 1.5, "ناراضیم": 1.5, "خراب": 1.5, "خرابه": 1.5, "ضعیف": 1, "ضعیفه": 1,
+    "بد": 1, "بده": 1, "بدی": 1, "تقلبی": 2, "تقلبیه": 2,
+}
+POSITIVE_EMOJIS = {"👍", "👌", "😍", "❤", "❤️", "🥰", "😊", "💯", "🌹"}
+NEGATIVE_EMOJIS = {"👎", "😡", "😠", "🤬", "😞", "💩"}
+
+# Words that amplify the next sentiment word
+INTENSIFIERS = {"خیلی", "بسیار", "واقعا", "کاملا", "فوق", "انقدر", "اینقدر", "خیلیی"}
+# Negation and contrast change the meaning of the sentence: such comments always go to the LLM
+NEGATIONS = {"نه", "نیست", "نیستم", "نیستش", "نبود", "نبودم", "نداره", "ندارد", "نداشت", "هیچ", "اصلا"}
+CONTRASTS = {"ولی", "اما", "ولیکن", "هرچند", "البته", "بجز", "جز", "منتها", "فقط"}
+# Neutral words that are expected around a short verdict and do not lower confidence
+FILLERS = {
+    "بود", "بودم", "است", "هست", "هستش", "و", "من", "این", "اين", "محصول", "محصولی", "کالا", "کالای",
+    "خرید", "خریدم", "از", "با", "به", "که", "یه", "یک", "هم", "میکنم", "میکنیم", "کنید", "رو", "را",
+    "کیفیت", "کیفیتش", "جنس", "جنسش", "ارسال", "دیجیکالا", "خیلیم", "بسیارخوب", "هستم", "ام", "ای",
+    "برای", "داره", "دارد", "کردم", "واقعاً", "کلا", "کاملاً", "نسبت", "قیمتش", "قیمت",
+}
+
+# Multi-word expressions that are merged into a single lexicon token before scoring
+_PHRASES = [
+    (re.compile(r"فوق\s*العاده"), "فوقالعاده"),
+    (re.compile(r"بی\s*کیفیت"), "بیکیفیت"),
+    (re.compile(r"با\s*کیفیت"), "باکیفیت"),
+    (re.compile(r"بی\s*نظیر"), "بینظیر"),
+]
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+class LexiconClassifier:
+    """
+    Local, rule-based Persian sentiment scorer used as a fast path in front of the LLM.
+    Only short comments that are an unambiguous verdict ("خیلی خوبه عالی", "افتضاح بود") are
+    scored: a single polarity, no negation or contrast, and (almost) every word known to the
+    lexicon. The confidence combines that coverage with the strength of the sentiment words;
+    anything below `confidence_threshold` returns None and is escalated to the LLM.
+    """
+    SCORED_BY = "lexicon"
+
+    def __init__(self, confidence_threshold: float = 0.85, max_tokens: int = 12,
+                 positive_reason: str = "رضایت کلی از محصول", negative_reason: str = "نارضایتی کلی از محصول"):
+        if not 0 < confidence_threshold <= 1:
+            raise ValueError("confidence_threshold must be in (0, 1].")
+        self.confidence_threshold = confidence_threshold
+        self.max_tokens = max_tokens
+        self.reasons = {True: positive_reason, False: negative_reason}
+
+        self.classified = 0
+        self.escalated = 0
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        """Fast-path/escalation counters for reporting."""
+        checked = self.classified + self.escalated
+        return {
+            "classified": self.classified,
+            "escalated": self.escalated,
+            "fast_path_rate": round(self.classified / checked, 4) if checked else 0.0,
+        }
+
+    def evaluate(self, comment_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Scores a comment regardless of the threshold: returns its polarity (True = positive),
+        sentiment strength and confidence, or None when the lexicon cannot judge it at all.
+        """
+        tokens = self._tokenize(comment_text)
+        if not tokens or len(tokens) > self.max_tokens:
+            return None
+
+        positive = negative = 0.0
+        covered = 0
+        boost = 1.0
+        for token in tokens:
+            if token in NEGATIONS or token in CONTRASTS or token.startswith("نمی"):
+                return None
+            if token in INTENSIFIERS:
+                boost = 1.5
+                covered += 1
+                continue
+
+            if token in POSITIVE_WORDS or token in POSITIVE_EMOJIS:
+                positive += POSITIVE_WORDS.get(token, 1) * boost
+            elif token in NEGATIVE_WORDS or token in NEGATIVE_EMOJIS:
+                negative += NEGATIVE_WORDS.get(token, 1) * boost
+            elif not (token in FILLERS or self._is_punctuation(token)):
+                boost = 1.0
+                continue
+            covered += 1
+            boost = 1.0
+
+        if (positive and negative) or not (positive or negative):
+            return None
+
+        strength = positive or negative
+        coverage = covered / len(tokens)
+        return {
+            "is_positive": bool(positive),
+            "strength": strength,
+            "confidence": round(coverage * (1 - 0.35 ** strength), 4),
+        }
+
+    def classify(self, comment_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns an analysis in the LLM's format (plus `scored_by`) for high-confidence comments,
+        or None when the comment has to be escalated to the LLM.
+        """
+        verdict = self.evaluate(comment_text)
+        if verdict is None or verdict["confidence"] < self.confidence_threshold:
+            with self._lock:
+                self.escalated += 1
+            return None
+
+        with self._lock:
+            self.classified += 1
+        is_satisfied = verdict["is_positive"]
+        return {
+            "is_satisfied": is_satisfied,
+            "reason": self.reasons[is_satisfied],
+            "estimated_score": self._score(is_satisfied, verdict["strength"]),
+            "scored_by": self.SCORED_BY,
+        }
+
+    @staticmethod
+    def _score(is_positive: bool, strength: float) -> int:
+        """Maps sentiment strength onto the 1-10 scale (a verdict alone never lands in the passive 7-8 band)."""
+        if is_positive:
+            return 10 if strength >= 3 else 9
+        if strength >= 3:
+            return 1
+        return 2 if strength >= 2 else 3
+
+    @staticmethod
+    def _tokenize(comment_text: str) -> List[str]:
+        text = normalize_comment(comment_text)
+        for pattern, replacement in _PHRASES:
+            text = pattern.sub(replacement, text)
+        # Stretched letters ("عاااالی") are collapsed to one; digits are left alone ("1000")
+        text = re.sub(r"([^\W\d_])\1{2,}", r"\1", text)
+        return _TOKEN_PATTERN.findall(text)
+
+    @staticmethod
+    def _is_punctuation(token: str) -> bool:
+        return not any(ch.isalnum() for ch in token)
@@ -0,0 +1,263 @@
+import os
+import time
+import json
+import threading
+import functools
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+# Latency histogram buckets in seconds (Prometheus `le` bounds; +Inf is implicit)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> _LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Process-wide, thread-safe counters and latency histograms.
+    Stages are timed with `span(name)` (context manager) or `@timed(name)` (decorator) and
+    recorded in one histogram family labelled by span name; counters track API calls, tokens,
+    retries, cache hits and the like. `snapshot()` / `diff()` give per-run summaries and
+    `to_prometheus()` renders the text exposition format.
+    """
+    def __init__(self, namespace: str = "digikala", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._counters: Dict[Tuple[str, _LabelKey], float] = {}
+        # span -> [bucket counts..., +Inf count], sum, max
+        self._histograms: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """Adds `value` to a counter (created on first use)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, span_name: str, seconds: float):
+        with self._lock:
+            histogram = self._histograms.get(span_name)
+            if histogram is None:
+                histogram = {"buckets": [0] * (len(self.buckets) + 1), "sum": 0.0, "max": 0.0}
+                self._histograms[span_name] = histogram
+            position = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+            histogram["buckets"][position] += 1
+            histogram["sum"] += seconds
+            histogram["max"] = max(histogram["max"], seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        """Times the enclosed block; failed blocks are timed too and counted in `span_errors`."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("span_errors", span=name)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name: str = None) -> Callable:
+        """Decorator form of `span` (the span defaults to the function's qualified name)."""
+        def decorator(function: Callable) -> Callable:
+            span_name = name or function.__qualname__
+
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Raw copy of every counter and histogram (input of `diff` and `summarize`)."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {name: {"buckets": list(h["buckets"]), "sum": h["sum"], "max": h["max"]}
+                               for name, h in self._histograms.items()},
+            }
+
+    @staticmethod
+    def diff(before: Dict[str, Any], after: Dict[str, Any]) -> Dict[str, Any]:
+        """What was recorded between two snapshots (e.g. during one run)."""
+        counters = {key: value - before["counters"].get(key, 0) for key, value in after["counters"].items()}
+        histograms = {}
+        for name, histogram in after["histograms"].items():
+            previous = before["histograms"].get(name)
+            buckets = list(histogram["buckets"])
+            total = histogram["sum"]
+            if previous is not None:
+                buckets = [count - earlier for count, earlier in zip(buckets, previous["buckets"])]
+                total -= previous["sum"]
+            if sum(buckets):
+                # The maximum of the window is unknown; the all-time one is an upper bound
+                histograms[name] = {"buckets": buckets, "sum": total, "max": histogram["max"]}
+        return {"counters": {key: value for key, value in counters.items() if value}, "histograms": histograms}
+
+    def summarize(self, snapshot: Dict[str, Any] = None) -> Dict[str, Any]:
+        """JSON-friendly view: per-span count/total/mean/p50/p95/max (ms) and counters."""
+        snapshot = snapshot or self.snapshot()
+        spans = {}
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            count = sum(histogram["buckets"])
+            spans[name] = {
+                "count": count,
+                "total_ms": round(histogram["sum"] * 1000, 2),
+                "mean_ms": round(histogram["sum"] / count * 1000, 2) if count else 0.0,
+                "p50_ms": round(self._quantile(histogram, 0.50) * 1000, 2),
+                "p95_ms": round(self._quantile(histogram, 0.95) * 1000, 2),
+                "max_ms": round(histogram["max"] * 1000, 2),
+            }
+        counters = {}
+        for (name, labels), value in sorted(snapshot["counters"].items()):
+            label_text = ",".join(f"{key}={val}" for key, val in labels)
+            counters[f"{name}{{{label_text}}}" if label_text else name] = value
+        return {"spans": spans, "counters": counters}
+
+    def _quantile(self, histogram: Dict[str, Any], fraction: float) -> float:
+        """Quantile estimated from the buckets (linear interpolation inside the bucket, like histogram_quantile)."""
+        counts = histogram["buckets"]
+        total = sum(counts)
+        if not total:
+            return 0.0
+        target = fraction * total
+        seen = 0
+        for position, count in enumerate(counts):
+            if seen + count >= target and count:
+                lower = self.buckets[position - 1] if position else 0.0
+                upper = self.buckets[position] if position < len(self.buckets) else histogram["max"]
+                return min(histogram["max"], lower + (upper - lower) * (target - seen) / count)
+            seen += count
+        return histogram["max"]
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        snapshot = self.snapshot()
+        lines = []
+        counter_names = sorted({name for name, _ in snapshot["counters"]})
+        for name in counter_names:
+            metric = f"{self.namespace}_{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, labels), value in sorted(snapshot["counters"].items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{self._format_labels(labels)} {value:g}")
+
+        if snapshot["histograms"]:
+            metric = f"{self.namespace}_span_duration_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in sorted(snapshot["histograms"].items()):
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ["+Inf"], histogram["buckets"]):
+                    cumulative += count
+                    labels = (("le", f"{bound:g}" if bound != "+Inf" else bound), ("span", name))
+                    lines.append(f"{metric}_bucket{self._format_labels(labels)} {cumulative}")
+                span_label = self._format_labels((("span", name),))
+                lines.append(f"{metric}_sum{span_label} {histogram['sum']:.6f}")
+                lines.append(f"{metric}_count{span_label} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _format_labels(labels: _LabelKey) -> str:
+        if not labels:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+    def write_prometheus(self, path: str):
+        """Writes the exposition text atomically (for node_exporter's textfile collector or scraping by file)."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+    def write_json(self, path: str, summary: Dict[str, Any]):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(summary, file, ensure_ascii=False, indent=2)
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> "ThreadingHTTPServer":
+        """Serves GET /metrics in a daemon thread and returns the server (call shutdown() to stop it)."""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        return server
+
+
+# Default registry used by the pipeline's instrumentation
+METRICS = MetricsRegistry()
+span = METRICS.span
+timed = METRICS.timed
+inc = METRICS.inc
+
+
+@contextmanager
+def profiled(output_path: Optional[str] = None, top: int = 25, enabled: bool = True):
+    """
+    Optional cProfile hook: profiles the enclosed block, dumps the raw stats to `output_path`
+    (readable with snakeviz/pstats) and prints the `top` functions by cumulative time.
+    Note that cProfile only sees the thread that enters the block.
+    """
+    if not enabled:
+        yield None
+        return
+    import pstats
+    import cProfile
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output_path:
+            directory = os.path.dirname(output_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            profiler.dump_stats(output_path)
+        stats = pstats.Stats(profiler)
+        stats.sort_stats("cumulative").print_stats(top)
+
+
+def breakdown(summary: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Span rows of a summary sorted by total time, with each span's share (for tables/dashboards)."""
+    spans = summary.get("spans", {})
+    # Top-level spans overlap their children, so shares are relative to the largest one
+    reference = max((row["total_ms"] for row in spans.values()), default=0.0)
+    rows = []
+    for name, row in sorted(spans.items(), key=lambda item: item[1]["total_ms"], reverse=True):
+        rows.append(dict(row, span=name, share=round(row["total_ms"] / reference, 4) if reference else 0.0))
+    return rows
@@ -0,0 +1,407 @@
+import queue
+import itertools
+import threading
+from typing import Dict, Any, List, Iterable, Iterator, Callable, Optional
+
+from src.crawler import DigikalaCrawler
+from src.engine import AnalysisEngine, AnalysisOutcome
+from src.db_manager import DatabaseManager, ReviewWriter
+from src.sampling import ReservoirSampler, StratifiedPageSampler, AdaptiveSampler
+from src.dedup import NearDuplicateClusterer
+from src.config import (NEAR_DUPLICATE_CLUSTERING, NEAR_DUPLICATE_MIN_SIMILARITY, PIPELINE_SAMPLING,
+                        ADAPTIVE_TARGET_WIDTH, ADAPTIVE_MIN_SAMPLE, ADAPTIVE_BATCH_SIZE, NPS_CONFIDENCE)
+from src.exceptions import CrawlerError
+from src.metrics import span, timed, inc
+
+_END = object()
+
+class StreamingPipeline:
+    """
+    Crawl -> sample -> analyze -> store, connected by bounded queues:
+    - a crawler thread pushes pages into `page_queue` as they arrive,
+    - the sampler selects comments online (reservoir or stratified-by-page),
+    - the AnalysisEngine analyzes them concurrently,
+    - a ReviewWriter thread batches the results into SQLite.
+
+    `sampling="reservoir"` (default) keeps the exact sampling rule of the crawler
+    (100 of >= 200, otherwise all) with memory bounded by the threshold; analysis starts once
+    the crawl is over. `sampling="stratified"` selects a fixed share of every page as soon as it
+    arrives, so crawl and LLM latency overlap. `sampling="adaptive"` analyzes random batches of
+    the crawled comments and stops as soon as the NPS confidence interval is `target_width`
+    points wide (see AdaptiveSampler), with `sample_size` as the hard budget; the run's interval
+    and stop reason are stored with it.
+
+    With `incremental=True` the crawl stops at the product's watermark (newest comment id seen
+    by the previous run), comments already stored are skipped before sampling, and only new
+    comments reach the LLM.
+
+    Every run is checkpointed in the `pipeline_runs` / `pipeline_run_items` tables (sampled
+    comments with a pending/analyzed/failed status); `resume(run_id)` finishes an interrupted
+    run without re-crawling, re-sampling or paying again for comments already analyzed.
+
+    With `cluster_duplicates=True` sampled comments are grouped by near-duplicate detection
+    (see NearDuplicateClusterer): one representative per cluster is analyzed and its result is
+    stored for every member with the `cluster_id`, so the review counts are unchanged (members
+    only differ in punctuation, letter variants or word order away from any negation).
+    """
+    def __init__(self, crawler: DigikalaCrawler, engine: AnalysisEngine, db: DatabaseManager,
+                 sampling: str = None, sample_size: int = 100, sample_threshold: int = 200,
+                 queue_size: int = 64, log: Callable[[str], None] = print, writer: ReviewWriter = None,
+                 cluster_duplicates: bool = None, min_similarity: float = None, target_width: float = None):
+        sampling = sampling or PIPELINE_SAMPLING
+        if sampling not in ("reservoir", "stratified", "adaptive"):
+            raise ValueError(f"Unknown sampling mode: {sampling}")
+        self.crawler = crawler
+        self.engine = engine
+        self.db = db
+        self.sampling = sampling
+        self.sample_size = sample_size
+        self.sample_threshold = sample_threshold
+        self.queue_size = queue_size
+        self.log = log
+        # A shared writer may be passed in (several pipelines at once); otherwise each run owns one
+        self.writer = writer
+        self.cluster_duplicates = NEAR_DUPLICATE_CLUSTERING if cluster_duplicates is None else cluster_duplicates
+        self.min_similarity = min_similarity or NEAR_DUPLICATE_MIN_SIMILARITY
+        self.target_width = target_width or ADAPTIVE_TARGET_WIDTH
+
+    @timed("pipeline.run")
+    def run(self, product_id: int, incremental: bool = False,
+            on_outcome: Callable[[int, Optional[int], AnalysisOutcome], None] = None) -> Dict[str, Any]:
+        """
+        Runs the whole pipeline for one product and returns its counters.
+        `on_outcome(done, total, outcome)` is called for every analyzed comment; `total` is None
+        while the sample size is not known yet (stratified mode).
+
+        The sampled comments are checkpointed in `pipeline_run_items` before they are analyzed;
+        if the run dies partway, `resume(stats["run_id"])` finishes it with the same sample.
+        """
+        run_id = self.db.create_run(product_id, self.sampling)
+        stats = {"run_id": run_id, "fetched": 0, "known": 0, "sampled": 0, "duplicates": 0,
+                 "analyzed": 0, "failed": 0, "saved": 0}
+        page_queue: "queue.Queue" = queue.Queue(maxsize=self.queue_size)
+        crawl_errors: List[Exception] = []
+        newest_id = {"value": None}
+        sample_total = {"value": None}
+
+        watermark = self.db.get_watermark(product_id) if incremental else None
+        if watermark is not None:
+            self.log(f"🔖 Incremental crawl: skipping comments up to #{watermark}")
+
+        crawl_thread = threading.Thread(
+            target=self._crawl_worker, args=(product_id, watermark, page_queue, crawl_errors), daemon=True
+        )
+        crawl_thread.start()
+
+        adaptive = None
+        try:
+            pages = self._new_pages(product_id, page_queue, stats, newest_id, incremental)
+            if self.sampling == "adaptive":
+                adaptive = self._adaptive_sampler()
+                rounds = self._adaptive_rounds(pages, run_id, newest_id, crawl_errors, stats, sample_total, adaptive)
+            else:
+                rounds = [self._sampled_records(pages, run_id, newest_id, crawl_errors, stats, sample_total)]
+            failed_ids = self._analyze(product_id, run_id, rounds, stats, sample_total, on_outcome, adaptive)
+        finally:
+            # Unblock the crawler if we stopped consuming early (e.g. an error downstream)
+            while crawl_thread.is_alive():
+                try:
+                    page_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            if crawl_errors:
+                self.db.update_run(run_id, status="failed", fetched=stats["fetched"],
+                                   sampled=stats["sampled"], error=str(crawl_errors[0]))
+
+        if crawl_errors:
+            raise crawl_errors[0]
+        interval = self._adaptive_interval(adaptive, stats)
+        self.db.update_run(run_id, status="partial" if stats["failed"] else "completed",
+                           fetched=stats["fetched"], sampled=stats["sampled"], newest_comment_id=newest_id["value"],
+                           **interval)
+        self._advance_watermark(product_id, newest_id["value"], failed_ids)
+        return stats
+
+    @timed("pipeline.resume")
+    def resume(self, run_id: str,
+               on_outcome: Callable[[int, Optional[int], AnalysisOutcome], None] = None) -> Dict[str, Any]:
+        """
+        Finishes an interrupted or partially failed run: only its pending and failed items are
+        analyzed, with the sample that was checkpointed (no crawling, no new sampling).
+        An adaptive run then goes on drawing from its checkpointed candidates, with a sampler
+        rebuilt from the scores stored so far, until its stop rule is met.
+        """
+        run = self.db.get_run(run_id)
+        if run is None:
+            raise ValueError(f"Unknown pipeline run: {run_id}")
+        if run["status"] == "failed":
+            raise ValueError(f"Pipeline run {run_id} failed while crawling and cannot be resumed.")
+
+        product_id = run["product_id"]
+        records = [
+            {"item_index": item["item_index"], "id": item["comment_id"], "body": item["raw_comment"]}
+            for item in self.db.get_unfinished_run_items(run_id)
+        ]
+        stats = {"run_id": run_id, "fetched": run["fetched"], "known": 0, "sampled": run["sampled"],
+                 "duplicates": 0, "analyzed": 0, "failed": 0, "saved": 0, "resumed": len(records)}
+        self.log(f"⏯️ Resuming run {run_id}: {len(records)} of {run['sampled']} sampled comments left to analyze.")
+
+        rounds: Iterable[Iterator[Dict[str, Any]]] = [iter(records)]
+        adaptive = None
+        sample_total = {"value": len(records)}
+        if run["sampling"] == "adaptive":
+            candidates = self.db.get_unfinished_run_items(run_id, statuses=("candidate",))
+            candidates = [{"item_index": item["item_index"], "id": item["comment_id"], "body": item["raw_comment"]}
+                          for item in candidates]
+            drawn = sum(run["items"].values()) - run["items"]["candidate"]
+            adaptive = self._adaptive_sampler()
+            adaptive.restore(drawn, self.db.get_run_scores(run_id))
+            stats["sampled"] = drawn
+            sample_total["value"] += len(candidates)
+            rounds = itertools.chain(rounds, self._adaptive_draws(run_id, candidates, run["fetched"], stats, adaptive))
+
+        self.db.update_run(run_id, status="running")
+        failed_ids = self._analyze(product_id, run_id, rounds, stats, sample_total, on_outcome, adaptive)
+        interval = self._adaptive_interval(adaptive, stats)
+        self.db.update_run(run_id, status="partial" if stats["failed"] else "completed", sampled=stats["sampled"],
+                           **interval)
+        # A run interrupted before its crawl finished has no newest id and never moves the watermark
+        self._advance_watermark(product_id, run["newest_comment_id"], failed_ids)
+        return stats
+
+    def _analyze(self, product_id: int, run_id: str, rounds: Iterable[Iterator[Dict[str, Any]]],
+                 stats: Dict[str, Any], sample_total: Dict[str, Any],
+                 on_outcome: Callable[[int, Optional[int], AnalysisOutcome], None],
+                 adaptive: AdaptiveSampler = None) -> List[int]:
+        """
+        Streams the sampled records through the engine and the writer, checkpointing every item.
+        Records come in `rounds`; each round is fully analyzed before the next one is requested,
+        so an adaptive sampler has seen every score of a batch before deciding to draw another.
+        With clustering only the first comment of each near-duplicate cluster is analyzed; its
+        result is fanned out to every member, so each member is still stored (and counted) as
+        its own review. Returns the comment ids whose analysis or save failed.
+        """
+        writer = self.writer or ReviewWriter(self.db, max_queue_size=self.queue_size)
+        clusterer = NearDuplicateClusterer(self.min_similarity) if self.cluster_duplicates else None
+        stats_lock = threading.Lock()
+        failed_ids: List[int] = []
+        # One group per engine request: its cluster id, member records and (once known) outcome
+        groups: List[Dict[str, Any]] = []
+        group_of_cluster: Dict[str, int] = {}
+        done = 0
+
+        def fail(record: Dict[str, Any], error: Exception):
+            # An unsaved review counts as a failure: the run ends partial and stays resumable,
+            # and the watermark is held below it
+            with stats_lock:
+                stats["failed"] += 1
+                if record.get("id") is not None:
+                    failed_ids.append(record["id"])
+            self.db.mark_run_item_failed(run_id, record["item_index"], str(error))
+
+        def on_saved(record: Dict[str, Any]) -> Callable[[bool, Optional[Exception]], None]:
+            def done_saving(committed: bool, error: Optional[Exception]):
+                if committed:
+                    with stats_lock:
+                        stats["saved"] += 1
+                    return
+                self.log(f"   ❌ Failed to save review: {error}")
+                fail(record, error)
+            return done_saving
+
+        def deliver(record: Dict[str, Any], group: Dict[str, Any]):
+            nonlocal done
+            done += 1
+            result = group["outcome"]
+            outcome = AnalysisOutcome(
+                index=record["item_index"], comment=record["body"], data=result.data, error=result.error,
+                attempts=result.attempts if record is group["members"][0] else 0
+            )
+            inc("pipeline_comments", status="analyzed" if outcome.ok else "failed")
+            if outcome.ok:
+                stats["analyzed"] += 1
+                if adaptive is not None:
+                    adaptive.record(outcome.data["estimated_score"])
+                writer.submit(
+                    product_id, outcome.comment, outcome.data, comment_id=record.get("id"),
+                    on_done=on_saved(record), run_item=(run_id, record["item_index"]),
+                    cluster_id=group["cluster_id"]
+                )
+            else:
+                fail(record, outcome.error)
+            if on_outcome is not None:
+                on_outcome(done, sample_total["value"], outcome)
+
+        def representatives(records: Iterator[Dict[str, Any]]) -> Iterator[str]:
+            # Runs on the consuming thread (analyze_stream pulls lazily), like the loop below
+            for record in records:
+                cluster_id = clusterer.assign(record["body"])[0] if clusterer else None
+                position = group_of_cluster.get(cluster_id)
+                if position is None:
+                    if cluster_id is not None:
+                        group_of_cluster[cluster_id] = len(groups)
+                    groups.append({"cluster_id": cluster_id, "members": [record], "outcome": None})
+                    yield record["body"]
+                    continue
+
+                group = groups[position]
+                group["members"].append(record)
+                stats["duplicates"] += 1
+                inc("pipeline_duplicates")
+                if group["outcome"] is not None:
+                    # The representative was answered already: reuse its result right away
+                    deliver(record, group)
+
+        try:
+            for records in rounds:
+                # Outcome indexes restart at 0 in every round
+                offset = len(groups)
+                for result in self.engine.analyze_stream(representatives(records)):
+                    group = groups[offset + result.index]
+                    group["outcome"] = result
+                    for record in group["members"]:
+                        deliver(record, group)
+        finally:
+            # Results must be on disk before anyone reads the product's reviews back
+            if self.writer is None:
+                writer.close()
+            else:
+                writer.flush()
+        if stats["duplicates"]:
+            self.log(f"🧬 Near-duplicates: {clusterer.seen} comments in {clusterer.clusters} clusters "
+                     f"({stats['duplicates']} analyzed through their representative).")
+        return failed_ids
+
+    def _advance_watermark(self, product_id: int, newest_id: Optional[int], failed_ids: List[int]):
+        # Only a completed crawl may move the watermark, otherwise skipped pages would be lost.
+        # It also stays below comments whose analysis or save failed so the next run retries them.
+        if newest_id is None:
+            return
+        if failed_ids:
+            newest_id = min(newest_id, min(failed_ids) - 1)
+        self.db.update_watermark(product_id, newest_id)
+
+    def _crawl_worker(self, product_id: int, watermark: Optional[int], page_queue: "queue.Queue",
+                      crawl_errors: List[Exception]):
+        try:
+            with span("pipeline.crawl"):
+                for page_comments in self.crawler.iter_pages(product_id, stop_at_id=watermark):
+                    page_queue.put(page_comments)
+        except Exception as e:
+            crawl_errors.append(e if isinstance(e, CrawlerError) else CrawlerError(str(e)))
+        finally:
+            page_queue.put(_END)
+
+    def _new_pages(self, product_id: int, page_queue: "queue.Queue", stats: Dict[str, Any],
+                   newest_id: Dict[str, Any], incremental: bool) -> Iterator[List[Dict[str, Any]]]:
+        """Drains the crawler's queue, tracking the newest id and dropping already stored comments."""
+        while True:
+            page_comments = page_queue.get()
+            if page_comments is _END:
+                return
+
+            ids = [c["id"] for c in page_comments if c.get("id") is not None]
+            if ids and (newest_id["value"] is None or max(ids) > newest_id["value"]):
+                newest_id["value"] = max(ids)
+
+            if incremental and ids:
+                known = self.db.get_known_comment_ids(product_id, ids)
+                if known:
+                    stats["known"] += len(known)
+                    page_comments = [c for c in page_comments if c.get("id") not in known]
+            yield page_comments
+
+    def _sampled_records(self, pages: Iterator[List[Dict[str, Any]]], run_id: str, newest_id: Dict[str, Any],
+                         crawl_errors: List[Exception], stats: Dict[str, Any],
+                         sample_total: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Checkpoints the sampled comments and yields them as run item records."""
+        next_index = [0]
+        if self.sampling == "stratified":
+            sampler = StratifiedPageSampler(rate=self.sample_size / self.sample_threshold)
+            for page_comments in pages:
+                chosen = self._checkpoint(run_id, sampler.select(page_comments), next_index)
+                stats["fetched"], stats["sampled"] = sampler.seen, sampler.selected
+                yield from chosen
+            stats["fetched"], stats["sampled"] = sampler.seen, sampler.selected
+            sample_total["value"] = sampler.selected
+            if crawl_errors:
+                raise crawl_errors[0]
+            self.db.update_run(run_id, fetched=sampler.seen, sampled=sampler.selected,
+                               newest_comment_id=newest_id["value"])
+        else:
+            sampler = ReservoirSampler(sample_size=self.sample_size, threshold=self.sample_threshold)
+            for page_comments in pages:
+                sampler.extend(page_comments)
+            if crawl_errors:
+                # Never analyze a sample drawn from a partial crawl
+                raise crawl_errors[0]
+            sampled = sampler.sample()
+            stats["fetched"], stats["sampled"] = sampler.seen, len(sampled)
+            sample_total["value"] = len(sampled)
+            if sampled:
+                self.log(f"📊 Crawler Stats: Fetched {sampler.seen} valid comments. Randomly sampled {len(sampled)} for analysis.")
+            # The whole sample (and the crawl's newest id) is on disk before the first paid LLM call
+            self.db.update_run(run_id, fetched=sampler.seen, sampled=len(sampled), newest_comment_id=newest_id["value"])
+            yield from self._checkpoint(run_id, sampled, next_index)
+
+    def _adaptive_rounds(self, pages: Iterator[List[Dict[str, Any]]], run_id: str, newest_id: Dict[str, Any],
+                         crawl_errors: List[Exception], stats: Dict[str, Any], sample_total: Dict[str, Any],
+                         adaptive: AdaptiveSampler) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Crawls into a reservoir of `sample_size` candidates (the budget), then checkpoints and
+        yields the adaptive sampler's batches one round at a time.
+        """
+        sampler = ReservoirSampler(sample_size=self.sample_size, threshold=self.sample_size)
+        for page_comments in pages:
+            sampler.extend(page_comments)
+        if crawl_errors:
+            raise crawl_errors[0]
+        candidates = sampler.sample()
+        stats["fetched"] = sampler.seen
+        # Upper bound for progress reporting; the run usually stops earlier
+        sample_total["value"] = len(candidates)
+        self.db.update_run(run_id, fetched=sampler.seen, newest_comment_id=newest_id["value"])
+        if candidates:
+            self.log(f"📊 Crawler Stats: Fetched {sampler.seen} valid comments. Sampling adaptively "
+                     f"(up to {len(candidates)}, target CI width {adaptive.target_width} NPS points).")
+
+        # The whole pool is checkpointed up front so that resume() can go on drawing from it
+        pool = self._checkpoint(run_id, candidates, [0], status="candidate")
+        yield from self._adaptive_draws(run_id, pool, sampler.seen, stats, adaptive)
+
+    def _adaptive_draws(self, run_id: str, candidates: List[Dict[str, Any]], population: int,
+                        stats: Dict[str, Any], adaptive: AdaptiveSampler) -> Iterator[List[Dict[str, Any]]]:
+        """Moves the adaptive sampler's batches of checkpointed candidates into the sample, one round at a time."""
+        for batch in adaptive.batches(candidates, population=population):
+            self.db.draw_run_items(run_id, [record["item_index"] for record in batch])
+            stats["sampled"] += len(batch)
+            self.db.update_run(run_id, sampled=stats["sampled"])
+            yield batch
+
+    def _adaptive_sampler(self) -> AdaptiveSampler:
+        return AdaptiveSampler(
+            target_width=self.target_width, min_sample=min(ADAPTIVE_MIN_SAMPLE, self.sample_size),
+            max_sample=self.sample_size, batch_size=ADAPTIVE_BATCH_SIZE, confidence=NPS_CONFIDENCE,
+        )
+
+    def _adaptive_interval(self, adaptive: Optional[AdaptiveSampler], stats: Dict[str, Any]) -> Dict[str, Any]:
+        """The run fields of a finished adaptive sample (interval and stop reason), also added to `stats`."""
+        if adaptive is None or not adaptive.scored:
+            return {}
+        interval = dict(zip(("nps_low", "nps_high"), adaptive.interval()), stop_reason=adaptive.stop_reason)
+        stats.update(interval, sample_nps=adaptive.nps)
+        self.log(f"🎯 Adaptive sampling stopped ({adaptive.stop_reason}) after {adaptive.drawn} of "
+                 f"{stats['fetched']} comments: NPS {adaptive.nps} "
+                 f"[{interval['nps_low']}, {interval['nps_high']}] at {adaptive.confidence:.0%} confidence.")
+        return interval
+
+    def _checkpoint(self, run_id: str, comments: List[Dict[str, Any]], next_index: List[int],
+                    status: str = "pending") -> List[Dict[str, Any]]:
+        """Numbers the comments as run items and stores them as pending (or as adaptive candidates)."""
+        records = []
+        for comment in comments:
+            records.append({"item_index": next_index[0], **comment})
+            next_index[0] += 1
+        self.db.add_run_items(run_id, [(record["item_index"], record.get("id"), record["body"]) for record in records],
+                              status=status)
+        return records
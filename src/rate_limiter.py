@@ -0,0 +1,80 @@
+import time
+import threading
+
+class TokenBucketRateLimiter:
+    """
+    Thread-safe dual token bucket that limits both requests/min and LLM tokens/min.
+    The effective rate adapts: it is halved whenever the provider answers with a 429
+    and recovers step by step after every successful call.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, burst_seconds: float = 10.0,
+                 min_rate_factor: float = 0.1, recovery_step: float = 0.05):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.min_rate_factor = min_rate_factor
+        self.recovery_step = recovery_step
+
+        # Bucket capacities: allow short bursts worth `burst_seconds` of traffic
+        self._request_capacity = max(1.0, requests_per_minute * burst_seconds / 60)
+        self._token_capacity = max(1.0, tokens_per_minute * burst_seconds / 60)
+
+        self._request_bucket = self._request_capacity
+        self._token_bucket = self._token_capacity
+        self._rate_factor = 1.0
+        self._blocked_until = 0.0
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def rate_factor(self) -> float:
+        """Current fraction (0-1] of the configured rate that is being used."""
+        return self._rate_factor
+
+    def _refill(self, now: float):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._request_bucket = min(
+            self._request_capacity,
+            self._request_bucket + elapsed * self.requests_per_minute / 60 * self._rate_factor
+        )
+        self._token_bucket = min(
+            self._token_capacity,
+            self._token_bucket + elapsed * self.tokens_per_minute / 60 * self._rate_factor
+        )
+
+    def acquire(self, tokens: int = 0):
+        """Blocks until one request carrying roughly `tokens` LLM tokens may be sent."""
+        tokens = min(float(tokens), self._token_capacity)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now < self._blocked_until:
+                    wait_time = self._blocked_until - now
+                elif self._request_bucket >= 1 and self._token_bucket >= tokens:
+                    self._request_bucket -= 1
+                    self._token_bucket -= tokens
+                    return
+                else:
+                    request_rate = self.requests_per_minute / 60 * self._rate_factor
+                    token_rate = self.tokens_per_minute / 60 * self._rate_factor
+                    wait_time = max(
+                        (1 - self._request_bucket) / request_rate,
+                        (tokens - self._token_bucket) / token_rate,
+                        0.01
+                    )
+            time.sleep(wait_time)
+
+    def penalize(self, retry_after: float = None):
+        """Called on HTTP 429: halves the effective rate and pauses all callers."""
+        with self._lock:
+            self._rate_factor = max(self.min_rate_factor, self._rate_factor / 2)
+            pause = retry_after if retry_after is not None else 60 / self.requests_per_minute / self._rate_factor
+            self._blocked_until = max(self._blocked_until, time.monotonic() + pause)
+
+    def reward(self):
+        """Called after a successful request: gradually restores the configured rate."""
+        with self._lock:
+            self._rate_factor = min(1.0, self._rate_factor + self.recovery_step)
\ No newline at end of file
@@ -0,0 +1,193 @@
+import math
+import random
+from statistics import NormalDist
+from typing import Any, List, Iterable, Iterator, Optional, Tuple
+
+def nps_confidence_interval(promoters: int, detractors: int, total: int, confidence: float = 0.95,
+                            population: int = None) -> Tuple[float, float]:
+    """
+    Adjusted-Wald confidence interval of an NPS, in NPS points (-100..100): 3/4 is added to the
+    promoter and detractor counts and 3 to the sample size, which keeps the interval honest for
+    small or one-sided samples where the plain Wald interval collapses to a point. `population`
+    is the number of comments the sample was drawn from (without replacement); it applies the
+    finite population correction, so a sample that covers every comment has no uncertainty.
+    """
+    if total <= 0:
+        return (-100.0, 100.0)
+    if population is not None and total >= population:
+        nps = round((promoters - detractors) / total * 100, 2)
+        return (nps, nps)
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    n = total + 3
+    p_promoters = (promoters + 0.75) / n
+    p_detractors = (detractors + 0.75) / n
+    centre = p_promoters - p_detractors
+    variance = (p_promoters + p_detractors - centre ** 2) / n
+    if population is not None and population > 1:
+        variance *= (population - total) / (population - 1)
+    margin = z * math.sqrt(max(0.0, variance))
+    return (round(max(-1.0, centre - margin) * 100, 2), round(min(1.0, centre + margin) * 100, 2))
+
+class ReservoirSampler:
+    """
+    Online version of the crawler's sampling rule that never holds more than
+    `threshold` items in memory, however many comments are streamed through it:
+    - If >= threshold items were seen: a uniform random sample of `sample_size`.
+    - If < threshold items were seen: all of them (in random order).
+
+    Items are buffered until the threshold is reached, the buffer is then reduced to
+    `sample_size` with random.sample, and Algorithm R keeps the sample uniform afterwards.
+    """
+    def __init__(self, sample_size: int = 100, threshold: int = 200, rng: random.Random = None):
+        if sample_size > threshold:
+            raise ValueError("sample_size cannot exceed threshold.")
+        self.sample_size = sample_size
+        self.threshold = threshold
+        self.seen = 0
+        self._rng = rng or random.Random()
+        self._reservoir: List[Any] = []
+
+    def add(self, item: Any):
+        self.seen += 1
+
+        if self.seen < self.threshold:
+            self._reservoir.append(item)
+        elif self.seen == self.threshold:
+            self._reservoir.append(item)
+            self._reservoir = self._rng.sample(self._reservoir, self.sample_size)
+        else:
+            slot = self._rng.randrange(self.seen)
+            if slot < self.sample_size:
+                self._reservoir[slot] = item
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.add(item)
+
+    def sample(self) -> List[Any]:
+        """The final sample, shuffled so that its order carries no page/position bias."""
+        sampled = list(self._reservoir)
+        self._rng.shuffle(sampled)
+        return sampled
+
+class StratifiedPageSampler:
+    """
+    Streaming alternative that decides immediately, page by page, which comments to keep,
+    so analysis can start while later pages are still downloading.
+    Each page (stratum) contributes `rate` of its comments; fractional quotas are carried over
+    between pages so the overall rate is exact. Unlike ReservoirSampler the final sample size
+    is proportional to the population rather than fixed.
+    """
+    def __init__(self, rate: float = 0.5, rng: random.Random = None):
+        if not 0 < rate <= 1:
+            raise ValueError("rate must be in (0, 1].")
+        self.rate = rate
+        self.seen = 0
+        self.selected = 0
+        self._carry = 0.0
+        self._rng = rng or random.Random()
+
+    def select(self, page_items: List[Any]) -> List[Any]:
+        """Returns the randomly chosen subset of one page."""
+        self.seen += len(page_items)
+        quota = len(page_items) * self.rate + self._carry
+        take = min(len(page_items), int(quota))
+        self._carry = quota - take
+
+        chosen = self._rng.sample(page_items, take)
+        self.selected += take
+        return chosen
+
+    def iter_selected(self, pages: Iterable[List[Any]]) -> Iterator[Any]:
+        for page_items in pages:
+            yield from self.select(page_items)
+
+class AdaptiveSampler:
+    """
+    Sequential sampling for NPS: comments are drawn in random batches of `batch_size`, the
+    score of every analyzed one is recorded, and drawing stops as soon as the confidence
+    interval of the running NPS is at most `target_width` points wide (once `min_sample`
+    scores are in), the `max_sample` budget is spent or the population is exhausted.
+    A product whose sentiment is settled early therefore costs far fewer LLM calls than a
+    polarized one. A random prefix of a shuffled population is itself a uniform sample, so
+    stopping early introduces no selection bias.
+    """
+    def __init__(self, target_width: float = 25.0, min_sample: int = 30, max_sample: int = 100,
+                 batch_size: int = 10, confidence: float = 0.95, rng: random.Random = None):
+        if target_width <= 0:
+            raise ValueError("target_width must be positive.")
+        if not 0 < min_sample <= max_sample:
+            raise ValueError("min_sample must be in (0, max_sample].")
+        if batch_size <= 0:
+            raise ValueError("batch_size must be positive.")
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be in (0, 1).")
+        self.target_width = target_width
+        self.min_sample = min_sample
+        self.max_sample = max_sample
+        self.batch_size = batch_size
+        self.confidence = confidence
+        self.drawn = 0
+        self.promoters = self.passives = self.detractors = 0
+        # Size of the population the candidates were drawn from (finite population correction)
+        self.population: Optional[int] = None
+        self.stop_reason: Optional[str] = None
+        self._available: Optional[int] = None
+        self._rng = rng or random.Random()
+
+    @property
+    def scored(self) -> int:
+        return self.promoters + self.passives + self.detractors
+
+    @property
+    def nps(self) -> float:
+        return round((self.promoters - self.detractors) / self.scored * 100, 2) if self.scored else 0.0
+
+    def record(self, score: int):
+        """Adds one analyzed score (1-10) to the running NPS."""
+        if score >= 9:
+            self.promoters += 1
+        elif score >= 7:
+            self.passives += 1
+        else:
+            self.detractors += 1
+
+    def restore(self, drawn: int, scores: Iterable[int]):
+        """Carries over an interrupted run: `drawn` candidates were already drawn and `scores` recorded."""
+        self.drawn = drawn
+        for score in scores:
+            self.record(score)
+
+    def interval(self) -> Tuple[float, float]:
+        return nps_confidence_interval(self.promoters, self.detractors, self.scored, self.confidence,
+                                       population=self.population)
+
+    def done(self) -> bool:
+        """Whether drawing should stop; the reason is kept in `stop_reason`."""
+        low, high = self.interval()
+        if self.population is not None and self.drawn >= self.population:
+            self.stop_reason = "exhausted"
+        elif self.scored >= self.min_sample and high - low <= self.target_width:
+            self.stop_reason = "precision"
+        elif self.drawn >= self.max_sample or (self._available is not None and self.drawn >= self._available):
+            self.stop_reason = "budget"
+        return self.stop_reason is not None
+
+    def batches(self, candidates: List[Any], population: int = None) -> Iterator[List[Any]]:
+        """
+        Shuffles the candidates and yields them batch by batch until `done()`. The check runs
+        before each batch, so the caller must record the previous batch's scores before asking
+        for the next one. `candidates` may be a uniform subsample (e.g. a reservoir) of a larger
+        `population`; by default they are the whole population. After `restore` the candidates
+        are the ones not drawn yet.
+        """
+        order = list(candidates)
+        self._rng.shuffle(order)
+        start = self.drawn
+        self._available = start + len(order)
+        self.population = population if population is not None else self._available
+        while not self.done():
+            size = min(self.batch_size, self.max_sample - self.drawn)
+            batch = order[self.drawn - start:self.drawn - start + size]
+            self.drawn += len(batch)
+            yield batch
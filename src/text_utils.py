@@ -0,0 +1,39 @@
+import re
+import hashlib
+import unicodedata
+
+# Arabic code points that Persian keyboards/OSes commonly produce instead of the Persian ones
+_CHAR_MAP = str.maketrans({
+    "ي": "ی",
+    "ى": "ی",
+    "ك": "ک",
+    "ة": "ه",
+    "ؤ": "و",
+    "إ": "ا",
+    "أ": "ا",
+    "ٱ": "ا",
+    "\u0640": "",   # Tatweel (kashida)
+    "\u200c": "",   # ZWNJ
+    "\u200d": "",   # ZWJ
+    "\u200f": "",   # RLM
+    "\u200e": "",   # LRM
+})
+
+# Arabic diacritics (harakat) carry no sentiment and are used inconsistently
+_DIACRITICS_PATTERN = re.compile(r"[\u064B-\u0652\u0670]")
+_WHITESPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_comment(text: str) -> str:
+    """
+    Canonical form of a Persian comment used for hashing/caching:
+    Unicode NFKC, Arabic -> Persian letters, no diacritics/tatweel/ZWNJ, collapsed whitespace.
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    text = text.translate(_CHAR_MAP)
+    text = _DIACRITICS_PATTERN.sub("", text)
+    text = _WHITESPACE_PATTERN.sub(" ", text)
+    return text.strip().lower()
+
+def content_hash(text: str) -> str:
+    """Stable SHA-256 fingerprint of a comment's normalized text (used for de-duplication)."""
+    return hashlib.sha256(normalize_comment(text).encode("utf-8")).hexdigest()
\ No newline at end of file
@@ -0,0 +1,106 @@
+import re
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+# Fields of one comment's analysis, as the prompts define them
+REVIEW_FIELDS = ("is_satisfied", "reason", "estimated_score")
+
+# Names the model sometimes uses instead of the requested ones
+_ALIASES = {"satisfied": "is_satisfied", "score": "estimated_score", "rating": "estimated_score"}
+_TRUE = {"true", "yes", "y", "1", "satisfied", "بله", "راضی"}
+_FALSE = {"false", "no", "n", "0", "dissatisfied", "unsatisfied", "خیر", "ناراضی"}
+
+_FENCE_PATTERN = re.compile(r"^\s*```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+# \d also matches Persian/Arabic-Indic digits, which int()/float() understand
+_NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+
+def parse_json_response(raw: str) -> Tuple[Any, bool]:
+    """
+    Parses a model reply as JSON, repairing the usual damage locally: Markdown code fences,
+    text before or after the JSON value and trailing commas.
+    Returns (data, repaired); raises ValueError if no JSON value can be recovered.
+    """
+    try:
+        return json.loads(raw), False
+    except ValueError:
+        pass
+
+    text = _FENCE_PATTERN.sub("", raw or "")
+    starts = [position for position in (text.find("{"), text.find("[")) if position >= 0]
+    if not starts:
+        raise ValueError("no JSON object in the reply")
+    decoder = json.JSONDecoder()
+    # raw_decode stops at the end of the first value, so trailing text is ignored
+    for candidate in (text, _TRAILING_COMMA_PATTERN.sub(r"\1", text)):
+        try:
+            data, _ = decoder.raw_decode(candidate, min(starts))
+            return data, True
+        except ValueError:
+            continue
+    raise ValueError("the reply could not be repaired into valid JSON")
+
+def coerce_bool(value: Any) -> Optional[bool]:
+    """True/False from a boolean or a yes/no-like string, otherwise None."""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in _TRUE:
+            return True
+        if text in _FALSE:
+            return False
+    return None
+
+def coerce_score(value: Any) -> Optional[int]:
+    """An integer score clamped to 1..10 from a number or a string such as "8" or "8/10", otherwise None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        match = _NUMBER_PATTERN.search(value)
+        if match is None:
+            return None
+        value = float(match.group())
+    if not isinstance(value, (int, float)) or value != value:  # NaN
+        return None
+    return min(10, max(1, int(round(value))))
+
+def coerce_reason(value: Any) -> Optional[str]:
+    """A non-empty, stripped reason, otherwise None."""
+    if isinstance(value, str) and value.strip():
+        return value.strip()
+    return None
+
+_COERCERS = {"is_satisfied": coerce_bool, "reason": coerce_reason, "estimated_score": coerce_score}
+
+def repair_result(answer: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str], bool]:
+    """
+    Validates one comment's analysis against REVIEW_FIELDS, coercing what can be coerced.
+    Returns (fields, missing, repaired): the valid fields, the names of the fields that are
+    absent or unusable, and whether any value had to be renamed, converted or clamped.
+    """
+    answer = answer if isinstance(answer, dict) else {}
+    fields, missing, repaired = {}, [], False
+    for name in REVIEW_FIELDS:
+        raw = answer.get(name)
+        if raw is None:
+            raw = next((answer[alias] for alias, target in _ALIASES.items()
+                        if target == name and answer.get(alias) is not None), None)
+            repaired = repaired or raw is not None
+        value = _COERCERS[name](raw) if raw is not None else None
+        if value is None:
+            missing.append(name)
+            continue
+        if type(value) is not type(raw) or value != raw:
+            repaired = True
+        fields[name] = value
+    return fields, missing, repaired
+
+def validate_review(ai_data: Dict[str, Any]) -> Dict[str, Any]:
+    """The analysis fields of a review about to be stored; raises ValueError instead of guessing defaults."""
+    fields, missing, _ = repair_result(ai_data)
+    if missing:
+        raise ValueError(f"analysis has no valid {', '.join(missing)}: {ai_data}")
+    return fields
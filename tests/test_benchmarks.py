@@ -0,0 +1,20 @@
+import pytest
+
+from benchmarks.run import main, run_scenario
+from benchmarks.fake_servers import FakeDigikalaServer, FaultProfile
+
+pytest.importorskip("requests")
+
+
+def test_crawl_survives_injected_rate_limits():
+    faults = FaultProfile(latency_ms=1, jitter_ms=0, rate_limit_rate=0.3, seed=3)
+    with FakeDigikalaServer(comments_per_product=50, faults=faults) as digikala:
+        result = run_scenario("crawl", 50, {"digikala_url": digikala.url})
+        assert digikala.failures > 0
+    assert "error" not in result
+    assert result["items"] == 50
+
+
+def test_documented_rate_limit_command_exits_cleanly():
+    assert main(["--scenarios", "crawl", "--sizes", "100", "--rate-limit-rate", "0.05",
+                 "--digikala-latency-ms", "1", "--in-process"]) == 0
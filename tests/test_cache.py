@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+import src.cache
+from src.cache import AnalysisCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1_000.0)
+    monkeypatch.setattr(src.cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def _result(score):
+    return {"is_satisfied": score >= 7, "reason": "r", "estimated_score": score}
+
+
+def test_memory_tier_keeps_the_most_recently_used_entries(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "reviews.db"), max_memory_entries=2)
+    cache.set("a", _result(9))
+    cache.set("b", _result(5))
+    assert cache.get("a") == _result(9)
+    cache.set("c", _result(7))
+
+    assert cache.get("a") == _result(9) and cache.get("c") == _result(7)
+    assert cache.memory_hits == 3 and cache.disk_hits == 0
+    # "b" was the least recently used: it is only left on disk
+    assert cache.get("b") == _result(5)
+    assert cache.disk_hits == 1
+    cache.close()
+
+
+def test_evict_trims_the_table_by_last_access(tmp_path, clock):
+    path = str(tmp_path / "reviews.db")
+    cache = AnalysisCache(path, max_memory_entries=1, max_entries=2)
+    for key, score in (("a", 9), ("b", 5), ("c", 7)):
+        clock.now += 1
+        cache.set(key, _result(score))
+    clock.now += 1
+    # A disk hit (not written yet) makes "a" recent again; evict must take it into account
+    assert cache.get("a") == _result(9)
+    assert cache.evict() == 1
+    cache.close()
+
+    reopened = AnalysisCache(path, max_memory_entries=1, max_entries=2)
+    assert reopened.get("b") is None
+    assert reopened.get("a") == _result(9) and reopened.get("c") == _result(7)
+    reopened.close()
+
+
+def test_expired_entries_miss_and_are_evicted(tmp_path, clock):
+    cache = AnalysisCache(str(tmp_path / "reviews.db"), max_memory_entries=1, ttl_seconds=60)
+    cache.set("old", _result(9))
+    clock.now += 30
+    cache.set("new", _result(5))
+    clock.now += 45
+
+    assert cache.get("old") is None
+    assert cache.get("new") == _result(5)
+    assert cache.evict() == 1
+    cache.close()
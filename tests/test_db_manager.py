@@ -0,0 +1,53 @@
+from src.db_manager import DatabaseManager, ReviewWriter
+
+
+def _analysis(score, satisfied=True):
+    return {"is_satisfied": satisfied, "reason": "ok", "estimated_score": score}
+
+
+def test_writer_rejects_only_the_incomplete_review(tmp_path):
+    db = DatabaseManager(str(tmp_path / "reviews.db"))
+    writer = ReviewWriter(db)
+    results = {}
+
+    def on_done(key):
+        return lambda committed, error: results.__setitem__(key, (committed, error))
+
+    writer.submit(1, "first", _analysis(9), comment_id=1, on_done=on_done("first"))
+    writer.submit(1, "broken", {"reason": "no score"}, comment_id=2, on_done=on_done("broken"))
+    writer.submit(1, "third", _analysis(3, satisfied=False), comment_id=3, on_done=on_done("third"))
+    writer.close()
+
+    assert results["first"] == (True, None)
+    assert results["third"] == (True, None)
+    assert results["broken"][0] is False
+    assert "incomplete review" in str(results["broken"][1])
+    assert (writer.written, writer.failed) == (2, 1)
+    assert db.get_product_summary(1)["total"] == 2
+
+
+def _assert_rollups_match_a_scan(db, product_ids):
+    assert db.verify_product_stats() == []
+    for product_id in product_ids:
+        assert db.get_product_summary(product_id) == db.scan_product_summary(product_id)
+
+
+def test_rollups_match_a_full_scan_after_inserts_and_dedupe(tmp_path):
+    db = DatabaseManager(str(tmp_path / "reviews.db"))
+    db.insert_review(1, "عالی", _analysis(10), comment_id=1)
+    db.insert_reviews_bulk([(1, f"نظر {score}", _analysis(score, score >= 7), 10 + score) for score in range(1, 11)]
+                           + [(2, "بد", _analysis(2, False), 50)])
+    # Duplicates are skipped and must not be counted
+    db.insert_review(1, "عالی", _analysis(10), comment_id=1)
+    with db._get_connection() as conn:
+        # A legacy copy left unfingerprinted by the identity migration
+        conn.execute("INSERT INTO product_reviews (product_id, raw_comment, is_satisfied, reason, estimated_score) "
+                     "VALUES (2, 'بد', 0, 'r', 2)")
+    # Without a Digikala id the text is the identity, so this row makes the legacy copy a duplicate
+    db.insert_review(2, "بد", _analysis(2, False))
+    _assert_rollups_match_a_scan(db, [1, 2])
+    assert (db.get_product_summary(1)["total"], db.get_product_summary(2)["total"]) == (11, 3)
+
+    assert len(db.dedupe_reviews()) == 1
+    _assert_rollups_match_a_scan(db, [1, 2])
+    assert db.get_product_summary(2)["total"] == 2
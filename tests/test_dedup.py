@@ -0,0 +1,17 @@
+from src.dedup import NearDuplicateClusterer, canonical_text
+from src.lexicon import LexiconClassifier
+
+
+def test_stretched_letters_collapse_but_numbers_do_not():
+    assert canonical_text("عاااالی بود!!") == canonical_text("عالی بود")
+    assert "1000" in canonical_text("بعد از 1000 ساعت خراب شد")
+    assert "1000" in LexiconClassifier._tokenize("بعد از 1000 ساعت خراب شد")
+
+
+def test_comments_differing_only_in_a_number_are_not_clustered():
+    clusterer = NearDuplicateClusterer()
+    first, _ = clusterer.assign("بعد از 1000 ساعت خراب شد")
+    second, _ = clusterer.assign("بعد از 10 ساعت خراب شد")
+    assert first != second
+    third, _ = clusterer.assign("بعد از 1000 ساعت خراب شد!!")
+    assert third == first
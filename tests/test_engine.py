@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.engine import AnalysisEngine
+from src.exceptions import LLMAnalysisError, LLMRateLimitError, LLMTransientError
+
+
+class RecordingLimiter:
+    def __init__(self):
+        self.acquired, self.penalties, self.rewards = 0, [], 0
+
+    def acquire(self, tokens):
+        self.acquired += 1
+
+    def penalize(self, retry_after=None):
+        self.penalties.append(retry_after)
+
+    def reward(self):
+        self.rewards += 1
+
+
+def _engine(limiter, max_retries=3):
+    return AnalysisEngine(SimpleNamespace(), max_workers=1, rate_limiter=limiter, max_retries=max_retries,
+                          base_backoff=0, max_backoff=0, batch_mode=False)
+
+
+def _failing(*errors, result="ok"):
+    errors = list(errors)
+
+    def call():
+        if errors:
+            raise errors.pop(0)
+        return result
+    return call
+
+
+def test_transient_and_throttled_failures_are_retried():
+    limiter = RecordingLimiter()
+    call = _failing(LLMTransientError("timeout"), LLMRateLimitError("429", retry_after=2.5))
+    assert _engine(limiter)._call_with_retry(call, 10) == ("ok", None, 3)
+    assert limiter.acquired == 3
+    assert limiter.penalties == [2.5]
+    assert limiter.rewards == 1
+
+
+def test_non_retryable_error_is_returned_at_once():
+    limiter = RecordingLimiter()
+    error = LLMAnalysisError("invalid JSON")
+    assert _engine(limiter)._call_with_retry(_failing(error), 10) == (None, error, 1)
+    assert limiter.acquired == 1
+    assert (limiter.penalties, limiter.rewards) == ([], 0)
+
+
+def test_retries_stop_after_max_retries():
+    limiter = RecordingLimiter()
+    errors = [LLMTransientError(f"5xx #{attempt}") for attempt in range(5)]
+    result, error, attempts = _engine(limiter, max_retries=2)._call_with_retry(_failing(*errors), 10)
+    assert (result, error, attempts) == (None, errors[2], 3)
+    assert limiter.acquired == 3
+
+
+def test_gated_request_does_not_leave_a_transient_error_to_be_retried_again():
+    engine = _engine(RecordingLimiter(), max_retries=1)
+    with pytest.raises(LLMAnalysisError) as raised:
+        engine._gated_request(_failing(*[LLMTransientError("timeout")] * 2), 10)
+    assert not isinstance(raised.value, LLMTransientError)
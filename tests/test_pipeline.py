@@ -0,0 +1,84 @@
+import pytest
+
+from src.db_manager import DatabaseManager
+from src.engine import AnalysisOutcome
+from src.pipeline import StreamingPipeline
+
+
+class FakeCrawler:
+    def __init__(self, count: int):
+        self.count = count
+
+    def iter_pages(self, product_id, stop_at_id=None):
+        for start in range(0, self.count, 10):
+            yield [{"id": i + 1, "body": f"comment {i + 1}"}
+                   for i in range(start, min(self.count, start + 10)) if stop_at_id is None or i + 1 > stop_at_id]
+
+
+class FakeEngine:
+    """
+    Scores every comment 9 (or `score(comment)`); `incomplete` bodies come back without a score
+    and the stream dies with RuntimeError on call number `crash_at`.
+    """
+    def __init__(self, score=lambda comment: 9, incomplete=(), crash_at=None):
+        self.score = score
+        self.incomplete = set(incomplete)
+        self.crash_at = crash_at
+        self.calls = 0
+
+    def analyze_stream(self, comments):
+        for index, comment in enumerate(comments):
+            if self.calls + 1 == self.crash_at:
+                raise RuntimeError("interrupted")
+            self.calls += 1
+            score = self.score(comment)
+            data = {"is_satisfied": score >= 7, "reason": "r", "estimated_score": score}
+            if comment in self.incomplete:
+                del data["estimated_score"]
+            yield AnalysisOutcome(index, comment, data=data, attempts=1)
+
+
+def _pipeline(db, engine, count=20, **kwargs):
+    return StreamingPipeline(FakeCrawler(count), engine, db, log=lambda message: None,
+                             cluster_duplicates=False, **kwargs)
+
+
+def test_failed_save_marks_the_run_partial_and_holds_the_watermark(tmp_path):
+    db = DatabaseManager(str(tmp_path / "reviews.db"))
+    stats = _pipeline(db, FakeEngine(incomplete={"comment 8"}), sampling="reservoir").run(7, incremental=True)
+
+    assert (stats["saved"], stats["failed"]) == (19, 1)
+    assert db.get_run(stats["run_id"])["status"] == "partial"
+    assert [item["comment_id"] for item in db.get_unfinished_run_items(stats["run_id"])] == [8]
+    assert db.get_watermark(7) == 7
+
+
+def _polarized(comment):
+    return 10 if int(comment.split()[1]) % 2 else 1
+
+
+@pytest.mark.parametrize("score, stop_reason", [(lambda comment: 10, "precision"), (_polarized, "budget")])
+def test_interrupted_adaptive_run_resumes_its_rounds(tmp_path, score, stop_reason):
+    db = DatabaseManager(str(tmp_path / "reviews.db"))
+    engine = FakeEngine(score, crash_at=16)
+    pipeline = _pipeline(db, engine, count=300, sampling="adaptive", target_width=10)
+    with pytest.raises(RuntimeError):
+        pipeline.run(7, incremental=True)
+    run_id = db.find_resumable_run(7, statuses=("running",))
+    assert run_id is not None
+    assert db.get_watermark(7) is None
+
+    engine.crash_at = None
+    stats = pipeline.resume(run_id)
+
+    run = db.get_run(run_id)
+    summary = db.get_product_summary(7)
+    assert run["status"] == "completed"
+    assert run["stop_reason"] == stats["stop_reason"] == stop_reason
+    assert run["sampled"] == engine.calls == summary["total"] == run["items"]["analyzed"]
+    assert (summary["nps_low"], summary["nps_high"]) == (run["nps_low"], run["nps_high"])
+    assert db.get_watermark(7) == 300
+
+    uninterrupted = _pipeline(DatabaseManager(str(tmp_path / "fresh.db")), FakeEngine(score), count=300,
+                              sampling="adaptive", target_width=10).run(7)
+    assert (uninterrupted["sampled"], uninterrupted["stop_reason"]) == (run["sampled"], stop_reason)
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from src.sampling import AdaptiveSampler, nps_confidence_interval
+
+
+def test_interval_without_scores_spans_the_whole_scale():
+    assert nps_confidence_interval(0, 0, 0) == (-100.0, 100.0)
+
+
+def test_interval_contains_the_nps_and_stays_in_range():
+    low, high = nps_confidence_interval(30, 10, 50)
+    assert low < 40 < high
+    assert nps_confidence_interval(5, 0, 5)[1] <= 100
+    assert nps_confidence_interval(0, 5, 5)[0] >= -100
+
+
+def test_interval_narrows_with_the_sample_and_the_population_correction():
+    small_low, small_high = nps_confidence_interval(30, 10, 50)
+    large_low, large_high = nps_confidence_interval(300, 100, 500)
+    assert large_high - large_low < small_high - small_low
+    corrected_low, corrected_high = nps_confidence_interval(30, 10, 50, population=60)
+    assert corrected_high - corrected_low < small_high - small_low
+    # The whole population was analyzed: the NPS is exact
+    assert nps_confidence_interval(30, 10, 50, population=50) == (40.0, 40.0)
+
+
+def test_interval_widens_with_the_confidence():
+    low_90, high_90 = nps_confidence_interval(30, 10, 50, confidence=0.90)
+    low_99, high_99 = nps_confidence_interval(30, 10, 50, confidence=0.99)
+    assert high_99 - low_99 > high_90 - low_90
+
+
+def _run(sampler, candidates, score, population=None):
+    for batch in sampler.batches(candidates, population=population):
+        for candidate in batch:
+            sampler.record(score(candidate))
+    return sampler
+
+
+def test_settled_sentiment_stops_on_precision_after_min_sample():
+    sampler = _run(AdaptiveSampler(target_width=30, min_sample=20, max_sample=100, batch_size=10,
+                                   rng=random.Random(1)), range(1000), lambda candidate: 10)
+    assert sampler.stop_reason == "precision"
+    assert 20 <= sampler.drawn < 100
+    assert sampler.scored == sampler.drawn
+
+
+def test_polarized_sentiment_stops_on_budget():
+    sampler = _run(AdaptiveSampler(target_width=5, min_sample=20, max_sample=50, batch_size=10,
+                                   rng=random.Random(1)), range(1000), lambda candidate: 10 if candidate % 2 else 1)
+    assert (sampler.stop_reason, sampler.drawn) == ("budget", 50)
+
+
+def test_small_population_stops_when_exhausted():
+    sampler = _run(AdaptiveSampler(target_width=5, min_sample=5, max_sample=100, batch_size=10),
+                   range(25), lambda candidate: 10 if candidate % 2 else 1)
+    assert (sampler.stop_reason, sampler.drawn) == ("exhausted", 25)
+    assert sampler.interval() == (sampler.nps, sampler.nps)
+
+
+def test_a_reservoir_of_a_larger_population_stops_on_budget():
+    sampler = _run(AdaptiveSampler(target_width=5, min_sample=5, max_sample=100, batch_size=10),
+                   range(30), lambda candidate: 10 if candidate % 2 else 1, population=500)
+    assert (sampler.stop_reason, sampler.drawn) == ("budget", 30)
+
+
+def test_restored_sampler_only_draws_the_remaining_candidates():
+    sampler = AdaptiveSampler(target_width=5, min_sample=5, max_sample=40, batch_size=10)
+    sampler.restore(20, [10, 1] * 10)
+    drawn = [candidate for batch in sampler.batches(range(100, 130), population=500) for candidate in batch]
+    assert len(drawn) == 20 and set(drawn) <= set(range(100, 130))
+    assert (sampler.stop_reason, sampler.drawn) == ("budget", 40)
+
+
+@pytest.mark.parametrize("arguments", [
+    {"target_width": 0}, {"min_sample": 0}, {"min_sample": 200, "max_sample": 100},
+    {"batch_size": 0}, {"confidence": 1.0},
+])
+def test_invalid_settings_are_rejected(arguments):
+    with pytest.raises(ValueError):
+        AdaptiveSampler(**arguments)
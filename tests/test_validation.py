@@ -0,0 +1,42 @@
+import pytest
+
+from src.validation import parse_json_response, repair_result, validate_review
+
+
+def test_valid_result_is_kept_as_is():
+    answer = {"is_satisfied": True, "reason": "کیفیت خوب", "estimated_score": 9}
+    assert repair_result(answer) == (answer, [], False)
+
+
+def test_aliases_and_strings_are_coerced():
+    fields, missing, repaired = repair_result({"satisfied": "بله", "reason": "  ok ", "score": "8/10"})
+    assert fields == {"is_satisfied": True, "reason": "ok", "estimated_score": 8}
+    assert (missing, repaired) == ([], True)
+
+
+def test_scores_are_rounded_and_clamped():
+    assert repair_result({"is_satisfied": 0, "reason": "r", "estimated_score": 14})[0]["estimated_score"] == 10
+    assert repair_result({"is_satisfied": 0, "reason": "r", "estimated_score": 0.2})[0]["estimated_score"] == 1
+    assert repair_result({"is_satisfied": 0, "reason": "r", "estimated_score": "۷"})[0]["estimated_score"] == 7
+
+
+def test_unusable_fields_are_reported_missing():
+    fields, missing, _ = repair_result({"is_satisfied": "maybe", "reason": "   ", "estimated_score": True})
+    assert fields == {}
+    assert missing == ["is_satisfied", "reason", "estimated_score"]
+    assert repair_result("not a dict")[1] == ["is_satisfied", "reason", "estimated_score"]
+
+
+def test_validate_review_refuses_to_guess():
+    assert validate_review({"is_satisfied": "no", "reason": "r", "estimated_score": 3}) == \
+        {"is_satisfied": False, "reason": "r", "estimated_score": 3}
+    with pytest.raises(ValueError, match="estimated_score"):
+        validate_review({"is_satisfied": True, "reason": "r"})
+
+
+def test_json_replies_are_repaired_locally():
+    assert parse_json_response('{"a": 1}') == ({"a": 1}, False)
+    assert parse_json_response('```json\n{"a": [1, 2,],}\n```') == ({"a": [1, 2]}, True)
+    assert parse_json_response('Here you go: [{"a": 1}] hope it helps') == ([{"a": 1}], True)
+    with pytest.raises(ValueError):
+        parse_json_response("no json here")